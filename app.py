@@ -12,6 +12,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 from src.rag_pipeline import PipelineRAG
+from src.referentiel import NIVEAUX_ACTUELS, OBJECTIFS_PAR_DOMAINE
 
 
 # Configuration de la page
@@ -157,99 +158,9 @@ with st.sidebar:
     st.subheader("Academique")
     niveau_actuel = st.selectbox(
         "Niveau actuel",
-        ["Terminale Generale", "Terminale Technologique", "Terminale Professionnelle",
-         "L1", "L2", "L3", "M1", "M2", "BTS", "BUT / DUT", "Prepa"],
+        NIVEAUX_ACTUELS,
     )
-    # Liste des objectifs professionnels par domaine — extraite des débouchés réels de la base Parcoursup
-    OBJECTIFS_PAR_DOMAINE = {
-        "Arts, Culture et Création": [
-            "Conservateur de musée", "Critique d'art", "Guide conférencier",
-            "Réalisateur", "Artiste plasticien", "Designer",
-            "Critique de cinéma", "Metteur en scène", "Directeur artistique",
-            "Monteur vidéo", "Musicologue", "Historien de l'art",
-            "Chargé de projet culturel", "Médiateur culturel", "Graphiste",
-        ],
-        "Communication et Médias": [
-            "Chargé de communication", "Community manager", "Journaliste",
-            "Webdesigner", "Designer graphique", "Attaché de presse",
-            "Webmaster", "Chargé de communication digitale",
-            "Consultant en communication", "Développeur web",
-            "Bibliothécaire", "Rédacteur web", "Documentaliste",
-        ],
-        "Droit et Sciences Juridiques": [
-            "Avocat", "Notaire", "Juriste d'entreprise", "Juriste",
-            "Conseiller juridique", "Assistant juridique", "Magistrat",
-            "Fonctionnaire", "Politologue", "Juriste en droit européen",
-            "Juriste en propriété intellectuelle", "Responsable juridique",
-        ],
-        "Économie et Gestion": [
-            "Gestionnaire de projet", "Consultant en gestion", "Économiste",
-            "Responsable marketing", "Entrepreneur", "Consultant en management",
-            "Analyste financier", "Assistant de direction",
-            "Responsable logistique", "Contrôleur de gestion",
-            "Responsable administratif", "Chef de projet",
-            "Expert-comptable", "Responsable e-commerce",
-        ],
-        "Éducation et Sciences Sociales": [
-            "Formateur", "Enseignant", "Conseiller pédagogique",
-            "Éducateur spécialisé", "Professeur des écoles", "Éducateur",
-            "Animateur socioculturel", "Coordinateur pédagogique",
-            "Conseiller d'orientation", "Conseiller en insertion professionnelle",
-        ],
-        "Géographie et Environnement": [
-            "Urbaniste", "Géographe", "Chargé d'études environnementales",
-            "Consultant en environnement", "Chargé de mission environnement",
-            "Technicien en environnement", "Consultant en développement durable",
-            "Conseiller en aménagement", "Écologue", "Biologiste",
-            "Chargé de mission en aménagement", "Paysagiste",
-        ],
-        "Informatique et Technologies": [
-            "Développeur", "Ingénieur en informatique", "Data analyst",
-            "Développeur web", "Responsable qualité", "Chef de produit",
-            "Technicien de laboratoire", "Administrateur systèmes",
-            "Ingénieur télécommunications", "Consultant en cybersécurité",
-            "Data scientist", "Chef de projet informatique",
-            "Consultant en systèmes d'information", "Développeur logiciel",
-        ],
-        "Ingénierie": [
-            "Ingénieur en mécanique", "Responsable qualité",
-            "Technicien de production", "Responsable de production",
-            "Technicien de maintenance", "Chef de projet",
-            "Ingénieur civil", "Conducteur de travaux",
-            "Ingénieur en génie civil", "Consultant en ingénierie",
-            "Ingénieur en électronique", "Ingénieur en systèmes",
-        ],
-        "Langues et Communication": [
-            "Traducteur", "Chargé de communication", "Professeur de langues",
-            "Interprète", "Enseignant de langues", "Responsable export",
-            "Diplomate", "Chargé de relations internationales",
-            "Éditeur", "Journaliste", "Chercheur en linguistique",
-            "Chargé de communication internationale",
-        ],
-        "Santé et Médecine": [
-            "Médecin", "Pharmacien", "Infirmier", "Chercheur en santé",
-            "Technicien de laboratoire", "Consultant en santé",
-            "Kinésithérapeute", "Chercheur en biologie",
-            "Orthoptiste", "Ergothérapeute", "Gestionnaire de santé",
-        ],
-        "Sciences": [
-            "Technicien de laboratoire", "Chercheur", "Ingénieur",
-            "Ingénieur chimiste", "Analyste de données",
-            "Chercheur en physique", "Professeur de mathématiques",
-            "Statisticien", "Chercheur en chimie", "Chimiste",
-            "Chercheur en biologie", "Chercheur en mathématiques",
-            "Ingénieur en chimie", "Économiste",
-        ],
-        "Sciences Humaines et Sociales": [
-            "Éditeur", "Historien", "Professeur de lettres", "Journaliste",
-            "Archiviste", "Enseignant", "Psychologue",
-            "Professeur d'histoire", "Philosophe", "Chargé d'études",
-            "Sociologue", "Écrivain", "Conseiller d'orientation",
-            "Consultant en ressources humaines",
-        ],
-    }
-
-    # Construire la liste plate triee
+    # Objectifs par domaine (src/referentiel.py) : construire la liste plate triee
     tous_objectifs = []
     for domaine, objectifs in OBJECTIFS_PAR_DOMAINE.items():
         for obj in objectifs:
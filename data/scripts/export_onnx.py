@@ -0,0 +1,163 @@
+# export_onnx.py
+# Exporte le modele d'embedding (sentence-transformers) en ONNX pour EMBEDDING_BACKEND=onnx,
+# puis verifie que les vecteurs restent ceux de PyTorch et compare les latences.
+#
+# Usage :
+#   python data/scripts/export_onnx.py          # model.onnx (fp32)
+#   python data/scripts/export_onnx.py --int8   # + model_int8.onnx (quantification dynamique)
+#
+# Necessite (une seule fois, pour l'export) : torch, sentence-transformers, onnx, onnxruntime.
+
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from sentence_transformers import SentenceTransformer
+
+load_dotenv()
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from src.data_loader import charger_formations
+from src.embeddings_onnx import CONFIG_ONNX, FICHIERS_ONNX, OnnxEmbeddings, dossier_onnx
+from src.vectorstore import EMBEDDING_MODEL
+
+# Cosinus minimal entre vecteurs ONNX et PyTorch pour garder l'index existant
+TOLERANCE = {"onnx": 0.9999, "onnx-int8": 0.98}
+NB_TEXTES = 200
+NB_MESURES = 50
+
+
+class _Encodeur(torch.nn.Module):
+    """Transformer seul : le pooling et la normalisation sont faits par OnnxEmbeddings."""
+
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        sortie = self.transformer(
+            input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+        )
+        return sortie[0]
+
+
+def exporter(modele: SentenceTransformer, dossier: Path):
+    dossier.mkdir(parents=True, exist_ok=True)
+    tokenizer = modele.tokenizer
+    tokenizer.save_pretrained(str(dossier))
+
+    mode = modele[1].get_pooling_mode_str() if len(modele) > 1 else "?"
+    if mode != "mean":
+        print(f"  ATTENTION: pooling '{mode}' (OnnxEmbeddings suppose un mean pooling)")
+
+    exemple = tokenizer(["Master informatique a Lyon"], return_tensors="pt")
+    token_type_ids = exemple.get("token_type_ids", torch.zeros_like(exemple["input_ids"]))
+    axes = {0: "batch", 1: "tokens"}
+    torch.onnx.export(
+        _Encodeur(modele[0].auto_model).eval(),
+        (exemple["input_ids"], exemple["attention_mask"], token_type_ids),
+        str(dossier / FICHIERS_ONNX["onnx"]),
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes,
+                      "token_type_ids": axes, "last_hidden_state": axes},
+        opset_version=17,
+    )
+
+    config = {
+        "model_name": EMBEDDING_MODEL,
+        "max_length": modele.max_seq_length,
+        "dimension": modele.get_sentence_embedding_dimension(),
+        "pad_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+    }
+    with open(dossier / CONFIG_ONNX, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+
+def quantifier(dossier: Path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        str(dossier / FICHIERS_ONNX["onnx"]),
+        str(dossier / FICHIERS_ONNX["onnx-int8"]),
+        weight_type=QuantType.QInt8,
+    )
+
+
+def textes_de_test() -> list[str]:
+    """Noms de formations du catalogue + requetes typiques de l'interface."""
+    textes = [f.get("nom", "") for f in charger_formations()[:NB_TEXTES] if f.get("nom")]
+    textes += [
+        "Ingenieur en intelligence artificielle",
+        "Master Informatique Paris",
+        "BTS commerce international alternance",
+        "Licence de psychologie a Lyon",
+    ]
+    return textes
+
+
+def latence_ms(encoder, requetes: list[str]) -> float:
+    """Latence mediane d'encodage d'une requete seule (comme /rechercher-formations)."""
+    encoder(requetes[0])  # echauffement
+    mesures = []
+    for q in requetes[:NB_MESURES]:
+        debut = time.perf_counter()
+        encoder(q)
+        mesures.append(1000 * (time.perf_counter() - debut))
+    return statistics.median(mesures)
+
+
+def main():
+    int8 = "--int8" in sys.argv
+    dossier = dossier_onnx(EMBEDDING_MODEL)
+
+    print(f"Export ONNX de {EMBEDDING_MODEL}")
+    debut = time.perf_counter()
+    modele = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    chargement_torch = time.perf_counter() - debut
+
+    exporter(modele, dossier)
+    print(f"  [OK] {dossier / FICHIERS_ONNX['onnx']}")
+    variantes = ["onnx"]
+    if int8:
+        quantifier(dossier)
+        print(f"  [OK] {dossier / FICHIERS_ONNX['onnx-int8']}")
+        variantes.append("onnx-int8")
+
+    textes = textes_de_test()
+    reference = modele.encode(textes, normalize_embeddings=True)
+    torch_ms = latence_ms(lambda q: modele.encode([q], normalize_embeddings=True), textes)
+
+    print(f"\n  {'moteur':<10} {'cos min':>8} {'cos moy':>8} {'ms/requete':>11} {'demarrage s':>12} {'fichier Mo':>11}")
+    print(f"  {'torch':<10} {1.0:>8.4f} {1.0:>8.4f} {torch_ms:>11.2f} {chargement_torch:>12.2f} {'-':>11}")
+    conforme = True
+    for variante in variantes:
+        debut = time.perf_counter()
+        onnx = OnnxEmbeddings(EMBEDDING_MODEL, variante=variante)
+        chargement = time.perf_counter() - debut
+
+        vecteurs = np.asarray(onnx.embed_documents(textes), dtype=np.float32)
+        cosinus = (vecteurs * reference).sum(axis=1)
+        ms = latence_ms(onnx.embed_query, textes)
+        taille = os.path.getsize(dossier / FICHIERS_ONNX[variante]) / 1e6
+        print(f"  {variante:<10} {cosinus.min():>8.4f} {cosinus.mean():>8.4f} {ms:>11.2f} {chargement:>12.2f} {taille:>11.1f}")
+        if cosinus.min() < TOLERANCE[variante]:
+            conforme = False
+            print(f"  ATTENTION: {variante} s'ecarte de PyTorch (cos min < {TOLERANCE[variante]}) : "
+                  "reconstruire l'index avec ce moteur ou garder EMBEDDING_BACKEND=torch")
+
+    if conforme:
+        print("\n  Vecteurs conformes : l'index existant reste valide.")
+        print(f"  Activer avec EMBEDDING_BACKEND={variantes[-1]} dans .env")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,32 @@
 # extract_metiers.py
 # Extrait tous les metiers uniques des debouches des formations
-import json
-from collections import Counter
+# (taxonomie normalisee de src/metiers.py : memes cles que l'index metier -> formations)
+#
+# Usage :
+#   python data/scripts/extract_metiers.py                     # top 100 des metiers
+#   python data/scripts/extract_metiers.py "data scientist"    # resolution d'un objectif libre
+import sys
+from pathlib import Path
 
-with open("/Users/ottosmac/orientation-rag/data/processed/formations_enriched.json", "r", encoding="utf-8") as f:
-    formations = json.load(f)
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
 
-metiers = []
-for f in formations:
-    debouches = f.get("debouches_metiers", [])
-    if debouches:
-        metiers.extend(debouches)
+from src.data_loader import charger_formations
+from src.metiers import TaxonomieMetiers
 
-# Compter et trier
-compteur = Counter(metiers)
-metiers_tries = sorted(compteur.items(), key=lambda x: -x[1])
+formations = charger_formations()
+taxonomie = TaxonomieMetiers.construire(formations)
+
+# Compter et trier (nombre de formations par metier normalise)
+metiers_tries = sorted(taxonomie.metiers.items(), key=lambda x: -len(taxonomie.formations(x[0])))
 
 print(f"Total : {len(metiers_tries)} metiers uniques\n")
-for metier, count in metiers_tries[:100]:
-    print(f"  {metier} ({count})")
+for mid, metier in metiers_tries[:100]:
+    print(f"  {metier['nom']} ({len(taxonomie.formations(mid))}) [{mid}]")
+
+if len(sys.argv) > 1:
+    objectif = " ".join(sys.argv[1:])
+    print(f"\nObjectif '{objectif}' :")
+    for mid, similarite in taxonomie.resoudre(objectif):
+        print(f"  {taxonomie.metiers[mid]['nom']} (similarite {similarite}, "
+              f"{len(taxonomie.formations(mid))} formations)")
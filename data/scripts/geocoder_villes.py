@@ -0,0 +1,80 @@
+# geocoder_villes.py
+# Complete la table des coordonnees des villes du catalogue (villes_coordonnees.json)
+# a partir de l'API Geo officielle (geo.api.gouv.fr).
+# La table est versionnee avec le projet : le pipeline n'appelle jamais l'API.
+#
+# Usage :
+#   python data/scripts/geocoder_villes.py            # ajoute les villes manquantes
+#   python data/scripts/geocoder_villes.py --refresh  # regeocode toutes les villes
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from src.data_loader import charger_formations
+from src.geo import ACADEMIES, FICHIER_COORDONNEES, normaliser_ville
+
+API_URL = "https://geo.api.gouv.fr/communes"
+
+
+def geocoder(nom: str, session: requests.Session) -> dict | None:
+    """Centre de la commune la plus peuplee portant ce nom, ou None."""
+    params = {
+        "nom": nom.replace("-", " "),
+        "fields": "nom,centre,population",
+        "boost": "population",
+        "limit": 1,
+    }
+    try:
+        response = session.get(API_URL, params=params, timeout=10)
+        response.raise_for_status()
+        resultats = response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"  Erreur API pour {nom}: {e}")
+        return None
+    if not resultats or not resultats[0].get("centre"):
+        return None
+    lon, lat = resultats[0]["centre"]["coordinates"]
+    return {"lat": round(lat, 3), "lon": round(lon, 3)}
+
+
+def main():
+    refresh = "--refresh" in sys.argv
+
+    coordonnees = {}
+    if FICHIER_COORDONNEES.exists() and not refresh:
+        with open(FICHIER_COORDONNEES, "r", encoding="utf-8") as f:
+            coordonnees = json.load(f)
+
+    villes = {normaliser_ville(f.get("ville", "")) for f in charger_formations()}
+    villes |= {normaliser_ville(v) for liste in ACADEMIES.values() for v in liste}
+    a_geocoder = sorted(v for v in villes if v and v not in coordonnees)
+    print(f"{len(villes)} villes, {len(a_geocoder)} a geocoder")
+
+    session = requests.Session()
+    introuvables = []
+    for nom in a_geocoder:
+        point = geocoder(nom, session)
+        if point is None:
+            introuvables.append(nom)
+            continue
+        coordonnees[nom] = point
+        time.sleep(0.05)  # Rate limiting respectueux
+
+    with open(FICHIER_COORDONNEES, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(coordonnees.items())), f, indent=1, ensure_ascii=False)
+
+    print(f"[OK] {len(coordonnees)} villes dans {FICHIER_COORDONNEES.name}")
+    if introuvables:
+        # Villes hors France metropolitaine / DOM : a completer a la main
+        print(f"  Introuvables ({len(introuvables)}) : {', '.join(introuvables)}")
+
+
+if __name__ == "__main__":
+    main()
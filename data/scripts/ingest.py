@@ -1,18 +1,32 @@
 # ingest.py
 # Script d'indexation des formations dans ChromaDB
 # Charge le JSON enrichi, cree des documents LangChain et vectorise
+#
+# Usage :
+#   python data/scripts/ingest.py          # applique le delta depuis la derniere indexation
+#   python data/scripts/ingest.py --full   # reconstruit toute la collection
 
 import json
 import os
+import sys
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_core.documents import Document
 
 load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from src.data_loader import construire_documents
+from src.lexical import IndexBM25
+from src.metiers import TaxonomieMetiers
+from src.vectorstore import (
+    CompressionVecteurs, EmbeddingsEnCache, NumpyVectorStore, creer_vectorstore, documents_indexes,
+    evaluer_compression, synchroniser_vectorstore,
+)
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 VECTOR_DB_PATH = BASE_DIR / "data" / "chroma_db"
 
 DATA_CANDIDATES = [
@@ -37,56 +51,6 @@ def load_formations() -> list[dict]:
         return json.load(f)
 
 
-def _list_to_str(lst) -> str:
-    if not lst:
-        return ""
-    return ", ".join(str(x) for x in lst)
-
-
-def create_documents(formations: list[dict]) -> list[Document]:
-    """Cree des documents LangChain a partir des formations."""
-    docs = []
-    for f in formations:
-        parts = [
-            f"Formation: {f.get('nom', 'Inconnu')}.",
-            f"Diplome: {f.get('niveau_diplome', f.get('type_diplome', ''))}.",
-            f"Etablissement: {f.get('etablissement', '')} ({f.get('type_etablissement', '')}) a {f.get('ville', '')}.",
-            f"Domaine: {f.get('domaine', '')}.",
-            f"Niveau entree: {f.get('niveau_entree', '')}. Duree: {f.get('duree', '')}.",
-            f"Modalite: {f.get('modalite', '')}.",
-            f"Selectivite: {f.get('selectivite', '')}.",
-        ]
-        if f.get("prerequis_academiques"):
-            parts.append(f"Prerequis: {_list_to_str(f['prerequis_academiques'])}.")
-        if f.get("competences_acquises"):
-            parts.append(f"Competences: {_list_to_str(f['competences_acquises'])}.")
-        if f.get("debouches_metiers"):
-            parts.append(f"Debouches: {_list_to_str(f['debouches_metiers'])}.")
-        if f.get("conseils_candidature"):
-            parts.append(f"Conseils: {_list_to_str(f['conseils_candidature'])}.")
-        if f.get("alternatives"):
-            parts.append(f"Alternatives: {_list_to_str(f['alternatives'])}.")
-
-        text_content = " ".join(parts)
-        metadata = {
-            "id": f.get("nom", ""),
-            "ville": f.get("ville", ""),
-            "niveau_entree": f.get("niveau_entree", ""),
-            "etablissement": f.get("etablissement", ""),
-            "type_diplome": f.get("niveau_diplome", f.get("type_diplome", "")),
-            "domaine": f.get("domaine", ""),
-            "type_etablissement": f.get("type_etablissement", ""),
-            "modalite": f.get("modalite", ""),
-            "selectivite": f.get("selectivite", ""),
-            "plateforme": f.get("plateforme_candidature", ""),
-            "url": f.get("url", ""),
-        }
-        if f.get("debouches_metiers"):
-            metadata["debouches"] = ", ".join(f["debouches_metiers"][:5])
-        docs.append(Document(page_content=text_content, metadata=metadata))
-    return docs
-
-
 def main():
     print("=" * 60)
     print("Indexation ChromaDB - Formations enrichies")
@@ -97,25 +61,49 @@ def main():
         return
     print(f"  {len(formations)} formations chargees.")
 
-    docs = create_documents(formations)
+    # Meme builder que l'API : texte complet affiche + texte court vectorise
+    docs = construire_documents(formations)
     print(f"  {len(docs)} documents prepares.")
 
+    debut = time.perf_counter()
     print("  Chargement du modele d'embedding...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+    # Cache disque : seuls les textes nouveaux ou modifies sont vectorises
+    embeddings = EmbeddingsEnCache(HuggingFaceEmbeddings(
+        model_name=MODEL_NAME,
         model_kwargs={'device': 'cpu'},
         encode_kwargs={'normalize_embeddings': True}
-    )
-
-    print("  Vectorisation en cours...")
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=str(VECTOR_DB_PATH),
-        collection_name="orientation_formations",
-    )
+    ), MODEL_NAME)
+
+    if "--full" in sys.argv:
+        print("  Vectorisation complete en cours...")
+        vectorstore = creer_vectorstore(docs, str(VECTOR_DB_PATH), embeddings, backend="chroma")
+    else:
+        # Delta par rapport au manifeste (formation_id -> empreinte) de la derniere indexation
+        vectorstore = synchroniser_vectorstore(docs, str(VECTOR_DB_PATH), embeddings, backend="chroma")
+
+    duree = time.perf_counter() - debut
+    print(f"  Index sauvegarde dans : {VECTOR_DB_PATH} "
+          f"({duree:.1f}s, {len(docs) / max(duree, 1e-9):.0f} docs/s)")
+
+    # Index lexical BM25 (recherche hybride), tokenise une fois ici
+    bm25 = IndexBM25.charger_ou_construire(documents_indexes(vectorstore), str(VECTOR_DB_PATH))
+    print(f"  Index BM25 : {len(bm25.tokens)} termes")
+
+    # Taxonomie des metiers (debouches normalises) et index inverse metier -> formation_id
+    metiers = TaxonomieMetiers.charger_ou_construire(formations, str(VECTOR_DB_PATH))
+    print(f"  Taxonomie : {len(metiers)} metiers")
+
+    # Index NumPy compresse (VECTOR_QUANTIZATION / VECTOR_DIM) + impact sur le rappel
+    if CompressionVecteurs().active:
+        print("  Compression des vecteurs pour l'index NumPy...")
+        index_numpy = NumpyVectorStore.depuis_chroma(vectorstore, embeddings)
+        index_numpy.sauvegarder(str(VECTOR_DB_PATH))
+        rapport = evaluer_compression(index_numpy)
+        print(f"  Compression {rapport['compression']} : "
+              f"rappel@10 = {rapport['rappel@10']} "
+              f"(sans re-classement : {rapport['rappel@10_sans_reclassement']}), "
+              f"memoire {rapport['memoire_mo']['compresse']} Mo au lieu de {rapport['memoire_mo']['float32']} Mo")
 
-    print(f"  Index sauvegarde dans : {VECTOR_DB_PATH}")
     print(f"  Termine. {len(docs)} documents indexes.")
 
 
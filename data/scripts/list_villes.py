@@ -1,9 +1,13 @@
 # list_villes.py
 # Liste toutes les villes uniques dans formations_enriched.json
 import json
+import sys
 from pathlib import Path
 from collections import Counter
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+from src.geo import normaliser_ville
+
 data_path = Path(__file__).parent.parent / "processed" / "formations_enriched.json"
 with open(data_path, "r", encoding="utf-8") as f:
     formations = json.load(f)
@@ -12,15 +16,8 @@ with open(data_path, "r", encoding="utf-8") as f:
 villes_raw = [f.get("ville", "").strip() for f in formations if f.get("ville")]
 villes_norm = {}
 for v in villes_raw:
-    # Normaliser : enlever les arrondissements/cedex pour regrouper
-    v_lower = v.lower()
-    # Extraire la ville principale
-    for sep in [" cedex", "  ", " 1er", " 2e", " 3e", " 4e", " 5e", " 6e",
-                " 7e", " 8e", " 9e", " 10e", " 11e", " 12e", " 13e",
-                " 14e", " 15e", " 16e", " 17e", " 18e", " 19e", " 20e"]:
-        if sep in v_lower:
-            v_lower = v_lower.split(sep)[0].strip()
-            break
+    # Normaliser : enlever les arrondissements/cedex pour regrouper (src/geo.py)
+    v_lower = normaliser_ville(v)
     if v_lower not in villes_norm:
         villes_norm[v_lower] = 0
     villes_norm[v_lower] += 1
@@ -0,0 +1,53 @@
+# materialiser_options.py
+# Pre-calcule les options Licence / BUT / Master et le contexte par niveau
+# pour la grille du formulaire (domaine x objectif x niveau x ville)
+# Le pipeline sert ensuite cette table et ne recherche en direct que les saisies libres.
+#
+# Usage :
+#   python data/scripts/materialiser_options.py                 # 10 villes les plus representees
+#   python data/scripts/materialiser_options.py --villes 30     # grille plus large
+#   python data/scripts/materialiser_options.py --croiser       # tous les objectifs x tous les domaines
+#
+# A relancer apres chaque mise a jour de l'index : une table d'une autre version est ignoree.
+
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from src.data_loader import charger_formations
+from src.materialisation import materialiser
+from src.rag_pipeline import PipelineRAG
+
+# Valeurs de contraintes_geographiques toujours materialisees : aucune et celle par defaut du formulaire
+VILLES_FIXES = ["", "Paris ou Lyon"]
+
+
+def villes_principales(n: int) -> list[str]:
+    """Les n villes qui comptent le plus de formations (noms tels qu'ils sont dans le JSON)."""
+    compteur = Counter(f.get("ville", "").strip() for f in charger_formations() if f.get("ville"))
+    return [ville for ville, _ in compteur.most_common(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialise les options de parcours de la grille du formulaire")
+    parser.add_argument("--villes", type=int, default=10, help="nombre de villes materialisees")
+    parser.add_argument("--croiser", action="store_true", help="croiser tous les objectifs avec tous les domaines")
+    args = parser.parse_args()
+
+    pipeline = PipelineRAG()
+    pipeline.initialiser(avec_llm=False)
+    persist_dir = pipeline.persist_dir
+
+    villes = list(dict.fromkeys(VILLES_FIXES + villes_principales(args.villes)))
+    print(f"Materialisation : {len(villes)} valeurs de ville, version {pipeline.version_grille}")
+    grille = materialiser(pipeline, villes, croiser=args.croiser)
+    grille.sauvegarder(persist_dir)
+    print(f"Table sauvegardee dans {persist_dir} : {grille.stats}")
+
+
+if __name__ == "__main__":
+    main()
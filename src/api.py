@@ -2,13 +2,19 @@
 # API FastAPI pour le systeme d'orientation
 # Expose les endpoints pour generer des parcours et rechercher des formations
 
-from fastapi import FastAPI, HTTPException
+import json
+import threading
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional
 from contextlib import asynccontextmanager
 
 from src.rag_pipeline import PipelineRAG
+from src.vectorstore import stats_cache_embeddings
 
 
 # Instance globale du pipeline
@@ -113,6 +119,14 @@ class ProfilEtudiant(BaseModel):
     )
 
 
+class DemandeParcours(BaseModel):
+    """Profil de l'etudiant et formation choisie parmi les recommandations."""
+    profil: ProfilEtudiant
+    formation_id: str = Field(
+        ..., description="formation_id de la formation choisie (recommandations, recherche, metiers)"
+    )
+
+
 class RechercheFormation(BaseModel):
     """Requete de recherche de formations."""
     query: str = Field(
@@ -132,28 +146,55 @@ async def health_check():
     return {
         "status": "ok",
         "pipeline_initialise": pipeline._initialise,
+        "cache_embeddings": stats_cache_embeddings(),
+        "cache_llm": pipeline.cache_llm.stats() if pipeline.cache_llm is not None else None,
+        "cache_squelettes": pipeline.cache_squelettes.stats() if pipeline.cache_squelettes is not None else None,
+        "generation": pipeline.metriques_generation.stats(),
         "message": "L'API de generation de parcours est operationnelle.",
     }
 
 
-@app.post("/generer-parcours")
-async def generer_parcours(profil: ProfilEtudiant):
-    """
-    Genere un parcours personnalise pour un etudiant.
-    Recherche les formations pertinentes via RAG puis
-    genere le parcours avec le LLM.
-    """
+@app.get("/stats/recherche")
+async def stats_recherche():
+    """Compteurs des recherches a k adaptatif : candidats recus, retenus, gaspilles, relances."""
+    return pipeline.stats_recherches()
+
+
+@app.get("/stats/generation")
+async def stats_generation():
+    """Validation des reponses du LLM par nature : JSON repare localement, champs repares, echecs."""
+    return pipeline.metriques_generation.stats()
+
+
+def _formation_choisie(demande: DemandeParcours) -> dict:
+    """Formation choisie de la demande ; 503 si le pipeline n'est pas pret, 404 si inconnue."""
     if not pipeline._initialise:
         raise HTTPException(
             status_code=503,
             detail="Le pipeline n'est pas encore initialise.",
         )
+    formation = pipeline.formation_par_id(demande.formation_id)
+    if formation is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Formation inconnue : {demande.formation_id}",
+        )
+    return formation
 
+
+@app.post("/generer-parcours")
+async def generer_parcours(demande: DemandeParcours):
+    """
+    Genere un parcours personnalise pour un etudiant vers la formation choisie.
+    Recherche les formations pertinentes via RAG puis
+    genere le parcours avec le LLM.
+    """
+    formation = _formation_choisie(demande)
     try:
-        parcours = pipeline.generer_parcours(profil.model_dump())
+        parcours = await run_in_threadpool(pipeline.generer_parcours, demande.profil.model_dump(), formation)
         return {
             "success": True,
-            "profil": profil.model_dump(),
+            "profil": demande.profil.model_dump(),
             "parcours": parcours,
         }
     except Exception as e:
@@ -163,6 +204,41 @@ async def generer_parcours(profil: ProfilEtudiant):
         )
 
 
+@app.post("/generer-parcours/stream")
+async def generer_parcours_flux(demande: DemandeParcours, request: Request):
+    """
+    Meme generation en Server-Sent Events : un evenement "etape" des qu'une etape
+    est complete dans la reponse du LLM, suivi de "options" (formations reelles de
+    l'etape), "etape_personnalisee" (conseils personnalises, mode squelettes), puis
+    "parcours" (parcours final complet) ou "erreur".
+    Si le client se deconnecte, la generation est interrompue.
+    """
+    formation = _formation_choisie(demande)
+
+    async def evenements():
+        arret = threading.Event()
+        flux = pipeline.generer_parcours_flux(demande.profil.model_dump(), formation, attente=1.0, arret=arret)
+        try:
+            while True:
+                suivant = await run_in_threadpool(next, flux, None)
+                if suivant is None or await request.is_disconnected():
+                    return
+                evenement, donnees = suivant
+                if evenement == "attente":
+                    yield ": attente\n\n"
+                else:
+                    yield f"event: {evenement}\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n"
+        finally:
+            # Client parti (ou flux termine) : la generation s'arrete au morceau suivant
+            arret.set()
+
+    return StreamingResponse(
+        evenements(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/rechercher-formations")
 async def rechercher_formations(recherche: RechercheFormation):
     """Recherche des formations dans la base vectorielle."""
@@ -187,6 +263,44 @@ async def rechercher_formations(recherche: RechercheFormation):
         )
 
 
+@app.get("/metiers")
+async def resoudre_metier(q: str):
+    """Metiers de la taxonomie correspondant a un objectif libre (ex: ?q=data scientist)."""
+    if not pipeline._initialise:
+        raise HTTPException(
+            status_code=503,
+            detail="Le pipeline n'est pas encore initialise.",
+        )
+    metiers = pipeline.resoudre_metier(q)
+    return {
+        "success": True,
+        "query": q,
+        "metiers": metiers,
+    }
+
+
+@app.get("/metiers/{metier_id}/formations")
+async def formations_par_metier(metier_id: str, top_k: int = 50):
+    """Formations menant a un metier, lues dans l'index inverse metier -> formations."""
+    if not pipeline._initialise:
+        raise HTTPException(
+            status_code=503,
+            detail="Le pipeline n'est pas encore initialise.",
+        )
+    resultat = pipeline.formations_par_metier(metier_id, top_k)
+    if resultat is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Metier inconnu : {metier_id}",
+        )
+    return {
+        "success": True,
+        "metier": {"id": resultat["id"], "nom": resultat["nom"]},
+        "nb_formations": resultat["nb_formations"],
+        "resultats": resultat["formations"],
+    }
+
+
 @app.post("/rebuild-vectorstore")
 async def rebuild_vectorstore():
     """Reconstruit la base vectorielle a partir des donnees enrichies."""
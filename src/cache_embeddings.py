@@ -0,0 +1,154 @@
+# cache_embeddings.py
+# Cache disque des embeddings de documents : (modele, sha256(texte)) -> vecteur
+# Une reconstruction de l'index ne vectorise que les textes nouveaux ou modifies ;
+# les textes identiques (nombreux dans le catalogue) ne sont calcules qu'une fois.
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+load_dotenv()
+
+_PROJECT_DIR = Path(__file__).parent.parent
+# Dossier du cache ("" pour le desactiver)
+EMBEDDING_DISK_CACHE_DIR = os.getenv("EMBEDDING_DISK_CACHE_DIR", str(_PROJECT_DIR / "data" / "embedding_cache"))
+
+FICHIER_VECTEURS = "vecteurs.f32"
+FICHIER_INDEX = "index.json"
+FICHIER_VERROU = "verrou"
+
+
+def empreinte(texte: str) -> str:
+    """sha256 du texte exact (page_content) : cle du cache."""
+    return hashlib.sha256(texte.encode("utf-8")).hexdigest()
+
+
+class CacheEmbeddingsDisque:
+    """
+    Vecteurs float32 ajoutes a la suite dans vecteurs.f32 (lus par memmap)
+    + index.json : empreinte -> ligne. Un dossier par modele (et moteur d'inference).
+    Les ajouts se font sous un verrou de fichier (flock), partage par tous les
+    processus (ingest.py, workers de l'API) : l'index est relu sur le disque et les
+    vecteurs ecrits a la fin du fichier, jamais par-dessus ni en le tronquant.
+    Les vecteurs sont ecrits avant l'index (remplacement atomique) : un arret
+    brutal laisse au pire quelques lignes orphelines, ignorees par l'index.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", racine: str | Path = None):
+        nom = re.sub(r"[^A-Za-z0-9_.-]+", "__", f"{model_name}@{backend}")
+        self.dossier = Path(racine or EMBEDDING_DISK_CACHE_DIR) / nom
+        self.model_name = model_name
+        self.dimension = None
+        self._lignes = {}         # empreinte -> ligne
+        self._vecteurs = None     # memmap (n, dimension)
+        self._verrou = threading.Lock()
+        self._charger()
+
+    def __len__(self) -> int:
+        return len(self._lignes)
+
+    def _charger(self):
+        chemin = self.dossier / FICHIER_INDEX
+        if not chemin.exists():
+            return
+        with open(chemin, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.dimension = index["dimension"]
+        if "lignes" in index:
+            self._lignes = index["lignes"]
+        else:  # ancien format : liste des empreintes dans l'ordre des lignes
+            self._lignes = {h: i for i, h in enumerate(index["empreintes"])}
+        self._ouvrir()
+
+    def _ouvrir(self):
+        self._vecteurs = None
+        if self._lignes:
+            n = max(self._lignes.values()) + 1
+            self._vecteurs = np.memmap(self.dossier / FICHIER_VECTEURS, dtype=np.float32,
+                                       mode="r", shape=(n, self.dimension))
+
+    def _ecrire_index(self):
+        temporaire = self.dossier / (FICHIER_INDEX + f".{os.getpid()}.tmp")
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name, "dimension": self.dimension,
+                       "lignes": self._lignes}, f)
+        os.replace(temporaire, self.dossier / FICHIER_INDEX)
+
+    @contextmanager
+    def _verrou_fichier(self):
+        """Verrou exclusif entre processus sur le dossier du cache (bloquant)."""
+        with open(self.dossier / FICHIER_VERROU, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def chercher(self, empreintes: list[str]) -> dict:
+        """Vecteurs deja calcules : empreinte -> vecteur (copie)."""
+        with self._verrou:
+            trouves = [(h, self._lignes[h]) for h in empreintes if h in self._lignes]
+            if not trouves:
+                return {}
+            lignes = np.asarray([i for _, i in trouves])
+            vecteurs = np.array(self._vecteurs[lignes])
+        return {h: v for (h, _), v in zip(trouves, vecteurs)}
+
+    def ajouter(self, empreintes: list[str], vecteurs: np.ndarray):
+        vecteurs = np.ascontiguousarray(vecteurs, dtype=np.float32)
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        with self._verrou, self._verrou_fichier():
+            # Un autre processus a pu ajouter des vecteurs depuis le dernier chargement
+            self._charger()
+            if self.dimension is None:
+                self.dimension = vecteurs.shape[1]
+            nouveaux = {}
+            for i, h in enumerate(empreintes):
+                if h not in self._lignes:
+                    nouveaux.setdefault(h, i)
+            if not nouveaux:
+                return
+            # Premiere ligne libre : taille du fichier (lignes orphelines et ligne
+            # incomplete d'un arret brutal comprises), pas le nombre d'empreintes
+            fichier = self.dossier / FICHIER_VECTEURS
+            octets_ligne = self.dimension * 4
+            taille = fichier.stat().st_size if fichier.exists() else 0
+            debut = -(-taille // octets_ligne)
+            with open(fichier, "r+b" if fichier.exists() else "wb") as f:
+                f.seek(debut * octets_ligne)
+                f.write(vecteurs[list(nouveaux.values())].tobytes())
+            for j, h in enumerate(nouveaux):
+                self._lignes[h] = debut + j
+            self._ecrire_index()
+            self._ouvrir()
+
+    def embed_documents(self, calculer, texts: list[str]) -> list[list[float]]:
+        """
+        Vectorise texts avec calculer(liste de textes) en ne calculant que les
+        textes uniques absents du cache.
+        """
+        empreintes = [empreinte(t) for t in texts]
+        uniques = dict(zip(empreintes, texts))
+        vecteurs = self.chercher(list(uniques))
+        manquants = [h for h in uniques if h not in vecteurs]
+        if manquants:
+            calcules = np.asarray(calculer([uniques[h] for h in manquants]), dtype=np.float32)
+            self.ajouter(manquants, calcules)
+            vecteurs.update(zip(manquants, calcules))
+        print(f"  Cache d'embeddings : {len(uniques) - len(manquants)} reutilises, "
+              f"{len(manquants)} calcules, {len(texts) - len(uniques)} doublons")
+        return [vecteurs[h].tolist() for h in empreintes]
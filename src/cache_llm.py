@@ -0,0 +1,160 @@
+# cache_llm.py
+# Cache des reponses du LLM de generation de parcours, a deux niveaux :
+# 1. prompt identique (empreinte sha256 du prompt complet)
+# 2. profil quasi identique pour la meme formation : similarite cosinus entre
+#    l'embedding du profil (formater_profil) et ceux des reponses deja en cache
+# Persiste dans une base sqlite locale (TTL, eviction LRU), videe quand la
+# version de l'index change. La meme base garde les squelettes de parcours
+# (table squelettes, cle = formation / objectif / cycle / niveaux).
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "0" pour toujours appeler le LLM
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+# Duree de vie d'une reponse (secondes) et nombre maximal de reponses gardees
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX = int(os.getenv("LLM_CACHE_MAX", "2000"))
+# Similarite cosinus minimale entre deux profils pour reutiliser une reponse (> 1 = desactive)
+LLM_CACHE_SEUIL = float(os.getenv("LLM_CACHE_SEUIL", "0.97"))
+FICHIER_CACHE_LLM = "llm_cache.sqlite"
+
+
+def empreinte(*parties: str) -> str:
+    h = hashlib.sha256()
+    for partie in parties:
+        h.update(str(partie).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class CacheReponsesLLM:
+    """
+    Table sqlite <table>(cle, version, partition, vecteur, contenu, cree, acces) :
+    - cle       : empreinte du prompt, ou d'une cle de squelette (niveau exact)
+    - partition : ce qui doit etre identique pour reutiliser une reponse d'un autre profil
+                  (formation choisie, cycle, niveaux, objectif, gabarit du prompt)
+    - vecteur   : embedding normalise du profil (float32), compare dans la partition
+    Les entrees d'une autre version (index reconstruit, autre modele) sont supprimees
+    a l'ouverture ; TTL a la lecture, LRU (colonne acces) a l'ecriture.
+    """
+
+    def __init__(self, chemin: str, version: str, ttl: int = LLM_CACHE_TTL,
+                 taille_max: int = LLM_CACHE_MAX, seuil: float = LLM_CACHE_SEUIL, table: str = "reponses"):
+        self.chemin = str(chemin)
+        self.version = version
+        self.table = table
+        self.ttl = ttl
+        self.taille_max = taille_max
+        self.seuil = seuil
+        self._verrou = threading.Lock()
+        self.stats_compteurs = {"exact": 0, "semantique": 0, "manques": 0, "enregistrees": 0}
+        Path(self.chemin).parent.mkdir(parents=True, exist_ok=True)
+        self._connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        with self._verrou, self._connexion:
+            self._connexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " cle TEXT PRIMARY KEY, version TEXT NOT NULL, partition TEXT,"
+                " vecteur BLOB, contenu TEXT NOT NULL, cree REAL NOT NULL, acces REAL NOT NULL)"
+            )
+            self._connexion.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_partition ON {table}(partition)")
+            self._connexion.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_acces ON {table}(acces)")
+            supprimees = self._connexion.execute(
+                f"DELETE FROM {table} WHERE version != ?", (version,)).rowcount
+        if supprimees:
+            print(f"  Cache LLM : {supprimees} entrees ({table}) d'une autre version de l'index supprimees")
+
+    def __len__(self) -> int:
+        with self._verrou:
+            return self._connexion.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _toucher(self, cle: str):
+        self._connexion.execute(f"UPDATE {self.table} SET acces = ? WHERE cle = ?", (time.time(), cle))
+
+    def chercher(self, texte: str, partition: str = None, vecteur=None) -> tuple[str, str] | None:
+        """
+        (reponse, niveau) : reponse generee pour exactement ce texte ("exact" : prompt ou cle), sinon
+        celle du profil le plus proche de la partition si la similarite atteint le seuil
+        ("semantique"). vecteur peut etre une fonction : l'embedding du profil n'est
+        alors calcule qu'en cas d'echec du niveau exact. None si rien d'utilisable.
+        """
+        limite = time.time() - self.ttl
+        cle = empreinte(texte)
+        with self._verrou, self._connexion:
+            ligne = self._connexion.execute(
+                f"SELECT contenu FROM {self.table} WHERE cle = ? AND cree > ?", (cle, limite)
+            ).fetchone()
+            if ligne is not None:
+                self._toucher(cle)
+                self.stats_compteurs["exact"] += 1
+                return ligne[0], "exact"
+            lignes = []
+            if partition is not None and vecteur is not None:
+                lignes = self._connexion.execute(
+                    f"SELECT cle, vecteur, contenu FROM {self.table}"
+                    " WHERE partition = ? AND vecteur IS NOT NULL AND cree > ?",
+                    (partition, limite),
+                ).fetchall()
+            if not lignes:
+                self.stats_compteurs["manques"] += 1
+                return None
+
+        # Embedding du profil hors verrou (modele d'embedding)
+        q = _normaliser(vecteur() if callable(vecteur) else vecteur)
+        matrice = np.stack([np.frombuffer(v, dtype=np.float32) for _, v, _ in lignes])
+        similarites = matrice @ q
+        meilleur = int(np.argmax(similarites))
+        with self._verrou, self._connexion:
+            if similarites[meilleur] < self.seuil:
+                self.stats_compteurs["manques"] += 1
+                return None
+            self._toucher(lignes[meilleur][0])
+            self.stats_compteurs["semantique"] += 1
+        print(f"  Cache LLM : profil proche (similarite {similarites[meilleur]:.3f})")
+        return lignes[meilleur][2], "semantique"
+
+    def enregistrer(self, texte: str, contenu: str, partition: str = None, vecteur=None):
+        """Garde la reponse ; purge les entrees expirees et les moins recemment utilisees."""
+        maintenant = time.time()
+        blob = _normaliser(vecteur).tobytes() if vecteur is not None else None
+        with self._verrou, self._connexion:
+            self._connexion.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (empreinte(texte), self.version, partition, blob, contenu, maintenant, maintenant),
+            )
+            self._connexion.execute(f"DELETE FROM {self.table} WHERE cree <= ?", (maintenant - self.ttl,))
+            self._connexion.execute(
+                f"DELETE FROM {self.table} WHERE cle IN ("
+                f" SELECT cle FROM {self.table} ORDER BY acces DESC LIMIT -1 OFFSET ?)",
+                (self.taille_max,),
+            )
+            self.stats_compteurs["enregistrees"] += 1
+
+    def vider(self):
+        with self._verrou, self._connexion:
+            self._connexion.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        with self._verrou:
+            compteurs = dict(self.stats_compteurs)
+        demandes = compteurs["exact"] + compteurs["semantique"] + compteurs["manques"]
+        return {
+            **compteurs,
+            "taille": len(self),
+            "taux_succes": round((compteurs["exact"] + compteurs["semantique"]) / demandes, 3) if demandes else 0.0,
+        }
+
+
+def _normaliser(vecteur) -> np.ndarray:
+    v = np.asarray(vecteur, dtype=np.float32).ravel()
+    norme = np.linalg.norm(v)
+    return v / norme if norme > 0 else v
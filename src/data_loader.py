@@ -2,10 +2,13 @@
 # Charge les formations enrichies depuis le JSON
 # et les transforme en documents LangChain pour le RAG
 
+import hashlib
 import json
 from pathlib import Path
 from langchain_core.documents import Document
 
+from src.geo import TableVilles, id_ville, normaliser_ville
+
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 
@@ -26,6 +29,30 @@ def _list_to_str(lst: list | None, sep: str = ", ") -> str:
     return sep.join(str(x) for x in lst)
 
 
+def formation_id(f: dict) -> str:
+    """
+    Identifiant stable d'une formation : empreinte de (nom, etablissement, ville,
+    niveau_diplome), la cle de deduplication de merge_formations (+ le diplome).
+    Une meme formation garde le meme ID d'une mise a jour du dataset a l'autre.
+    """
+    cle = "|".join(
+        str(f.get(champ) or "").strip().lower()
+        for champ in ("nom", "etablissement", "ville")
+    ) + "|" + str(f.get("niveau_diplome") or f.get("type_diplome") or "").strip().lower()
+    return hashlib.sha1(cle.encode("utf-8")).hexdigest()[:16]
+
+
+def ids_formations(formations: list[dict]) -> list[str]:
+    """IDs stables de toutes les formations (suffixe -2, -3... si une cle est en double)."""
+    vus = {}
+    ids = []
+    for f in formations:
+        fid = formation_id(f)
+        vus[fid] = vus.get(fid, 0) + 1
+        ids.append(fid if vus[fid] == 1 else f"{fid}-{vus[fid]}")
+    return ids
+
+
 def formation_vers_texte(f: dict) -> str:
     """
     Convertit une formation en texte structure pour le RAG.
@@ -85,42 +112,48 @@ def formation_vers_texte(f: dict) -> str:
     return "\n".join(parties)
 
 
-def charger_documents(data_dir: str | Path = None) -> list[Document]:
+def formation_vers_texte_embedding(f: dict) -> str:
     """
-    Charge les formations et retourne des Documents LangChain.
-    Cherche d'abord le fichier enrichi, puis le partiel, puis l'original.
+    Texte court vectorise pour la recherche : nom, diplome, domaine, ville,
+    competences et debouches. Le texte complet (formation_vers_texte) reste
+    le contenu affiche et envoye au LLM, mais n'est pas vectorise :
+    plateforme, dates, documents ou conseils dilueraient le vecteur.
     """
-    data_dir = Path(data_dir) if data_dir else DATA_DIR
-    documents = []
-
-    # Ordre de priorite des fichiers
-    candidates = [
-        data_dir / "processed" / "formations_enriched.json",
-        data_dir / "processed" / "formations_partial.json",
-        data_dir / "processed" / "formations.json",
-        data_dir / "formations.json",
+    parties = [
+        f"{f.get('nom', '')}.",
+        f"{f.get('niveau_diplome', f.get('type_diplome', ''))}.",
     ]
+    if f.get("domaine"):
+        parties.append(f"Domaine : {f['domaine']}.")
+    if f.get("ville"):
+        parties.append(f"Ville : {f['ville']}.")
+    if f.get("competences_acquises"):
+        parties.append(f"Competences : {_list_to_str(f['competences_acquises'])}.")
+    if f.get("debouches_metiers"):
+        parties.append(f"Debouches : {_list_to_str(f['debouches_metiers'])}.")
+    return " ".join(parties)
 
-    fichier = None
-    for c in candidates:
-        if c.exists():
-            fichier = c
-            break
-
-    if fichier is None:
-        print("  ATTENTION: Aucun fichier formations trouve")
-        return documents
 
-    formations = charger_json(fichier)
+def construire_documents(formations: list[dict]) -> list[Document]:
+    """
+    Documents LangChain des formations (builder commun a l'API et a ingest.py) :
+    page_content = texte complet, metadata["texte_embedding"] = texte vectorise.
+    """
+    documents = []
+    villes = TableVilles.depuis_formations(formations)
 
-    for f in formations:
+    for f, fid in zip(formations, ids_formations(formations)):
         # Metadonnees pour le filtrage dans ChromaDB
         metadata = {
+            "formation_id": fid,
             "nom": f.get("nom", ""),
             "type": "formation",
             "type_diplome": f.get("niveau_diplome", f.get("type_diplome", "")),
             "etablissement": f.get("etablissement", ""),
             "ville": f.get("ville", ""),
+            "ville_norm": normaliser_ville(f.get("ville", "")),
+            "ville_id": id_ville(f.get("ville", "")),
+            "academie_id": villes.academie_principale(f.get("ville", ""), f.get("academie") or ""),
             "domaine": f.get("domaine", ""),
             "niveau_entree": f.get("niveau_entree", ""),
             "type_etablissement": f.get("type_etablissement", ""),
@@ -128,17 +161,62 @@ def charger_documents(data_dir: str | Path = None) -> list[Document]:
             "selectivite": f.get("selectivite", ""),
             "plateforme": f.get("plateforme_candidature", ""),
             "url": f.get("url", ""),
+            "texte_embedding": formation_vers_texte_embedding(f),
         }
 
         # Ajouter les debouches en metadonnee
         if f.get("debouches_metiers"):
             metadata["debouches"] = ", ".join(f["debouches_metiers"])
 
-        doc = Document(
+        documents.append(Document(
             page_content=formation_vers_texte(f),
             metadata=metadata,
-        )
-        documents.append(doc)
+        ))
+    return documents
+
+
+def trouver_fichier_formations(data_dir: str | Path = None) -> Path | None:
+    """
+    Retourne le fichier de formations a utiliser.
+    Cherche d'abord le fichier enrichi, puis le partiel, puis l'original.
+    """
+    data_dir = Path(data_dir) if data_dir else DATA_DIR
+
+    # Ordre de priorite des fichiers
+    candidates = [
+        data_dir / "processed" / "formations_enriched.json",
+        data_dir / "processed" / "formations_partial.json",
+        data_dir / "processed" / "formations.json",
+        data_dir / "formations.json",
+    ]
+
+    for c in candidates:
+        if c.exists():
+            return c
+    return None
+
+
+def charger_formations(data_dir: str | Path = None) -> list[dict]:
+    """Charge la liste brute des formations (dictionnaires JSON)."""
+    fichier = trouver_fichier_formations(data_dir)
+    if fichier is None:
+        print("  ATTENTION: Aucun fichier formations trouve")
+        return []
+    return charger_json(fichier)
+
+
+def charger_documents(data_dir: str | Path = None) -> list[Document]:
+    """
+    Charge les formations et retourne des Documents LangChain.
+    Cherche d'abord le fichier enrichi, puis le partiel, puis l'original.
+    """
+    fichier = trouver_fichier_formations(data_dir)
+    if fichier is None:
+        print("  ATTENTION: Aucun fichier formations trouve")
+        return []
+
+    formations = charger_json(fichier)
+    documents = construire_documents(formations)
 
     print(f"  {len(formations)} formations chargees depuis {fichier.name}")
     print(f"  Total : {len(documents)} documents prets pour la vectorisation")
@@ -152,3 +230,4 @@ if __name__ == "__main__":
         print(f"{'=' * 60}")
         print(f"[{docs[0].metadata['type_diplome']}] {docs[0].metadata['nom']}")
         print(docs[0].page_content)
+        print(f"\nTexte vectorise :\n{docs[0].metadata['texte_embedding']}")
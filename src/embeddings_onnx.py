@@ -0,0 +1,107 @@
+# embeddings_onnx.py
+# Encodage des requetes avec ONNX Runtime (modele exporte par data/scripts/export_onnx.py)
+# Meme tokenizer, meme mean pooling et meme normalisation L2 que sentence-transformers :
+# les vecteurs restent compatibles avec l'index construit par PyTorch.
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+except ImportError:  # moteur "onnx" optionnel (pip install onnxruntime)
+    ort = None
+    Tokenizer = None
+
+load_dotenv()
+
+_PROJECT_DIR = Path(__file__).parent.parent
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", str(_PROJECT_DIR / "data" / "models" / "onnx"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))          # 0 = choix d'ONNX Runtime
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+# Variantes exportees : nom du moteur -> fichier du modele
+FICHIERS_ONNX = {
+    "onnx": "model.onnx",
+    "onnx-int8": "model_int8.onnx",
+}
+CONFIG_ONNX = "onnx_config.json"
+
+
+def dossier_onnx(model_name: str, racine: str | Path = None) -> Path:
+    """Dossier du modele exporte : un sous-dossier par modele."""
+    nom = re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+    return Path(racine or ONNX_MODEL_DIR) / nom
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Modele d'embedding sentence-transformers exporte en ONNX (fp32 ou int8).
+    Pas de PyTorch au chargement : demarrage plus rapide et memoire reduite.
+    """
+
+    def __init__(self, model_name: str, variante: str = "onnx", racine: str | Path = None):
+        if ort is None:
+            raise ImportError(
+                "EMBEDDING_BACKEND=onnx necessite onnxruntime et tokenizers "
+                "(pip install onnxruntime tokenizers)."
+            )
+        if variante not in FICHIERS_ONNX:
+            raise ValueError(f"Variante ONNX inconnue : '{variante}' ({', '.join(FICHIERS_ONNX)})")
+
+        dossier = dossier_onnx(model_name, racine)
+        fichier = dossier / FICHIERS_ONNX[variante]
+        if not fichier.exists():
+            option = " --int8" if variante == "onnx-int8" else ""
+            raise FileNotFoundError(
+                f"Modele ONNX introuvable : {fichier}. "
+                f"Lancez d'abord : python data/scripts/export_onnx.py{option}"
+            )
+        with open(dossier / CONFIG_ONNX, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        self.model_name = model_name
+        self.variante = variante
+        self.dimension = config["dimension"]
+
+        self.tokenizer = Tokenizer.from_file(str(dossier / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_id"], pad_token=config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(str(fichier), options, providers=["CPUExecutionProvider"])
+        self._entrees = {e.name for e in self.session.get_inputs()}
+
+    def _encoder(self, texts: list[str]) -> np.ndarray:
+        encodages = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodages], dtype=np.int64)
+        masque = np.asarray([e.attention_mask for e in encodages], dtype=np.int64)
+        entrees = {"input_ids": input_ids, "attention_mask": masque}
+        if "token_type_ids" in self._entrees:
+            entrees["token_type_ids"] = np.zeros_like(input_ids)
+
+        etats = self.session.run(None, entrees)[0]              # (batch, tokens, dim)
+
+        # Mean pooling sur les tokens reels, puis normalisation L2
+        poids = masque[:, :, None].astype(np.float32)
+        vecteurs = (etats * poids).sum(axis=1) / np.maximum(poids.sum(axis=1), 1e-9)
+        normes = np.linalg.norm(vecteurs, axis=1, keepdims=True)
+        return vecteurs / np.maximum(normes, 1e-12)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vecteurs = []
+        for i in range(0, len(texts), ONNX_BATCH_SIZE):
+            vecteurs.extend(self._encoder(texts[i:i + ONNX_BATCH_SIZE]).tolist())
+        return vecteurs
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._encoder([text])[0].tolist()
@@ -0,0 +1,118 @@
+# encodage.py
+# Vectorisation des documents pour l'indexation : lots de longueur homogene
+# (peu de padding) repartis sur un pool de processus, debit affiche en docs/s.
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Taille des lots envoyes au modele
+ENCODAGE_BATCH_SIZE = int(os.getenv("ENCODAGE_BATCH_SIZE", "64"))
+# Nombre de processus (0 = coeurs disponibles, au plus 4 : chaque processus charge le modele)
+ENCODAGE_PROCESSUS = int(os.getenv("ENCODAGE_PROCESSUS", "0"))
+# En dessous de ce nombre de textes, demarrer des processus coute plus qu'il ne rapporte
+ENCODAGE_SEUIL_PARALLELE = int(os.getenv("ENCODAGE_SEUIL_PARALLELE", "512"))
+
+# Modele charge une fois par processus du pool
+_modele_processus = None
+
+
+def coeurs_disponibles() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows / macOS
+        return os.cpu_count() or 1
+
+
+def longueurs_tokens(base, texts: list[str]) -> np.ndarray:
+    """Longueur en tokens de chaque texte (tokenizer du modele, sinon nombre de mots)."""
+    tokenizer = getattr(base, "tokenizer", None)                      # OnnxEmbeddings
+    if tokenizer is None:
+        tokenizer = getattr(getattr(base, "_client", None), "tokenizer", None) or \
+            getattr(getattr(base, "client", None), "tokenizer", None)  # HuggingFaceEmbeddings
+    if tokenizer is not None:
+        if hasattr(tokenizer, "encode_batch"):
+            return np.asarray([len(e.ids) for e in tokenizer.encode_batch(texts)])
+        return np.asarray([len(ids) for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]])
+    return np.asarray([len(t.split()) for t in texts])
+
+
+def _initialiser_processus(model_name: str, backend: str, threads: int):
+    """Charge le modele dans le processus, avec sa part des coeurs."""
+    global _modele_processus
+    from src import embeddings_onnx
+    embeddings_onnx.ONNX_THREADS = threads
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from src.vectorstore import get_embeddings
+    _modele_processus = get_embeddings(model_name, backend).base
+
+
+def _encoder_lot(texts: list[str]) -> list[list[float]]:
+    return _modele_processus.embed_documents(texts)
+
+
+def encoder_documents(
+    base,
+    texts: list[str],
+    model_name: str,
+    backend: str,
+    batch_size: int = None,
+    processus: int = None,
+) -> np.ndarray:
+    """
+    Vectorise texts (float32, dans l'ordre d'origine) :
+    1. tri par longueur en tokens, decoupage en lots de batch_size textes de longueur voisine
+    2. lots repartis sur un pool de processus (modele torch / onnx recharge dans chacun),
+       ou encodes sur place pour les petits volumes et les modeles non rechargeables
+    Les processus sont demarres en "spawn" : un fork depuis l'API (threads, pool
+    d'intra-op torch / onnxruntime deja actifs) peut bloquer le processus enfant.
+    """
+    from src.embeddings_onnx import FICHIERS_ONNX
+
+    n = len(texts)
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    batch_size = batch_size or ENCODAGE_BATCH_SIZE
+    coeurs = coeurs_disponibles()
+    processus = processus or ENCODAGE_PROCESSUS or min(coeurs, 4)
+    rechargeable = backend == "torch" or backend in FICHIERS_ONNX
+    if n < ENCODAGE_SEUIL_PARALLELE or not rechargeable or type(base).__name__ not in ("HuggingFaceEmbeddings", "OnnxEmbeddings"):
+        processus = 1
+
+    debut = time.perf_counter()
+    ordre = np.argsort(longueurs_tokens(base, texts), kind="stable")
+    lots = [ordre[i:i + batch_size] for i in range(0, n, batch_size)]
+    textes_lots = [[texts[i] for i in lot] for lot in lots]
+
+    if processus > 1:
+        with ProcessPoolExecutor(
+            max_workers=processus,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialiser_processus,
+            initargs=(model_name, backend, max(1, coeurs // processus)),
+        ) as pool:
+            resultats = list(pool.map(_encoder_lot, textes_lots))
+    else:
+        resultats = [base.embed_documents(t) for t in textes_lots]
+
+    vecteurs = None
+    for lot, res in zip(lots, resultats):
+        res = np.asarray(res, dtype=np.float32)
+        if vecteurs is None:
+            vecteurs = np.empty((n, res.shape[1]), dtype=np.float32)
+        vecteurs[lot] = res
+
+    duree = time.perf_counter() - debut
+    print(f"  Encodage : {n} textes en {duree:.1f}s ({n / max(duree, 1e-9):.0f} docs/s, "
+          f"{len(lots)} lots de {batch_size}, {processus} processus)")
+    return vecteurs
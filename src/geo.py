@@ -0,0 +1,272 @@
+# geo.py
+# Referentiel geographique des formations
+# Table canonique des villes et academies (IDs entiers) avec listes de postings
+# et index spatial (grille) sur les coordonnees des villes
+
+import json
+import math
+import os
+import re
+import unicodedata
+import zlib
+from pathlib import Path
+
+
+# Coordonnees des villes du catalogue (generees par data/scripts/geocoder_villes.py)
+FICHIER_COORDONNEES = Path(__file__).parent.parent / "data" / "processed" / "villes_coordonnees.json"
+
+# Rayon "villes proches" et taille des cellules de la grille spatiale
+RAYON_PROXIMITE_KM = float(os.getenv("RAYON_PROXIMITE_KM", "50"))
+TAILLE_CELLULE_DEG = 0.5
+
+
+# Mapping des academies francaises vers leurs villes principales
+ACADEMIES = {
+    "aix-marseille": ["marseille", "aix-en-provence", "avignon", "arles", "salon-de-provence", "gap", "digne"],
+    "amiens": ["amiens", "beauvais", "compiegne", "laon", "saint-quentin", "soissons"],
+    "besancon": ["besancon", "belfort", "montbeliard", "lons-le-saunier", "vesoul"],
+    "bordeaux": ["bordeaux", "pau", "agen", "perigueux", "bayonne", "mont-de-marsan", "libourne"],
+    "caen": ["caen", "rouen", "le havre", "cherbourg", "lisieux", "evreux", "alencon", "vire"],
+    "clermont-ferrand": ["clermont-ferrand", "aurillac", "le puy-en-velay", "moulins", "montlucon", "vichy"],
+    "corse": ["ajaccio", "bastia", "corte"],
+    "creteil": ["creteil", "bobigny", "villetaneuse", "aubervilliers", "evry", "melun", "meaux", "fontainebleau"],
+    "dijon": ["dijon", "auxerre", "nevers", "macon", "chalon-sur-saone", "le creusot"],
+    "grenoble": ["grenoble", "annecy", "chambery", "valence", "bourg-en-bresse"],
+    "guadeloupe": ["pointe-a-pitre", "les abymes"],
+    "guyane": ["cayenne", "kourou"],
+    "la reunion": ["saint-denis", "le tampon", "saint-pierre"],
+    "lille": ["lille", "roubaix", "tourcoing", "dunkerque", "calais", "arras", "lens", "douai", "valenciennes"],
+    "limoges": ["limoges", "brive", "gueret", "tulle"],
+    "lyon": ["lyon", "villeurbanne", "saint-etienne", "roanne", "bourg-en-bresse"],
+    "martinique": ["fort-de-france", "schoelcher"],
+    "mayotte": ["dembeni", "mamoudzou"],
+    "montpellier": ["montpellier", "nimes", "perpignan", "beziers", "carcassonne", "mende", "narbonne"],
+    "nancy-metz": ["nancy", "metz", "strasbourg", "epinal", "bar-le-duc", "verdun"],
+    "nantes": ["nantes", "angers", "le mans", "laval", "la roche-sur-yon", "saint-nazaire"],
+    "nice": ["nice", "cannes", "antibes", "menton", "toulon", "draguignan", "grasse"],
+    "orleans-tours": ["orleans", "tours", "blois", "bourges", "chartres", "chateauroux"],
+    "paris": ["paris", "nanterre", "orsay", "guyancourt", "versailles", "saint-germain-en-laye",
+               "sceaux", "boulogne-billancourt", "neuilly", "saint-cloud", "massy", "saclay",
+               "cergy", "pontoise", "saint-denis", "montreuil"],
+    "poitiers": ["poitiers", "la rochelle", "niort", "angouleme", "chatellerault"],
+    "reims": ["reims", "troyes", "chalons-en-champagne", "charleville-mezieres"],
+    "rennes": ["rennes", "brest", "quimper", "vannes", "lorient", "saint-brieuc", "saint-malo"],
+    "strasbourg": ["strasbourg", "mulhouse", "colmar", "haguenau"],
+    "toulouse": ["toulouse", "tarbes", "albi", "montauban", "rodez", "cahors", "auch", "castres", "foix"],
+    "versailles": ["versailles", "guyancourt", "saint-quentin-en-yvelines", "poissy", "mantes-la-jolie",
+                    "boulogne-billancourt", "nanterre", "cergy", "pontoise", "evry-courcouronnes"],
+}
+
+
+def normaliser_ville(ville: str) -> str:
+    """
+    Normalise un nom de ville pour le filtrage (meme logique que list_villes.py) :
+    minuscules, sans accents, sans arrondissement ni cedex, mots relies par des tirets.
+    Ex: 'Lyon 8e  Arrondissement' -> 'lyon', 'CLERMONT FERRAND CEDEX 1' -> 'clermont-ferrand'
+    """
+    if not ville:
+        return ""
+    v = unicodedata.normalize("NFKD", ville).encode("ascii", "ignore").decode("ascii").lower()
+    v = re.sub(r"\bcedex\b.*$", "", v)
+    v = re.sub(r"\b\d+\s*(er|e|eme)?\s+arrondissement\b.*$", "", v)
+    v = re.sub(r"[\s'’_-]+", "-", v.strip()).strip("-")
+    v = re.sub(r"(^|-)st-", r"\1saint-", v)
+    return v
+
+
+def id_ville(ville: str) -> int:
+    """
+    Identifiant entier stable d'une ville (CRC32 du nom normalise).
+    Ne depend que du nom : identique a l'ingestion et a la requete,
+    sans table a synchroniser entre l'index et le pipeline.
+    """
+    nom = normaliser_ville(ville)
+    return zlib.crc32(nom.encode("utf-8")) if nom else 0
+
+
+def id_academie(academie: str) -> int:
+    """Identifiant entier stable d'une academie (meme principe que id_ville)."""
+    nom = normaliser_ville(academie)
+    return zlib.crc32(("academie:" + nom).encode("utf-8")) if nom else 0
+
+
+def decouper_contrainte_geo(contrainte_geo: str) -> list[str]:
+    """
+    Decoupe une contrainte geographique en noms de villes normalises.
+    Ex: 'Paris ou Lyon' -> ['paris', 'lyon']
+    """
+    if not contrainte_geo:
+        return []
+    parts = re.split(r"[,]|\bou\b|\bet\b", contrainte_geo.lower())
+    villes = [normaliser_ville(v) for v in parts if v.strip()]
+    return [v for v in villes if v]
+
+
+def charger_coordonnees(chemin: str | Path = None) -> dict[str, tuple[float, float]]:
+    """Charge la table nom normalise -> (lat, lon). Table absente -> {} (pas de proximite par distance)."""
+    chemin = Path(chemin) if chemin else FICHIER_COORDONNEES
+    if not chemin.exists():
+        print(f"  ATTENTION: table des coordonnees introuvable ({chemin.name})")
+        return {}
+    with open(chemin, "r", encoding="utf-8") as f:
+        brut = json.load(f)
+    return {normaliser_ville(nom): (p["lat"], p["lon"]) for nom, p in brut.items()}
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distance orthodromique (haversine) en kilometres."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GrilleSpatiale:
+    """
+    Index spatial en grille reguliere (cellules de TAILLE_CELLULE_DEG degres).
+    Une requete "a moins de R km" ne visite que les cellules couvrant le cercle,
+    puis verifie la distance exacte des quelques villes qu'elles contiennent.
+    """
+
+    def __init__(self, taille_cellule: float = TAILLE_CELLULE_DEG):
+        self.taille = taille_cellule
+        self.cellules = {}   # (i, j) -> [(ville_id, lat, lon)]
+
+    def _cellule(self, lat: float, lon: float) -> tuple:
+        return (math.floor(lat / self.taille), math.floor(lon / self.taille))
+
+    def ajouter(self, ville_id: int, lat: float, lon: float):
+        self.cellules.setdefault(self._cellule(lat, lon), []).append((ville_id, lat, lon))
+
+    def dans_rayon(self, lat: float, lon: float, rayon_km: float) -> list[tuple[int, float]]:
+        """[(ville_id, distance_km)] a moins de rayon_km, du plus proche au plus lointain."""
+        d_lat = rayon_km / 111.0
+        d_lon = rayon_km / (111.0 * max(0.01, math.cos(math.radians(lat))))
+        i_min, j_min = self._cellule(lat - d_lat, lon - d_lon)
+        i_max, j_max = self._cellule(lat + d_lat, lon + d_lon)
+        resultats = []
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                for vid, v_lat, v_lon in self.cellules.get((i, j), ()):
+                    d = distance_km(lat, lon, v_lat, v_lon)
+                    if d <= rayon_km:
+                        resultats.append((vid, d))
+        return sorted(resultats, key=lambda r: r[1])
+
+
+class TableVilles:
+    """
+    Table canonique des villes du catalogue.
+    - ville_id    -> nom normalise, academies, formations (liste de postings)
+    - academie_id -> villes
+    Les contraintes "Paris ou Lyon" ou "meme academie qu'Avignon" deviennent
+    des unions d'ensembles d'entiers, sans recherche de sous-chaines.
+    """
+
+    def __init__(self):
+        self.noms = {}                  # ville_id -> nom normalise
+        self.noms_academies = {}        # academie_id -> nom normalise
+        self.academies_par_ville = {}   # ville_id -> {academie_id}
+        self.villes_par_academie = {}   # academie_id -> {ville_id}
+        self.postings = {}              # ville_id -> [indices des formations]
+        self.coordonnees = {}           # ville_id -> (lat, lon)
+        self.grille = GrilleSpatiale()
+
+    def _ajouter_ville(self, ville: str, academie: str = "") -> int:
+        vid = id_ville(ville)
+        if not vid:
+            return 0
+        self.noms.setdefault(vid, normaliser_ville(ville))
+        if academie:
+            aid = id_academie(academie)
+            self.noms_academies.setdefault(aid, normaliser_ville(academie))
+            self.academies_par_ville.setdefault(vid, set()).add(aid)
+            self.villes_par_academie.setdefault(aid, set()).add(vid)
+        return vid
+
+    @classmethod
+    def depuis_formations(cls, formations: list[dict], coordonnees: dict = None) -> "TableVilles":
+        """
+        Construit la table a partir des formations (champ ville et academie)
+        et du mapping ACADEMIES pour les formations sans academie renseignee.
+        Les villes ayant des coordonnees sont indexees dans la grille spatiale.
+        """
+        table = cls()
+        for academie, villes in ACADEMIES.items():
+            for v in villes:
+                table._ajouter_ville(v, academie)
+        for i, f in enumerate(formations):
+            vid = table._ajouter_ville(f.get("ville", ""), f.get("academie") or "")
+            if vid:
+                table.postings.setdefault(vid, []).append(i)
+
+        if coordonnees is None:
+            coordonnees = charger_coordonnees()
+        for vid, nom in table.noms.items():
+            point = coordonnees.get(nom)
+            if point:
+                table.coordonnees[vid] = point
+                table.grille.ajouter(vid, *point)
+        return table
+
+    def academie_principale(self, ville: str, academie: str = "") -> int:
+        """academie_id d'une formation : son champ academie, sinon le mapping ACADEMIES."""
+        if academie:
+            return id_academie(academie)
+        aids = self.academies_par_ville.get(id_ville(ville))
+        return min(aids) if aids else 0
+
+    def resoudre(self, contrainte_geo: str) -> tuple[list[int], dict[int, str]]:
+        """
+        Contrainte geographique -> (IDs de villes (ordre conserve), noms des villes
+        hors catalogue pour l'affichage). La table n'est pas modifiee : elle est
+        partagee entre les requetes.
+        """
+        ids, hors_catalogue = [], {}
+        for nom in decouper_contrainte_geo(contrainte_geo):
+            vid = id_ville(nom)
+            if vid not in self.noms:
+                hors_catalogue.setdefault(vid, nom)
+            if vid not in ids:
+                ids.append(vid)
+        return ids, hors_catalogue
+
+    def villes_meme_academie(self, ville_ids: list[int]) -> list[int]:
+        """Union des villes des academies des villes donnees (sans ces villes)."""
+        proches = set()
+        for vid in ville_ids:
+            for aid in self.academies_par_ville.get(vid, ()):
+                proches |= self.villes_par_academie.get(aid, set())
+        proches -= set(ville_ids)
+        return sorted(proches, key=lambda v: (-len(self.postings.get(v, ())), self.noms.get(v, "")))
+
+    def villes_dans_rayon(self, ville_ids: list[int], rayon_km: float = None) -> list[tuple[int, float]]:
+        """
+        Villes du catalogue (avec formations) a moins de rayon_km d'une des villes donnees,
+        sans ces villes : [(ville_id, distance_km)] du plus proche au plus lointain.
+        """
+        rayon_km = RAYON_PROXIMITE_KM if rayon_km is None else rayon_km
+        proches = {}
+        for vid in ville_ids:
+            point = self.coordonnees.get(vid)
+            if point is None:
+                continue
+            for autre, d in self.grille.dans_rayon(*point, rayon_km):
+                if autre in ville_ids or autre not in self.postings:
+                    continue
+                proches[autre] = min(d, proches.get(autre, d))
+        return sorted(proches.items(), key=lambda r: r[1])
+
+    def distance_min(self, ville_id: int, ville_ids: list[int]) -> float | None:
+        """Distance (km) de ville_id a la plus proche des villes donnees, None si inconnue."""
+        point = self.coordonnees.get(ville_id)
+        if point is None:
+            return None
+        distances = [distance_km(*point, *self.coordonnees[v]) for v in ville_ids if v in self.coordonnees]
+        return min(distances) if distances else None
+
+    def nom(self, ville_id: int) -> str:
+        return self.noms.get(ville_id, "")
+
+    def nb_formations(self, ville_id: int) -> int:
+        return len(self.postings.get(ville_id, ()))
@@ -0,0 +1,204 @@
+# lexical.py
+# Index lexical BM25 (tokens sans accents) et recherche hybride vecteurs + BM25
+# Les termes exacts ("notaire", "droit notarial", "BUT GEII") que MiniLM rapproche
+# d'autres metiers remontent en tete grace a la fusion par rangs reciproques (RRF).
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from src.scoring import tokeniser
+from src.vectorstore import FiltresMetadonnees
+
+load_dotenv()
+
+RECHERCHE_HYBRIDE = os.getenv("RECHERCHE_HYBRIDE", "1") == "1"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Constante de la fusion RRF : score = somme des 1 / (RRF_K + rang)
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_SUBDIR = "bm25"
+
+# Mots outils ignores (requetes construites a partir du profil : "Paris ou Lyon", "et"...)
+MOTS_VIDES = {
+    "a", "au", "aux", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les",
+    "ou", "par", "pour", "sur", "un", "une",
+}
+
+# Recherche BM25 lancee pendant la recherche vectorielle
+_EXECUTEUR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bm25")
+
+
+def texte_indexe(doc: Document) -> str:
+    """Texte indexe : le texte court vectorise (nom, diplome, competences, debouches)."""
+    return doc.metadata.get("texte_embedding") or doc.page_content
+
+
+def tokens_indexes(texte: str) -> list[str]:
+    return [t for t in tokeniser(texte) if t not in MOTS_VIDES]
+
+
+def signature_documents(documents: list[Document]) -> str:
+    """Empreinte des textes indexes, dans l'ordre : l'index sauvegarde est-il a jour ?"""
+    h = hashlib.sha256()
+    for doc in documents:
+        h.update(texte_indexe(doc).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class IndexBM25(FiltresMetadonnees):
+    """
+    Index inverse au format CSR : pour le token i, les lignes
+    lignes[indptr[i]:indptr[i+1]] et leurs poids BM25 pre-calcules
+    (idf x saturation tf / longueur). Une requete = quelques additions
+    de tranches de tableaux NumPy. Les filtres where sont ceux des index en memoire.
+    """
+
+    def __init__(self, documents: list[Document], vocabulaire: list[str],
+                 indptr: np.ndarray, lignes: np.ndarray, poids: np.ndarray, signature: str):
+        self._documents = list(documents)
+        self._bitmaps = {}
+        self.tokens = vocabulaire
+        self.vocabulaire = {t: i for i, t in enumerate(vocabulaire)}
+        self.indptr = indptr
+        self.lignes = lignes
+        self.poids = poids
+        self.signature = signature
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @classmethod
+    def construire(cls, documents: list[Document]) -> "IndexBM25":
+        postings = {}
+        longueurs = np.zeros(len(documents), dtype=np.float32)
+        for ligne, doc in enumerate(documents):
+            tokens = tokens_indexes(texte_indexe(doc))
+            longueurs[ligne] = len(tokens)
+            for token in tokens:
+                tf = postings.setdefault(token, {})
+                tf[ligne] = tf.get(ligne, 0) + 1
+
+        vocabulaire = sorted(postings)
+        n = max(len(documents), 1)
+        moyenne = float(longueurs.mean()) if len(documents) else 1.0
+        indptr = np.zeros(len(vocabulaire) + 1, dtype=np.int64)
+        lignes, poids = [], []
+        for i, token in enumerate(vocabulaire):
+            tf_token = postings[token]
+            idf = np.log(1.0 + (n - len(tf_token) + 0.5) / (len(tf_token) + 0.5))
+            rangs = np.fromiter(tf_token.keys(), dtype=np.int32, count=len(tf_token))
+            tf = np.fromiter(tf_token.values(), dtype=np.float32, count=len(tf_token))
+            norme = BM25_K1 * (1.0 - BM25_B + BM25_B * longueurs[rangs] / max(moyenne, 1e-9))
+            lignes.append(rangs)
+            poids.append((idf * tf * (BM25_K1 + 1.0) / (tf + norme)).astype(np.float32))
+            indptr[i + 1] = indptr[i] + len(rangs)
+
+        return cls(
+            documents,
+            vocabulaire,
+            indptr,
+            np.concatenate(lignes) if lignes else np.zeros(0, dtype=np.int32),
+            np.concatenate(poids) if poids else np.zeros(0, dtype=np.float32),
+            signature_documents(documents),
+        )
+
+    def sauvegarder(self, persist_dir: str):
+        """Postings (.npz) + vocabulaire (.json) a cote de l'index vectoriel."""
+        dossier = Path(persist_dir) / BM25_SUBDIR
+        dossier.mkdir(parents=True, exist_ok=True)
+        np.savez(dossier / "postings.npz", indptr=self.indptr, lignes=self.lignes, poids=self.poids)
+        with open(dossier / "vocabulaire.json", "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "k1": BM25_K1, "b": BM25_B,
+                       "tokens": self.tokens}, f, ensure_ascii=False)
+
+    @classmethod
+    def charger(cls, persist_dir: str, documents: list[Document]) -> "IndexBM25 | None":
+        """Index sauvegarde s'il correspond exactement aux documents (sinon None)."""
+        dossier = Path(persist_dir) / BM25_SUBDIR
+        if not (dossier / "postings.npz").exists() or not (dossier / "vocabulaire.json").exists():
+            return None
+        with open(dossier / "vocabulaire.json", "r", encoding="utf-8") as f:
+            vocabulaire = json.load(f)
+        if (vocabulaire["signature"] != signature_documents(documents)
+                or vocabulaire["k1"] != BM25_K1 or vocabulaire["b"] != BM25_B):
+            return None
+        postings = np.load(dossier / "postings.npz")
+        return cls(documents, vocabulaire["tokens"], postings["indptr"], postings["lignes"],
+                   postings["poids"], vocabulaire["signature"])
+
+    @classmethod
+    def charger_ou_construire(cls, documents: list[Document], persist_dir: str) -> "IndexBM25":
+        index = cls.charger(persist_dir, documents)
+        if index is None:
+            index = cls.construire(documents)
+            index.sauvegarder(persist_dir)
+        return index
+
+    def scores(self, requete: str) -> np.ndarray:
+        scores = np.zeros(len(self._documents), dtype=np.float32)
+        for token in set(tokens_indexes(requete)):
+            i = self.vocabulaire.get(token)
+            if i is not None:
+                debut, fin = self.indptr[i], self.indptr[i + 1]
+                scores[self.lignes[debut:fin]] += self.poids[debut:fin]
+        return scores
+
+    def rechercher(self, requete: str, k: int = 4, filtre: dict = None) -> list[Document]:
+        """Top-k BM25 (documents contenant au moins un terme de la requete)."""
+        scores = self.scores(requete)
+        candidats = np.flatnonzero(scores > 0)
+        if filtre and len(candidats):
+            candidats = candidats[self._masque(filtre)[candidats]]
+        if len(candidats) > k:
+            candidats = candidats[np.argpartition(-scores[candidats], k - 1)[:k]]
+        ordre = candidats[np.argsort(-scores[candidats], kind="stable")]
+        return [self._documents[i] for i in ordre]
+
+
+def fusion_rrf(listes: list[list[Document]], k: int) -> list[Document]:
+    """
+    Reciprocal Rank Fusion : chaque document recoit la somme des 1 / (RRF_K + rang)
+    de ses rangs dans les listes. A egalite, l'ordre de la premiere liste est garde.
+    """
+    scores = {}
+    documents = {}
+    for liste in listes:
+        for rang, doc in enumerate(liste, start=1):
+            cle = doc.page_content
+            scores[cle] = scores.get(cle, 0.0) + 1.0 / (RRF_K + rang)
+            documents.setdefault(cle, doc)
+    ordre = sorted(scores, key=lambda cle: -scores[cle])
+    return [documents[cle] for cle in ordre[:k]]
+
+
+class RechercheHybride:
+    """
+    Facade similarity_search() sur la base vectorielle : la recherche BM25
+    (meme filtre) tourne en parallele de la recherche vectorielle, puis les
+    deux listes sont fusionnees par RRF. Un seul appel pour l'appelant.
+    """
+
+    def __init__(self, vectorstore, bm25: IndexBM25):
+        self.vectorstore = vectorstore
+        self.bm25 = bm25
+
+    @property
+    def embeddings(self):
+        return self.vectorstore.embeddings
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list[Document]:
+        lexical = _EXECUTEUR.submit(self.bm25.rechercher, query, k, filter)
+        vectoriel = self.vectorstore.similarity_search(query, k=k, filter=filter, **kwargs)
+        return fusion_rrf([vectoriel, lexical.result()], k)
+
+    def rechercher_lexical(self, requetes: list[tuple]) -> list:
+        """Lance en tache de fond les recherches BM25 (requete, k, filtre) d'un lot."""
+        return [_EXECUTEUR.submit(self.bm25.rechercher, r, k, f) for r, k, f in requetes]
@@ -0,0 +1,186 @@
+# materialisation.py
+# Table pre-calculee des options et contextes de parcours pour la grille finie
+# du formulaire (domaine x objectif x niveau x ville, cf. src/referentiel.py).
+# Construite hors ligne par data/scripts/materialiser_options.py ; a la requete
+# le pipeline la sert directement et ne recherche en direct que les saisies libres.
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.lexical import RECHERCHE_HYBRIDE, signature_documents
+from src.referentiel import OBJECTIFS_PAR_DOMAINE
+from src.scoring import normaliser_texte
+
+load_dotenv()
+
+# "0" pour ignorer la table et toujours rechercher en direct
+OPTIONS_MATERIALISEES = os.getenv("OPTIONS_MATERIALISEES", "1") == "1"
+FICHIER_GRILLE = "grille_options.json"
+# A incrementer quand la logique de recherche des options change (invalide les tables)
+FORMAT_GRILLE = 2
+
+TOP_K_OPTIONS = 10
+TOP_K_CONTEXTE = 5
+
+
+def version_grille(documents: list, taxonomie=None) -> str:
+    """
+    Version de la table : documents indexes, recherche hybride, taxonomie des metiers
+    et format. Une table d'une autre version (index reconstruit depuis) est ignoree.
+    """
+    h = hashlib.sha256()
+    h.update(signature_documents(documents).encode("utf-8"))
+    h.update(f"|hybride={RECHERCHE_HYBRIDE}|format={FORMAT_GRILLE}".encode("utf-8"))
+    if taxonomie is not None:
+        h.update(taxonomie.signature.encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _cle(*valeurs) -> str:
+    return "|".join(" ".join(normaliser_texte(str(v or "")).split()) for v in valeurs)
+
+
+def cle_domaine(profil: dict) -> str:
+    return " ".join(profil.get("domaines_etudes_preferes", []))
+
+
+def cle_objectif(profil: dict) -> str:
+    return profil.get("objectif_professionnel", profil.get("objectif", "")).strip()
+
+
+class GrilleOptions:
+    """
+    Trois tables de formation_id, cle = cellule de la grille (valeurs normalisees) :
+    - options   : (domaine, objectif, ville) -> {"licence": [...], "but": [...]}
+    - masters   : (domaine, objectif) -> candidats Masters avant re-classement
+                  (le score depend des notes / budget / competences, calcule a la requete)
+    - contextes : (niveaux, domaine, objectif, ville) -> [[niveau, [...]], ...]
+    Les formations sont relues dans l'index par formation_id : la table reste petite
+    et sert exactement les memes dicts que la recherche en direct.
+    """
+
+    def __init__(self, version: str, options: dict = None, masters: dict = None,
+                 contextes: dict = None, stats: dict = None):
+        self.version = version
+        self.options = options or {}
+        self.masters = masters or {}
+        self.contextes = contextes or {}
+        self.stats = stats or {}
+
+    def __len__(self) -> int:
+        return len(self.options) + len(self.masters) + len(self.contextes)
+
+    @staticmethod
+    def cle_options(domaine: str, objectif: str, ville: str) -> str:
+        return _cle(domaine, objectif, ville)
+
+    @staticmethod
+    def cle_masters(domaine: str, objectif: str) -> str:
+        return _cle(domaine, objectif)
+
+    @staticmethod
+    def cle_contexte(niveaux: list, domaine: str, objectif: str, ville: str) -> str:
+        return _cle(",".join(niveaux), domaine, objectif, ville)
+
+    def chercher_options(self, profil: dict) -> dict | None:
+        return self.options.get(self.cle_options(
+            cle_domaine(profil), cle_objectif(profil), profil.get("contraintes_geographiques", "")))
+
+    def chercher_masters(self, objectif: str, profil: dict) -> list | None:
+        return self.masters.get(self.cle_masters(cle_domaine(profil), objectif))
+
+    def chercher_contexte(self, niveaux: list, objectif: str, profil: dict) -> list | None:
+        return self.contextes.get(self.cle_contexte(
+            niveaux, cle_domaine(profil), objectif, profil.get("contraintes_geographiques", "")))
+
+    def sauvegarder(self, persist_dir: str):
+        """grille_options.json a cote de l'index vectoriel (remplacement atomique)."""
+        Path(persist_dir).mkdir(parents=True, exist_ok=True)
+        chemin = Path(persist_dir) / FICHIER_GRILLE
+        temporaire = chemin.with_suffix(".json.tmp")
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "stats": self.stats, "options": self.options,
+                       "masters": self.masters, "contextes": self.contextes}, f, ensure_ascii=False)
+        os.replace(temporaire, chemin)
+
+    @classmethod
+    def charger(cls, persist_dir: str, version: str) -> "GrilleOptions | None":
+        """Table sauvegardee si elle correspond a la version de l'index (sinon None)."""
+        chemin = Path(persist_dir) / FICHIER_GRILLE
+        if not OPTIONS_MATERIALISEES or not chemin.exists():
+            return None
+        with open(chemin, "r", encoding="utf-8") as f:
+            donnees = json.load(f)
+        if donnees.get("version") != version:
+            print(f"  Table d'options perimee (version {donnees.get('version')} != {version}) : "
+                  "recherche en direct, relancer data/scripts/materialiser_options.py")
+            return None
+        return cls(version, donnees["options"], donnees["masters"], donnees["contextes"], donnees.get("stats"))
+
+
+def _ids(formations: list[dict]) -> list[str]:
+    return [f["formation_id"] for f in formations if f.get("formation_id")]
+
+
+def materialiser(pipeline, villes: list[str], croiser: bool = False) -> GrilleOptions:
+    """
+    Parcourt la grille avec la recherche en direct du pipeline (memes fonctions,
+    memes plans de recherche batches) et enregistre les formation_id obtenus.
+    villes  : valeurs de contraintes_geographiques materialisees ("" = sans contrainte)
+    croiser : tous les objectifs avec tous les domaines (sinon chaque objectif
+              avec son domaine, le cas le plus frequent)
+    """
+    from src.plan_recherche import PlanRecherche
+
+    hierarchie = pipeline._predire_niveaux_etapes("terminale")
+    listes_niveaux = [hierarchie[i:] for i in range(len(hierarchie))]
+    domaines = list(OBJECTIFS_PAR_DOMAINE)
+    couples = [
+        (domaine, objectif)
+        for domaine_objectif, objectifs in OBJECTIFS_PAR_DOMAINE.items()
+        for objectif in objectifs
+        for domaine in (domaines if croiser else [domaine_objectif])
+    ]
+    couples = list(dict.fromkeys(couples))
+
+    grille = GrilleOptions(pipeline.version_grille)
+    debut = time.perf_counter()
+    for i, (domaine, objectif) in enumerate(couples, start=1):
+        profil = {"objectif_professionnel": objectif, "domaines_etudes_preferes": [domaine]}
+        for ville in villes:
+            profil_ville = {**profil, "contraintes_geographiques": ville}
+            plan = PlanRecherche(pipeline.vectorstore, pipeline.bm25)
+            with pipeline._plan_requete(plan):
+                for niveaux in listes_niveaux:
+                    pipeline._planifier_recherches(plan, niveaux, objectif, profil_ville, profil_ville, "but",
+                                                   TOP_K_CONTEXTE, TOP_K_OPTIONS, materialise=False)
+                    grille.contextes[GrilleOptions.cle_contexte(niveaux, domaine, objectif, ville)] = [
+                        [niveau, _ids(formations)]
+                        for niveau, formations in pipeline._formations_par_niveau(
+                            niveaux, objectif, profil_ville, TOP_K_CONTEXTE, materialise=False)
+                    ]
+                options = pipeline._rechercher_options_licence_but(profil_ville, "but", TOP_K_OPTIONS)
+                grille.options[GrilleOptions.cle_options(domaine, objectif, ville)] = {
+                    "licence": _ids(options["licence"]),
+                    "but": _ids(options["but"]),
+                }
+                cle_masters = GrilleOptions.cle_masters(domaine, objectif)
+                if cle_masters not in grille.masters:
+                    docs = pipeline._candidats_masters(objectif, profil_ville, materialise=False)
+                    grille.masters[cle_masters] = list(dict.fromkeys(
+                        d.metadata.get("formation_id") for d in docs if d.metadata.get("formation_id")))
+        if i % 10 == 0 or i == len(couples):
+            print(f"  {i}/{len(couples)} couples domaine x objectif ({time.perf_counter() - debut:.0f}s)")
+
+    grille.stats = {
+        "couples": len(couples),
+        "villes": len(villes),
+        "cellules": len(grille),
+        "duree_s": round(time.perf_counter() - debut, 1),
+    }
+    return grille
@@ -0,0 +1,178 @@
+# metiers.py
+# Taxonomie normalisee des metiers (debouches_metiers de toutes les formations)
+# et index inverse metier -> formation_id, construit a l'ingestion.
+# L'objectif libre de l'etudiant ("data scientist", "Ingénieur logiciel") est
+# resolu vers un ou plusieurs metiers, puis les formations sont lues en O(1).
+
+import difflib
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.data_loader import ids_formations
+from src.scoring import normaliser_texte, tokeniser
+
+load_dotenv()
+
+# Similarite minimale (0-1) pour rattacher un objectif libre a un metier
+METIER_SEUIL = float(os.getenv("METIER_SEUIL", "0.75"))
+FICHIER_METIERS = "metiers.json"
+
+# Parentheses ("(H/F)", "(ERP)"), marqueurs de genre et ponctuation ignores
+_PARENTHESES = re.compile(r"\([^)]*\)")
+_GENRE = re.compile(r"\b(h/f|f/h)\b")
+
+
+def normaliser_metier(nom: str) -> str:
+    """'Ingénieur(e) Data (H/F)' -> 'ingenieur data' : cle de la taxonomie."""
+    texte = _GENRE.sub(" ", normaliser_texte(nom or ""))
+    texte = _PARENTHESES.sub(" ", texte)
+    return " ".join(tokeniser(texte))
+
+
+def metier_id(nom_normalise: str) -> str:
+    """Identifiant stable d'un metier : empreinte du nom normalise."""
+    return hashlib.sha1(nom_normalise.encode("utf-8")).hexdigest()[:12]
+
+
+def signature_formations(formations: list[dict], ids: list[str]) -> str:
+    """Empreinte des (formation_id, debouches) : la taxonomie sauvegardee est-elle a jour ?"""
+    h = hashlib.sha256()
+    for f, fid in zip(formations, ids):
+        h.update(fid.encode("utf-8"))
+        for metier in f.get("debouches_metiers") or []:
+            h.update(b"\1" + str(metier).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class TaxonomieMetiers:
+    """
+    - metiers : metier_id -> {"nom": libelle le plus frequent, "norme": cle normalisee}
+    - postings : metier_id -> [formation_id] (liste triee, sans doublon)
+    - par_norme : cle normalisee -> metier_id (correspondance exacte en O(1))
+    - par_token : token -> [metier_id] (candidats de la resolution approchee)
+    """
+
+    def __init__(self, metiers: dict, postings: dict, signature: str = ""):
+        self.metiers = metiers
+        self.postings = postings
+        self.signature = signature
+        self.par_norme = {m["norme"]: mid for mid, m in metiers.items()}
+        self.par_token = {}
+        for mid, m in metiers.items():
+            for token in set(m["norme"].split()):
+                self.par_token.setdefault(token, []).append(mid)
+        self._resolutions = {}
+
+    def __len__(self) -> int:
+        return len(self.metiers)
+
+    @classmethod
+    def construire(cls, formations: list[dict]) -> "TaxonomieMetiers":
+        ids = ids_formations(formations)
+        libelles = {}     # norme -> Counter des libelles d'origine
+        postings = {}
+        for f, fid in zip(formations, ids):
+            for brut in f.get("debouches_metiers") or []:
+                norme = normaliser_metier(str(brut))
+                if not norme:
+                    continue
+                libelles.setdefault(norme, Counter())[str(brut).strip()] += 1
+                postings.setdefault(metier_id(norme), set()).add(fid)
+
+        metiers = {
+            metier_id(norme): {"nom": compte.most_common(1)[0][0], "norme": norme}
+            for norme, compte in libelles.items()
+        }
+        return cls(
+            metiers,
+            {mid: sorted(fids) for mid, fids in postings.items()},
+            signature_formations(formations, ids),
+        )
+
+    def sauvegarder(self, persist_dir: str):
+        """metiers.json a cote de l'index vectoriel (remplacement atomique)."""
+        Path(persist_dir).mkdir(parents=True, exist_ok=True)
+        chemin = Path(persist_dir) / FICHIER_METIERS
+        temporaire = chemin.with_suffix(".json.tmp")
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "metiers": self.metiers,
+                       "postings": self.postings}, f, ensure_ascii=False)
+        os.replace(temporaire, chemin)
+
+    @classmethod
+    def charger(cls, persist_dir: str, formations: list[dict] = None) -> "TaxonomieMetiers | None":
+        """Taxonomie sauvegardee (None si absente, ou perimee par rapport a formations)."""
+        chemin = Path(persist_dir) / FICHIER_METIERS
+        if not chemin.exists():
+            return None
+        with open(chemin, "r", encoding="utf-8") as f:
+            donnees = json.load(f)
+        if formations is not None and \
+                donnees["signature"] != signature_formations(formations, ids_formations(formations)):
+            return None
+        return cls(donnees["metiers"], donnees["postings"], donnees["signature"])
+
+    @classmethod
+    def charger_ou_construire(cls, formations: list[dict], persist_dir: str) -> "TaxonomieMetiers":
+        taxonomie = cls.charger(persist_dir, formations)
+        if taxonomie is None:
+            taxonomie = cls.construire(formations)
+            taxonomie.sauvegarder(persist_dir)
+        return taxonomie
+
+    def formations(self, mid: str) -> list[str]:
+        """formation_id des formations qui menent au metier (liste vide si inconnu)."""
+        return self.postings.get(mid, [])
+
+    def resoudre(self, objectif: str, limite: int = 5) -> list[tuple[str, float]]:
+        """
+        Metiers correspondant a un objectif libre : [(metier_id, similarite)], meilleurs d'abord.
+        1. nom normalise identique -> similarite 1.0 (lookup direct)
+        2. sinon, metiers partageant au moins un token avec l'objectif, notes par
+           difflib (fautes de frappe, pluriels) et recouvrement de tokens, filtres par METIER_SEUIL
+        """
+        norme = normaliser_metier(objectif)
+        if not norme:
+            return []
+        cle = (norme, limite)
+        if cle in self._resolutions:
+            return self._resolutions[cle]
+
+        exact = self.par_norme.get(norme)
+        if exact is not None:
+            resultat = [(exact, 1.0)]
+        else:
+            tokens = set(norme.split())
+            candidats = {mid for t in tokens for mid in self.par_token.get(t, [])}
+            if not candidats:
+                # Faute de frappe sur tous les tokens : tokens voisins du vocabulaire
+                for t in tokens:
+                    for voisin in difflib.get_close_matches(t, self.par_token, n=3, cutoff=0.8):
+                        candidats.update(self.par_token[voisin])
+            notes = []
+            for mid in candidats:
+                cible = self.metiers[mid]["norme"]
+                commun = len(tokens & set(cible.split())) / len(tokens | set(cible.split()))
+                ratio = difflib.SequenceMatcher(None, norme, cible).ratio()
+                similarite = max(ratio, commun)
+                if f" {norme} " in f" {cible} " or f" {cible} " in f" {norme} ":
+                    similarite = max(similarite, METIER_SEUIL)
+                if similarite >= METIER_SEUIL:
+                    notes.append((mid, round(similarite, 3)))
+            resultat = sorted(notes, key=lambda n: (-n[1], self.metiers[n[0]]["norme"]))[:limite]
+
+        if len(self._resolutions) >= 4096:
+            self._resolutions.clear()
+        self._resolutions[cle] = resultat
+        return resultat
+
+    def formations_objectif(self, objectif: str) -> set[str]:
+        """formation_id de toutes les formations menant aux metiers resolus pour l'objectif."""
+        return {fid for mid, _ in self.resoudre(objectif) for fid in self.formations(mid)}
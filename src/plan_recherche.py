@@ -0,0 +1,97 @@
+# plan_recherche.py
+# Plan de recherche a l'echelle d'une requete utilisateur
+# Regroupe toutes les recherches d'un parcours : un seul embedding batch,
+# une seule recherche multi-requetes, puis memoisation jusqu'a la fin de la requete
+
+import json
+import threading
+
+from langchain_core.documents import Document
+
+from src.lexical import RechercheHybride, fusion_rrf
+from src.vectorstore import rechercher_par_lot
+
+
+class PlanRecherche:
+    """
+    Collecte les recherches (requete, k, filtre) d'une generation de parcours,
+    les vectorise en un seul appel et les execute en une seule passe.
+    Expose similarity_search() comme une base vectorielle : les recherches
+    deja planifiees sont servies depuis la memoire, les autres sont executees
+    a la demande puis memorisees pour le reste de la requete.
+    Avec un index BM25, chaque recherche est hybride : les recherches lexicales
+    tournent pendant la recherche vectorielle du lot, puis fusion RRF.
+    """
+
+    def __init__(self, vectorstore, bm25=None):
+        self.vectorstore = vectorstore
+        self.hybride = RechercheHybride(vectorstore, bm25) if bm25 is not None else None
+        self._demandes = []
+        self._resultats = {}
+        self._verrou = threading.Lock()
+        self.stats = {"planifiees": 0, "memoisees": 0, "hors_plan": 0}
+
+    @staticmethod
+    def _cle(requete: str, filtre: dict = None) -> tuple:
+        return (requete, json.dumps(filtre, sort_keys=True) if filtre else "")
+
+    def ajouter(self, requete: str, k: int, filtre: dict = None):
+        """Ajoute une recherche au plan (doublons fusionnes, k max conserve)."""
+        self._demandes.append((requete, k, filtre))
+
+    def executer(self):
+        """Vectorise toutes les requetes en batch et lance la recherche multi-requetes."""
+        a_faire = {}
+        for requete, k, filtre in self._demandes:
+            cle = self._cle(requete, filtre)
+            if cle in self._resultats and self._resultats[cle][0] >= k:
+                continue
+            k_connu = a_faire.get(cle, (0, None, None))[0]
+            a_faire[cle] = (max(k, k_connu), requete, filtre)
+        self._demandes = []
+        if not a_faire:
+            return
+
+        entrees = list(a_faire.values())
+        textes = [requete for _, requete, _ in entrees]
+        embeddings = self.vectorstore.embeddings
+        if hasattr(embeddings, "embed_queries"):
+            vecteurs = embeddings.embed_queries(textes)
+        else:
+            uniques = list(dict.fromkeys(textes))
+            par_texte = dict(zip(uniques, embeddings.embed_documents(uniques)))
+            vecteurs = [par_texte[t] for t in textes]
+
+        lexical = None
+        if self.hybride is not None:
+            lexical = self.hybride.rechercher_lexical([(r, k, f) for k, r, f in entrees])
+        lots = rechercher_par_lot(
+            self.vectorstore,
+            vecteurs,
+            [k for k, _, _ in entrees],
+            [filtre for _, _, filtre in entrees],
+        )
+        if lexical is not None:
+            lots = [fusion_rrf([docs, futur.result()], k) for (k, _, _), docs, futur in zip(entrees, lots, lexical)]
+        with self._verrou:
+            for (k, requete, filtre), docs in zip(entrees, lots):
+                self._resultats[self._cle(requete, filtre)] = (k, docs)
+            self.stats["planifiees"] += len(entrees)
+        print(f"  Plan de recherche : {len(entrees)} recherches executees en un lot "
+              f"({len(set(textes))} embeddings)")
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list[Document]:
+        """Sert une recherche depuis le plan, ou l'execute puis la memorise."""
+        cle = self._cle(query, filter)
+        with self._verrou:
+            entree = self._resultats.get(cle)
+            if entree is not None and entree[0] >= k:
+                self.stats["memoisees"] += 1
+                return list(entree[1][:k])
+
+        source = self.hybride if self.hybride is not None else self.vectorstore
+        docs = source.similarity_search(query, k=k, filter=filter, **kwargs)
+        with self._verrou:
+            self._resultats[cle] = (k, docs)
+            self.stats["hors_plan"] += 1
+        return list(docs)
@@ -71,7 +71,9 @@ Progression obligatoire selon le cycle :
 === FORMATIONS REELLES DISPONIBLES (extraites de Parcoursup) ===
 Ces formations sont classees par niveau. Les PREMIERES etapes montrent le domaine actuel ({domaine_actuel}),
 les DERNIERES etapes montrent des formations proches de l'objectif final.
-Utilise UNIQUEMENT ces formations pour le champ "options". N'invente aucune formation.
+Inspire-toi de ces intitules pour les titres des etapes. N'invente aucune formation.
+Les formations proposees a chaque etape (etablissements, villes, liens) sont ajoutees
+automatiquement a partir de la base : ne les liste pas.
 {formations_disponibles}
 
 === ANALYSE DES NOTES ET DU PROFIL COMPLET (TRES IMPORTANT) ===
@@ -107,9 +109,6 @@ CENTRES D'INTERET : orienter les conseils et suggestions d'activites complementa
 5. Le titre de chaque etape doit indiquer le niveau exact : "L1 ...", "L2 ...", "L3 ...", "M1 ...", "M2 ...".
 6. Signaler clairement l'etape passerelle dans sa description si applicable.
 
-=== FORMAT OPTIONS ===
-Champ "options" de chaque etape : utiliser le NOM EXACT et l'etablissement de la liste ci-dessus.
-
 Genere le parcours en respectant EXACTEMENT ce format JSON :
 
 {{
@@ -117,18 +116,7 @@ Genere le parcours en respectant EXACTEMENT ce format JSON :
   "adequation_profil": "Analyse des notes, du domaine actuel et de la coherence avec le parcours propose.",
   "etapes": [
     {{
-      "numero": 1,
       "titre": "Titre precis (ex: L3 Economie-Statistiques, M1 Econometrie...)",
-      "options": [
-        {{
-          "nom": "Nom exact de la formation (de la liste ci-dessus)",
-          "etablissement": "Etablissement exact",
-          "ville": "Ville",
-          "exigences_notes": {{"Matiere": ">= 13"}}
-        }}
-      ],
-      "duree": "1 an",
-      "periode": "Septembre 2025 - Juin 2026",
       "description": "Pourquoi cette etape. Si passerelle : expliquer le pont entre {domaine_actuel} et l'objectif.",
       "competences_visees": ["Competence acquise"],
       "objectifs": ["Objectif de l'etape"],
@@ -169,6 +157,54 @@ Reponds UNIQUEMENT avec le JSON, sans texte avant ou apres.
 )
 
 
+# Profil passe a PROMPT_PARCOURS pour generer un squelette reutilisable
+# (formation, objectif, cycle, niveau) : la personnalisation vient ensuite
+PROFIL_SQUELETTE = """Squelette generique : aucun profil individuel.
+Genere un parcours valable pour tout etudiant de ce niveau qui vise cet objectif.
+Les champs adequation_profil, conseils_personnalises et defis seront personnalises ensuite :
+reste general et bref pour ces champs."""
+
+
+# Prompt court : personnalise un squelette de parcours pour un etudiant
+# (seuls l'adequation au profil, les conseils et les risques sont reecrits)
+PROMPT_PERSONNALISATION = PromptTemplate(
+    input_variables=["profil_etudiant", "formation_cible", "objectif", "etapes"],
+    template="""Tu es un conseiller d'orientation. Un parcours a deja ete construit pour la formation
+"{formation_cible}" et l'objectif "{objectif}". Etapes du parcours :
+{etapes}
+
+=== PROFIL DE L'ETUDIANT ===
+{profil_etudiant}
+
+Personnalise ce parcours pour CET etudiant (notes, competences, budget, contraintes geo,
+alternance, centres d'interet). Ne modifie pas les etapes. Sois concis.
+
+Reponds UNIQUEMENT avec ce JSON :
+{{
+  "adequation_profil": "2-3 phrases : coherence des notes et du profil avec le parcours",
+  "conseils_personnalises": ["Conseil 1", "Conseil 2", "Conseil 3"],
+  "defis": [{{"defi": "Risque lie au profil", "solution": "Solution concrete"}}],
+  "conseils_etapes": [["Conseil pour l'etape 1", "Conseil 2"], ["Conseils de l'etape 2"]]
+}}
+"""
+)
+
+
+# Reparation ciblee : un seul champ invalide d'une reponse JSON, le reste est conserve
+PROMPT_REPARATION_CHAMP = PromptTemplate(
+    input_variables=["champ", "erreur", "valeur", "format", "contexte"],
+    template="""Dans un parcours d'orientation au format JSON, le champ "{champ}" est invalide : {erreur}.
+Valeur actuelle : {valeur}
+Format attendu : {format}
+Contexte : {contexte}
+
+Corrige uniquement ce champ, en francais, sans rien inventer d'autre.
+Reponds UNIQUEMENT avec ce JSON :
+{{"valeur": <valeur corrigee du champ>}}
+"""
+)
+
+
 # Prompt pour re-personnaliser le parcours apres un choix de l'etudiant
 PROMPT_SUITE_PARCOURS = PromptTemplate(
     input_variables=[
@@ -192,7 +228,7 @@ Cycle           : {cycle}
 {formation_cible}
 
 === FORMATIONS REELLES DISPONIBLES (Parcoursup) ===
-Utilise UNIQUEMENT ces formations comme options. N'invente aucune formation.
+Inspire-toi de ces intitules pour les titres des etapes. N'invente aucune formation.
 {formations_disponibles}
 
 === REGLES ===
@@ -200,24 +236,13 @@ Utilise UNIQUEMENT ces formations comme options. N'invente aucune formation.
 2. Rester coherent avec les choix confirmes (meme ville, meme domaine ou passerelle si besoin).
 3. Si {domaine_actuel} differe du domaine de l'objectif, introduire une etape passerelle progressive.
 4. Ne saute aucune annee (L3 -> M1 -> M2 ou BUT 2 -> BUT 3 -> Licence Pro).
-5. Utilise le NOM EXACT des formations de la liste.
+5. Les formations de chaque etape (etablissements, villes, liens) sont ajoutees automatiquement : ne les liste pas.
 
 Reponds UNIQUEMENT avec ce JSON :
 {{
   "etapes": [
     {{
-      "numero": 1,
       "titre": "Titre coherent avec {niveau_atteint} et {cycle}",
-      "options": [
-        {{
-          "nom": "Nom exact de la liste",
-          "etablissement": "Etablissement",
-          "ville": "Ville",
-          "exigences_notes": {{"Matiere": ">= 12"}}
-        }}
-      ],
-      "duree": "1 an",
-      "periode": "Septembre XXXX - Juin XXXX",
       "description": "Coherent avec les choix confirmes et la transition vers l'objectif",
       "competences_visees": ["Competence"],
       "objectifs": ["Objectif"],
@@ -5,30 +5,72 @@
 
 import os
 import json
+import math
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from itertools import chain, islice
 from pathlib import Path
 
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 
-from src.vectorstore import initialiser_vectorstore, get_retriever, creer_vectorstore
-from src.data_loader import charger_documents
-from src.prompt_templates import PROMPT_PARCOURS, PROMPT_SUITE_PARCOURS
+from src.vectorstore import (
+    EMBEDDING_MODEL, initialiser_vectorstore, get_retriever, creer_vectorstore, construire_filtre,
+    documents_indexes, synchroniser_vectorstore, verifier_index, partitionner_vectorstore,
+)
+from src.cache_llm import FICHIER_CACHE_LLM, LLM_CACHE, CacheReponsesLLM, empreinte
+from src.data_loader import charger_documents, charger_formations
+from src.geo import ACADEMIES, RAYON_PROXIMITE_KM, TableVilles
+from src.lexical import RECHERCHE_HYBRIDE, IndexBM25, RechercheHybride
+from src.materialisation import TOP_K_CONTEXTE, TOP_K_OPTIONS, GrilleOptions, version_grille
+from src.metiers import TaxonomieMetiers
+from src.plan_recherche import PlanRecherche
+from src.referentiel import DOMAINE_VERS_BD
+from src.scoring import IndexScoring, classer_par_score, classer_recommandations, normaliser_texte, scores_masters
+from src.selectivite import (
+    StatistiquesMetadonnees, StatsRecherche, SuiviRecherche, candidats_progressifs, cle_formation, tour_par_tour,
+)
+from src.prompt_templates import (
+    PROFIL_SQUELETTE, PROMPT_PARCOURS, PROMPT_PERSONNALISATION, PROMPT_REPARATION_CHAMP, PROMPT_SUITE_PARCOURS,
+)
+from src.schema_parcours import (
+    FORMATS_CHAMPS, GENERATION_JSON, REPARATION_MAX_CHAMPS, Etape, EtapesIncrementales, MetriquesGeneration,
+    Parcours, Personnalisation, SuiteParcours, champs_invalides, ecrire_champ, extraire_json, lire_champ, valider,
+)
 
 load_dotenv()
 
+# Squelettes de parcours reutilisables par (formation, objectif, cycle, niveaux)
+# + passe courte de personnalisation ("0" = un PROMPT_PARCOURS complet par requete)
+PARCOURS_SQUELETTES = os.getenv("PARCOURS_SQUELETTES", "1") == "1"
+# Budget de sortie de la personnalisation (un parcours complet en demande 5 a 8 fois plus)
+PERSONNALISATION_MAX_TOKENS = int(os.getenv("PERSONNALISATION_MAX_TOKENS", "600"))
 
-def get_llm():
+
+class GenerationInterrompue(Exception):
+    """Generation en flux abandonnee par le client (cf. generer_parcours_flux)."""
+
+
+def get_llm(max_tokens: int = None, json_mode: bool = False):
     """
     Initialise le modele de langage en fonction du fournisseur
     configure dans le fichier .env (openai, groq ou ollama).
+    max_tokens : borne la longueur de la reponse (None = defaut du fournisseur).
+    json_mode  : sortie contrainte a un objet JSON (response_format / format=json).
     """
     provider = os.getenv("LLM_PROVIDER", "openai").lower()
+    format_json = {"response_format": {"type": "json_object"}} if json_mode else {}
 
     if provider == "openai":
         from langchain_openai import ChatOpenAI
         return ChatOpenAI(
             model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
             temperature=0.3,
+            max_tokens=max_tokens,
+            model_kwargs=format_json,
             api_key=os.getenv("OPENAI_API_KEY"),
         )
     
@@ -37,6 +79,8 @@ def get_llm():
         return ChatGroq(
             model=os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"),
             temperature=0.3,
+            max_tokens=max_tokens,
+            model_kwargs=format_json,
             api_key=os.getenv("GROQ_API_KEY"),
         )
     
@@ -46,6 +90,8 @@ def get_llm():
             model=os.getenv("OLLAMA_MODEL", "mistral"),
             base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
             temperature=0.3,
+            num_predict=max_tokens,
+            format="json" if json_mode else None,
         )
     
     else:
@@ -171,15 +217,43 @@ class PipelineRAG:
 
     def __init__(self):
         self.vectorstore = None
+        self.persist_dir = None
         self.retriever = None
         self.llm = None
+        # LLM a sortie bornee pour la passe de personnalisation (None = self.llm)
+        self.llm_court = None
         self.chain = None
         self._initialise = False
-
-    def initialiser(self, data_dir: str = None, rebuild: bool = False):
+        # Plan de recherche actif, propre a chaque thread (une requete = un plan)
+        self._local = threading.local()
+        self._executeur = None
+        # Table canonique des villes / academies (IDs entiers + postings)
+        self.villes = None
+        # Caracteristiques pre-calculees des documents pour le re-classement
+        self.scoring = None
+        # Cardinalites des metadonnees (k adaptatif) et compteurs des recherches
+        self.selectivite = None
+        self.stats_recherche = StatsRecherche()
+        # Validation des reponses du LLM : lectures, reparations, echecs (/stats/generation)
+        self.metriques_generation = MetriquesGeneration()
+        # Index lexical BM25 (recherche hybride) et facade vecteurs + BM25
+        self.bm25 = None
+        self.recherche = None
+        # Taxonomie des metiers (metier -> formation_id) et document de chaque formation
+        self.metiers = None
+        self.docs_par_formation = {}
+        # Options / contextes pre-calcules pour la grille du formulaire (None = tout en direct)
+        self.grille = None
+        self.version_grille = None
+        # Reponses du LLM deja generees (prompt identique ou profil proche), None = desactive
+        self.cache_llm = None
+        # Squelettes de parcours par (formation, objectif, cycle, niveaux), None = desactive
+        self.cache_squelettes = None
+
+    def initialiser(self, data_dir: str = None, rebuild: bool = False, avec_llm: bool = True):
         """
         Initialise le pipeline : charge ou cree la base vectorielle
-        et configure le LLM.
+        et configure le LLM (avec_llm=False pour les scripts hors ligne).
         """
         print("=== Initialisation du pipeline RAG ===\n")
 
@@ -188,158 +262,300 @@ class PipelineRAG:
         persist_dir = os.getenv("CHROMA_PERSIST_DIR", "./data/chroma_db")
         if not Path(persist_dir).is_absolute():
             persist_dir = str(project_root / persist_dir)
+        self.persist_dir = persist_dir
 
         # Charger ou creer la base vectorielle
-        if rebuild or not Path(persist_dir).exists():
+        documents = charger_documents(data_dir)
+        if not Path(persist_dir).exists():
             print("Creation de la base vectorielle...")
-            documents = charger_documents(data_dir)
             self.vectorstore = creer_vectorstore(documents, persist_dir)
+        elif rebuild:
+            print("Mise a jour de la base vectorielle...")
+            self.vectorstore = synchroniser_vectorstore(documents, persist_dir)
         else:
             print("Chargement de la base vectorielle existante...")
             self.vectorstore = initialiser_vectorstore(data_dir, persist_dir)
+            self._verifier_index(documents, persist_dir)
+
+        # Index en memoire decoupe par type de diplome (VECTOR_PARTITIONS) + routeur
+        self.vectorstore = partitionner_vectorstore(self.vectorstore)
+
+        # Table des villes : memes IDs que les metadonnees ville_id / academie_id
+        formations = charger_formations(data_dir)
+        self.villes = TableVilles.depuis_formations(formations)
+        print(f"Table des villes : {len(self.villes.postings)} villes, "
+              f"{len(self.villes.villes_par_academie)} academies, "
+              f"{len(self.villes.coordonnees)} geolocalisees")
+
+        # Tokens normalises + colonnes numeriques de chaque document (re-classement NumPy)
+        docs_index = documents_indexes(self.vectorstore)
+        self.scoring = IndexScoring.depuis_documents(docs_index)
+        print(f"Index de scoring : {len(self.scoring)} documents encodes")
+        self.selectivite = StatistiquesMetadonnees.depuis_documents(docs_index)
+        print(f"Statistiques de selectivite : {self.selectivite.doublons:.2f} documents par formation")
+
+        # Index BM25 sauvegarde a cote de l'index vectoriel (reconstruit s'il est perime)
+        self.bm25 = None
+        self.recherche = self.vectorstore
+        if RECHERCHE_HYBRIDE and docs_index:
+            self.bm25 = IndexBM25.charger_ou_construire(docs_index, persist_dir)
+            self.recherche = RechercheHybride(self.vectorstore, self.bm25)
+            print(f"Index BM25 : {len(self.bm25.tokens)} termes, recherche hybride active")
+
+        # Index inverse metier -> formations (construit a l'ingestion, reconstruit s'il est perime)
+        self.metiers = TaxonomieMetiers.charger_ou_construire(formations, persist_dir)
+        self.docs_par_formation = {}
+        for doc in docs_index:
+            self.docs_par_formation.setdefault(doc.metadata.get("formation_id"), doc)
+        print(f"Taxonomie des metiers : {len(self.metiers)} metiers, "
+              f"{sum(len(f) for f in self.metiers.postings.values())} liens metier -> formation")
+
+        # Table materialisee des options (data/scripts/materialiser_options.py), si a jour
+        self.version_grille = version_grille(docs_index, self.metiers)
+        self.grille = GrilleOptions.charger(persist_dir, self.version_grille)
+        if self.grille is not None:
+            print(f"Table d'options materialisee : {len(self.grille)} cellules (version {self.version_grille})")
+
+        # Cache sqlite des reponses du LLM, vide quand l'index ou les modeles changent
+        self.cache_llm = None
+        self.cache_squelettes = None
+        if LLM_CACHE:
+            chemin_cache = Path(persist_dir) / FICHIER_CACHE_LLM
+            self.cache_llm = CacheReponsesLLM(chemin_cache, self._version_cache_llm())
+            print(f"Cache des reponses LLM : {len(self.cache_llm)} reponses")
+            if PARCOURS_SQUELETTES:
+                self.cache_squelettes = CacheReponsesLLM(chemin_cache, self._version_cache_llm(), table="squelettes")
+                print(f"Squelettes de parcours : {len(self.cache_squelettes)} en cache")
 
         # Configurer le retriever
         self.retriever = get_retriever(self.vectorstore)
         print("Retriever configure\n")
 
         # Configurer le LLM
-        print("Configuration du LLM...")
-        self.llm = get_llm()
-        print(f"LLM configure ({os.getenv('LLM_PROVIDER', 'openai')})\n")
+        if avec_llm:
+            print("Configuration du LLM...")
+            self.llm = get_llm(json_mode=GENERATION_JSON)
+            self.llm_court = get_llm(max_tokens=PERSONNALISATION_MAX_TOKENS, json_mode=GENERATION_JSON)
+            print(f"LLM configure ({os.getenv('LLM_PROVIDER', 'openai')})\n")
 
         self._initialise = True
         print("=== Pipeline pret ===\n")
 
-    # Mapping des academies francaises vers leurs villes principales
-    ACADEMIES = {
-        "aix-marseille": ["marseille", "aix-en-provence", "avignon", "arles", "salon-de-provence", "gap", "digne"],
-        "amiens": ["amiens", "beauvais", "compiegne", "laon", "saint-quentin", "soissons"],
-        "besancon": ["besancon", "belfort", "montbeliard", "lons-le-saunier", "vesoul"],
-        "bordeaux": ["bordeaux", "pau", "agen", "perigueux", "bayonne", "mont-de-marsan", "libourne"],
-        "caen": ["caen", "rouen", "le havre", "cherbourg", "lisieux", "evreux", "alencon", "vire"],
-        "clermont-ferrand": ["clermont-ferrand", "aurillac", "le puy-en-velay", "moulins", "montlucon", "vichy"],
-        "corse": ["ajaccio", "bastia", "corte"],
-        "creteil": ["creteil", "bobigny", "villetaneuse", "aubervilliers", "evry", "melun", "meaux", "fontainebleau"],
-        "dijon": ["dijon", "auxerre", "nevers", "macon", "chalon-sur-saone", "le creusot"],
-        "grenoble": ["grenoble", "annecy", "chambery", "valence", "bourg-en-bresse"],
-        "guadeloupe": ["pointe-a-pitre", "les abymes"],
-        "guyane": ["cayenne", "kourou"],
-        "la reunion": ["saint-denis", "le tampon", "saint-pierre"],
-        "lille": ["lille", "roubaix", "tourcoing", "dunkerque", "calais", "arras", "lens", "douai", "valenciennes"],
-        "limoges": ["limoges", "brive", "gueret", "tulle"],
-        "lyon": ["lyon", "villeurbanne", "saint-etienne", "roanne", "bourg-en-bresse"],
-        "martinique": ["fort-de-france", "schoelcher"],
-        "mayotte": ["dembeni", "mamoudzou"],
-        "montpellier": ["montpellier", "nimes", "perpignan", "beziers", "carcassonne", "mende", "narbonne"],
-        "nancy-metz": ["nancy", "metz", "strasbourg", "epinal", "bar-le-duc", "verdun"],
-        "nantes": ["nantes", "angers", "le mans", "laval", "la roche-sur-yon", "saint-nazaire"],
-        "nice": ["nice", "cannes", "antibes", "menton", "toulon", "draguignan", "grasse"],
-        "orleans-tours": ["orleans", "tours", "blois", "bourges", "chartres", "chateauroux"],
-        "paris": ["paris", "nanterre", "orsay", "guyancourt", "versailles", "saint-germain-en-laye",
-                   "sceaux", "boulogne-billancourt", "neuilly", "saint-cloud", "massy", "saclay",
-                   "cergy", "pontoise", "saint-denis", "montreuil"],
-        "poitiers": ["poitiers", "la rochelle", "niort", "angouleme", "chatellerault"],
-        "reims": ["reims", "troyes", "chalons-en-champagne", "charleville-mezieres"],
-        "rennes": ["rennes", "brest", "quimper", "vannes", "lorient", "saint-brieuc", "saint-malo"],
-        "strasbourg": ["strasbourg", "mulhouse", "colmar", "haguenau"],
-        "toulouse": ["toulouse", "tarbes", "albi", "montauban", "rodez", "cahors", "auch", "castres", "foix"],
-        "versailles": ["versailles", "guyancourt", "saint-quentin-en-yvelines", "poissy", "mantes-la-jolie",
-                        "boulogne-billancourt", "nanterre", "cergy", "pontoise", "evry-courcouronnes"],
-    }
+    def _version_cache_llm(self) -> str:
+        """Version des reponses en cache : index (documents, taxonomie), modele LLM et modele d'embedding."""
+        provider = os.getenv("LLM_PROVIDER", "openai").lower()
+        modele = os.getenv(f"{provider.upper()}_MODEL", "")
+        return empreinte(self.version_grille, provider, modele, EMBEDDING_MODEL)[:16]
 
-    def _extraire_villes(self, contrainte_geo: str) -> list[str]:
+    def _verifier_index(self, documents: list[Document], persist_dir: str):
         """
-        Extrait les noms de villes a partir de la contrainte geographique.
-        Ex: 'Paris ou Lyon' -> ['paris', 'lyon']
-        Ex: 'Marseille' -> ['marseille']
+        Detecte un index en retard sur le JSON (manifeste, nombre de vecteurs) ;
+        applique le delta si SYNCHRO_INDEX_AUTO est actif (par defaut). Un index sans
+        manifeste (ancienne indexation) ne peut pas etre verifie : il est reconstruit.
         """
-        if not contrainte_geo:
-            return []
-        import re
-        parts = re.split(r'[,]|\bou\b|\bet\b', contrainte_geo.lower())
-        villes = [v.strip() for v in parts if v.strip()]
-        return villes
+        etat = verifier_index(self.vectorstore, documents, persist_dir)
+        if etat["a_jour"]:
+            print(f"Index a jour ({etat['nb_vecteurs']} vecteurs)")
+            return
+        if not etat["manifeste"]:
+            print("  ATTENTION: index sans manifeste (ancienne indexation), impossible de verifier "
+                  "qu'il est a jour.")
+        else:
+            print(f"  ATTENTION: index en retard sur les donnees ({etat})")
+        if os.getenv("SYNCHRO_INDEX_AUTO", "1") == "1":
+            # Sans manifeste, synchroniser_vectorstore reconstruit tout l'index
+            self.vectorstore = synchroniser_vectorstore(documents, persist_dir, self.vectorstore.embeddings)
+        elif not etat["manifeste"]:
+            print("  Relancer ingest.py ou POST /rebuild-vectorstore.")
+
+    def _index(self):
+        """
+        Retourne la source des recherches : le plan de la requete en cours
+        s'il y en a un (resultats batches et memorises), sinon la base vectorielle.
+        """
+        plan = getattr(self._local, "plan", None)
+        if plan is not None:
+            return plan
+        return self.recherche if self.recherche is not None else self.vectorstore
+
+    @contextmanager
+    def _plan_requete(self, plan: PlanRecherche):
+        """Active un plan de recherche pour le thread courant."""
+        precedent = getattr(self._local, "plan", None)
+        self._local.plan = plan
+        try:
+            yield plan
+        finally:
+            self._local.plan = precedent
+
+    # Mapping des academies francaises vers leurs villes principales (src/geo.py)
+    ACADEMIES = ACADEMIES
+
+    def _table_villes(self) -> TableVilles:
+        """Table des villes, construite a la demande si le pipeline n'a pas ete initialise."""
+        if self.villes is None:
+            self.villes = TableVilles.depuis_formations(charger_formations())
+        return self.villes
 
-    def _trouver_villes_proches(self, ville: str) -> list[str]:
+    def _extraire_villes(self, contrainte_geo: str) -> list[int]:
         """
-        Trouve les villes proches via le mapping des academies.
-        Ex: 'avignon' -> ['marseille', 'aix-en-provence', ...]
+        Extrait les IDs des villes (metadonnee ville_id) de la contrainte geographique.
+        Ex: 'Paris ou Lyon' -> [id('paris'), id('lyon')]
+        Ex: 'Aix en Provence' -> [id('aix-en-provence')]
         """
-        ville = ville.lower()
-        for academie, villes_aca in self.ACADEMIES.items():
-            if ville in villes_aca or any(ville in v for v in villes_aca):
-                # Retourner toutes les villes de l'academie sauf la ville demandee
-                return [v for v in villes_aca if v != ville]
-        return []
+        return self._table_villes().resoudre(contrainte_geo)[0]
 
-    def _rechercher_avec_filtre_geo(self, requete: str, villes: list[str], top_k: int = 5) -> tuple:
+    def _trouver_villes_proches(self, ville_ids: list[int]) -> list[int]:
+        """
+        Trouve les villes proches, de la plus proche a la plus lointaine :
+        d'abord les villes a moins de RAYON_PROXIMITE_KM (grille spatiale),
+        sinon l'union des villes des memes academies.
+        Ex: [id('avignon')] -> [id('arles'), id('salon-de-provence'), ...]
+        """
+        table = self._table_villes()
+        proches = [vid for vid, _ in table.villes_dans_rayon(ville_ids)]
+        return proches or table.villes_meme_academie(ville_ids)
+
+    def _score_distance(self, ville_id: int, ville_ids: list[int]) -> float:
+        """
+        Score geographique decroissant avec la distance aux villes demandees :
+        1 dans la ville, ~0.37 a RAYON_PROXIMITE_KM, 0 si la distance est inconnue.
+        """
+        d = self._table_villes().distance_min(ville_id, ville_ids)
+        return 0.0 if d is None else math.exp(-d / RAYON_PROXIMITE_KM)
+
+    def _index_scoring(self) -> IndexScoring:
+        """Index de scoring, rempli a la volee si le pipeline n'a pas ete initialise."""
+        if self.scoring is None:
+            self.scoring = IndexScoring()
+        return self.scoring
+
+    def _selectivite(self) -> StatistiquesMetadonnees:
+        """Statistiques de cardinalite, calculees a la demande si le pipeline n'a pas ete initialise."""
+        if self.selectivite is None:
+            self.selectivite = StatistiquesMetadonnees.depuis_documents(documents_indexes(self.vectorstore))
+        return self.selectivite
+
+    def _noms_villes(self, ville_ids: list[int], hors_catalogue: dict = None) -> list[str]:
+        """
+        IDs de villes -> noms normalises (pour info_geo et les logs) ;
+        hors_catalogue : noms des villes inconnues de la table (cf. TableVilles.resoudre).
+        """
+        table = self._table_villes()
+        hors_catalogue = hors_catalogue or {}
+        return [table.nom(v) or hors_catalogue.get(v, "") for v in ville_ids]
+
+    def _k_recherche(self, voulus: int, filtre: dict = None, pool: bool = False) -> int:
+        """
+        k demande a l'index pour un filtre, estime par les statistiques de cardinalite :
+        - voulus formations distinctes (doublons + marge), ou
+        - pool=True : voulus candidats a re-classer
+        borne par le nombre de documents du filtre (0 = recherche inutile).
+        """
+        if pool:
+            return self._selectivite().k_candidats(voulus, filtre)
+        return self._selectivite().k_formations(voulus, filtre)
+
+    def _specs_par_ville(
+        self, requete: str, ville_ids: list[int], voulus: int, types_diplome=None, pool: bool = False
+    ) -> list:
+        """
+        Recherches (requete, k, filtre) d'une contrainte multi-villes :
+        une recherche par ville, pour que chaque ville ait ses propres top-k
+        (sinon 'Paris ou Lyon' peut ne retourner que des formations parisiennes).
+        k est estime par filtre ; les filtres sans aucun document ne sont pas recherches.
+        """
+        if len(ville_ids) <= 1:
+            filtres = [construire_filtre(types_diplome, ville_ids)]
+        else:
+            filtres = [construire_filtre(types_diplome, [vid]) for vid in ville_ids]
+        specs = [(requete, self._k_recherche(voulus, f, pool), f) for f in filtres]
+        return [spec for spec in specs if spec[1] > 0]
+
+    def _generer_specs(self, specs: list, suivi: SuiviRecherche):
+        """
+        Candidats des recherches par ville, fusionnes tour par tour et generes a la demande :
+        chaque recherche repart avec un k plus grand si ses candidats sont epuises.
+        """
+        generateurs = []
+        for requete, k, filtre in specs:
+            if k <= 0:
+                continue
+            cardinalite, exacte = self._selectivite().estimer(filtre)
+            suivi.estimation += cardinalite
+            generateurs.append(candidats_progressifs(
+                lambda k_spec, r=requete, f=filtre: self._index().similarity_search(r, k=k_spec, filter=f),
+                k, suivi, borne=cardinalite if exacte else None,
+            ))
+        return generateurs[0] if len(generateurs) == 1 else tour_par_tour(generateurs)
+
+    def _rechercher_specs(self, specs: list, k: int, requete: str = "") -> list:
+        """Execute les recherches par ville et fusionne les top-k (tour par tour)."""
+        suivi = SuiviRecherche(k)
+        docs = list(islice(self._generer_specs(specs, suivi), k))
+        suivi.retenus = len(docs)
+        self.stats_recherche.enregistrer(suivi, requete or (specs[0][0] if specs else ""))
+        return docs
+
+    def _rechercher_avec_filtre_geo(
+        self, requete: str, villes: list[int], top_k: int = 5, types_diplome=None, noms: list[str] = None
+    ) -> tuple:
         """
         Recherche des formations avec priorite geographique.
+        Les filtres ville_id / type_diplome sont appliques dans l'index :
+        chaque recherche ne retourne que des candidats utiles.
         Retourne (documents, info_geo) avec info_geo indiquant
         les villes trouvees ou les villes proches utilisees.
+        noms : noms des villes demandees, y compris hors catalogue (cf. _noms_villes).
         """
-        over_fetch = max(80, top_k * 16)   # augmente pour avoir plus de candidats a re-classer
-        tous_docs = self.vectorstore.similarity_search(requete, k=over_fetch)
+        pool = max(50, top_k * 10)   # candidats a re-classer par recommander_formations
+        noms = noms if noms is not None else self._noms_villes(villes)
 
-        # Separer : ville exacte vs autres
-        docs_ville = []
-        docs_autres = []
+        # k borne par le nombre de documents de chaque ville (aucune recherche si la ville n'en a pas)
+        specs = self._specs_par_ville(requete, villes, pool, types_diplome, pool=True)
+        docs_ville = self._rechercher_specs(specs, pool, requete)
+        print(f"  {len(docs_ville)} formations dans la ville exacte")
 
-        for doc in tous_docs:
-            ville_meta = (doc.metadata.get("ville", "") or "").lower()
-            contenu = doc.page_content.lower()
-            match = any(v in ville_meta or v in contenu for v in villes)
-            if match:
-                docs_ville.append(doc)
-            else:
-                docs_autres.append(doc)
-
-        print(f"  {len(docs_ville)} formations dans la ville exacte (sur {len(tous_docs)} recuperees)")
+        villes_proches = self._trouver_villes_proches(villes)
 
         # Si on a trouve des formations dans la ville exacte
         if docs_ville:
-            resultats = docs_ville[:top_k]
-            if len(resultats) < top_k:
-                resultats.extend(docs_autres[:top_k - len(resultats)])
-            return resultats, {"type": "exact", "villes": villes}
-
-        # Sinon, chercher dans les villes proches (meme academie)
-        print(f"  Aucune formation trouvee dans {villes}, recherche de villes proches...")
-        villes_proches = []
-        for v in villes:
-            villes_proches.extend(self._trouver_villes_proches(v))
-        villes_proches = list(set(villes_proches))
+            if len(docs_ville) < top_k:
+                # Completer avec les villes proches (rayon / academie), sinon toute la France
+                # top_k suffit : au plus len(docs_ville) resultats sont dans les villes exactes
+                filtre = construire_filtre(types_diplome, villes_proches)
+                docs_autres = self._rechercher_specs(
+                    [(requete, self._k_recherche(top_k, filtre, pool=True), filtre)], top_k, requete
+                )
+                docs_autres = [d for d in docs_autres if d.metadata.get("ville_id") not in villes]
+                docs_ville.extend(docs_autres[:top_k - len(docs_ville)])
+            return docs_ville, {"type": "exact", "villes": noms}
+
+        # Sinon, chercher dans les villes proches (rayon, puis meme academie)
+        print(f"  Aucune formation trouvee dans {noms}, recherche de villes proches...")
 
         if villes_proches:
-            docs_proches = []
-            for doc in tous_docs:
-                ville_meta = (doc.metadata.get("ville", "") or "").lower()
-                contenu = doc.page_content.lower()
-                match = any(v in ville_meta or v in contenu for v in villes_proches)
-                if match:
-                    docs_proches.append(doc)
-
-            print(f"  {len(docs_proches)} formations dans les villes proches : {villes_proches[:5]}")
+            filtre = construire_filtre(types_diplome, villes_proches)
+            docs_proches = self._rechercher_specs(
+                [(requete, self._k_recherche(pool, filtre, pool=True), filtre)], pool, requete
+            )
+            print(f"  {len(docs_proches)} formations dans les villes proches : "
+                  f"{self._noms_villes(villes_proches[:5])}")
 
             if docs_proches:
-                # Trouver les villes effectivement matchees
-                villes_trouvees = set()
-                for doc in docs_proches:
-                    ville_meta = (doc.metadata.get("ville", "") or "").lower()
-                    for v in villes_proches:
-                        if v in ville_meta:
-                            villes_trouvees.add(v)
-                resultats = docs_proches[:top_k]
-                if len(resultats) < top_k:
-                    resultats.extend(docs_autres[:top_k - len(resultats)])
-                return resultats, {
+                # Villes effectivement trouvees
+                villes_trouvees = {d.metadata.get("ville_id") for d in docs_proches}
+                villes_trouvees = [v for v in villes_proches if v in villes_trouvees]
+                return docs_proches, {
                     "type": "proximite",
-                    "ville_demandee": villes,
-                    "villes_proches": list(villes_trouvees)[:5]
+                    "ville_demandee": noms,
+                    "villes_proches": self._noms_villes(villes_trouvees[:5])
                 }
 
         # Aucune ville proche trouvee non plus
-        return tous_docs[:top_k], {"type": "aucune", "villes": villes}
+        filtre = construire_filtre(types_diplome)
+        docs = self._rechercher_specs([(requete, self._k_recherche(pool, filtre, pool=True), filtre)], pool, requete)
+        return docs, {"type": "aucune", "villes": noms}
 
     def recommander_formations(self, profil: dict, top_k: int = 5) -> tuple:
         """
@@ -347,7 +563,7 @@ class PipelineRAG:
         Retourne (formations, info_geo).
 
         Ameliorations :
-        - over_fetch augmente pour avoir plus de candidats a re-classer
+        - pool de candidats a re-classer, borne par le nombre de documents du filtre
         - Re-ranking par type_diplome en fonction du niveau actuel :
           L3/M1/M2 -> Masters en priorite | L2 -> Masters puis Licences | Terminale/L1 -> Licences
         - Le domaine de l'etudiant est privilegie dans le re-classement
@@ -363,39 +579,36 @@ class PipelineRAG:
 
         # Extraire les villes de la contrainte geographique
         contrainte_geo = profil.get("contraintes_geographiques", profil.get("contraintes", ""))
-        villes = self._extraire_villes(contrainte_geo)
+        villes, hors_catalogue = self._table_villes().resoudre(contrainte_geo)
 
-        # Recherche avec ou sans filtre geographique
-        info_geo = None
-        if villes:
-            print(f"  Filtre geographique actif : {villes}")
-            docs, info_geo = self._rechercher_avec_filtre_geo(requete, villes, top_k)
-        else:
-            docs = self.vectorstore.similarity_search(requete, k=max(50, top_k * 10))
-            docs = docs[:max(50, top_k * 10)]
-
-        # --- Filtre dur + Re-ranking : type accessible au niveau, puis domaine de l'etudiant ---
+        # --- Filtre dur : type accessible au niveau, applique dans l'index ---
+        # Pas de fallback — un L1 ne voit jamais un Master, meme si peu de Licences disponibles
         niveau_actuel   = profil.get("niveau_actuel", "")
         types_preferes  = self._niveau_vers_types_preferes(niveau_actuel)
         domaines_bd     = self._domaines_profil_vers_bd(profil.get("domaines_etudes_preferes", []))
         print(f"  Niveau actuel : {niveau_actuel} -> types preferes : {types_preferes}")
         print(f"  Domaines BD attendus : {domaines_bd}")
 
-        # Filtre dur : garder UNIQUEMENT les types accessibles au niveau de l'etudiant
-        # Pas de fallback — un L1 ne voit jamais un Master, meme si peu de Licences disponibles
-        docs_filtres = [d for d in docs if d.metadata.get("type_diplome", "") in types_preferes]
-
-        def score_doc(doc):
-            td  = doc.metadata.get("type_diplome", "")
-            dom = doc.metadata.get("domaine", "")
-            # rang du type prefere (0 = meilleur) — priorite absolue sur le domaine
-            type_score   = types_preferes.index(td) if td in types_preferes else len(types_preferes) + 10
-            # 0 = domaine de l'etudiant, 1 = autre domaine
-            domain_score = 0 if (domaines_bd and dom in domaines_bd) else 1
-            return (type_score, domain_score)
+        # Recherche avec ou sans filtre geographique
+        info_geo = None
+        if villes:
+            noms = self._noms_villes(villes, hors_catalogue)
+            print(f"  Filtre geographique actif : {noms}")
+            docs, info_geo = self._rechercher_avec_filtre_geo(requete, villes, top_k, types_preferes, noms)
+        else:
+            pool = max(50, top_k * 10)
+            filtre = construire_filtre(types_preferes)
+            docs = self._rechercher_specs(
+                [(requete, self._k_recherche(pool, filtre, pool=True), filtre)], pool, requete
+            )
 
-        docs = sorted(docs_filtres, key=score_doc)[:top_k]
-        print(f"{len(docs)} formations recommandees (apres re-ranking domaine + niveau)\n")
+        # --- Re-ranking : type prefere, puis domaine de l'etudiant, puis distance ---
+        # Distance par paliers de 0.1 : a distance comparable, l'ordre de similarite est conserve
+        score_ville = (lambda vid: round(self._score_distance(vid, villes), 1)) if villes else None
+        docs = classer_recommandations(
+            self._index_scoring(), docs, types_preferes, domaines_bd, score_ville
+        )[:top_k]
+        print(f"{len(docs)} formations recommandees (apres re-ranking domaine + niveau + distance)\n")
 
         # Extraire les metadonnees de chaque formation (sans doublons)
         formations = []
@@ -409,54 +622,39 @@ class PipelineRAG:
             if key in seen_rec:
                 continue
             seen_rec.add(key)
-            formations.append({
-                "index": i,
-                "nom": nom,
-                "type": meta.get("type_diplome", meta.get("type", "")),
-                "domaine": meta.get("domaine", ""),
-                "ville": ville,
-                "etablissement": etab,
-                "duree": meta.get("duree", ""),
-                "url": meta.get("url", ""),
-                "extrait": doc.page_content[:300],
-                "contenu_complet": doc.page_content,
-            })
+            formations.append(self._formation_recommandee(doc, i))
 
         return formations, info_geo
 
+    @staticmethod
+    def _formation_recommandee(doc: Document, index: int = 0) -> dict:
+        """Dict d'une formation recommandee, tel que generer_parcours l'attend (formation_choisie)."""
+        meta = doc.metadata
+        return {
+            "index": index,
+            "formation_id": meta.get("formation_id", ""),
+            "nom": meta.get("nom", "Formation"),
+            "type": meta.get("type_diplome", meta.get("type", "")),
+            "domaine": meta.get("domaine", ""),
+            "ville": meta.get("ville", ""),
+            "etablissement": meta.get("etablissement", ""),
+            "duree": meta.get("duree", ""),
+            "url": meta.get("url", ""),
+            "extrait": doc.page_content[:300],
+            "contenu_complet": doc.page_content,
+        }
+
+    def formation_par_id(self, formation_id: str) -> dict | None:
+        """Formation choisie a partir de son formation_id (clients de l'API) ; None si inconnue."""
+        doc = self.docs_par_formation.get(formation_id)
+        return self._formation_recommandee(doc) if doc is not None else None
+
     # Cycles : types de diplomes appartenant a chaque voie
     TYPES_CYCLE_UNIV = {"Licence", "Master"}
     TYPES_CYCLE_ALT  = {"BUT"}
 
-    # Mapping domaine UI (selectbox app.py) -> domaines ChromaDB
-    # Les cles correspondent exactement aux cles de OBJECTIFS_PAR_DOMAINE dans app.py
-    DOMAINE_VERS_BD = {
-        "Arts, Culture et Création":       {"Arts, Culture et Création", "ARTS, LETTRES, LANGUES"},
-        "Communication et Médias":         {"Communication et Médias", "Communication et Journalisme",
-                                            "CULTURE ET COMMUNICATION", "Langues et Communication"},
-        "Droit et Sciences Juridiques":    {"Droit et Sciences Juridiques", "DROIT, ECONOMIE, GESTION",
-                                            "DROIT, ECONOMIE, GESTION ET SCIENCE POLITIQUE"},
-        "Économie et Gestion":             {"Économie et Gestion", "DROIT, ECONOMIE, GESTION",
-                                            "DROIT, ECONOMIE, GESTION ET SCIENCE POLITIQUE"},
-        "Éducation et Sciences Sociales":  {"Éducation et Sciences Sociales",
-                                            "Sciences Humaines et Sociales", "Autre Domaine"},
-        "Géographie et Environnement":     {"Géographie et Environnement",
-                                            "Environnement et Développement Durable",
-                                            "SCIENCES DE LA MER ET DU LITTORAL"},
-        "Informatique et Technologies":    {"Informatique et Technologies",
-                                            "SCIENCES, TECHNOLOGIES, SANTÉ"},
-        "Ingénierie":                      {"Ingénierie", "Informatique et Technologies",
-                                            "SCIENCES, TECHNOLOGIES, SANTÉ"},
-        "Langues et Communication":        {"Langues et Communication", "ARTS, LETTRES, LANGUES",
-                                            "Communication et Médias"},
-        "Santé et Médecine":               {"Santé et Médecine", "SCIENCES, TECHNOLOGIES, SANTÉ",
-                                            "SCIENCES DE LA SANTE"},
-        "Sciences":                        {"Sciences", "SCIENCES, TECHNOLOGIES, SANTÉ",
-                                            "SCIENCES ET TECHNOLOGIES"},
-        "Sciences Humaines et Sociales":   {"Sciences Humaines et Sociales",
-                                            "SCIENCES HUMAINES ET SOCIALES",
-                                            "Éducation et Sciences Sociales"},
-    }
+    # Mapping domaine UI (selectbox app.py) -> domaines ChromaDB (src/referentiel.py)
+    DOMAINE_VERS_BD = DOMAINE_VERS_BD
 
     def _domaines_profil_vers_bd(self, domaines_profil: list) -> set:
         """
@@ -570,16 +768,17 @@ class PipelineRAG:
                 resultats.append(doc)
         return resultats
 
-    def _docs_vers_formations(self, docs: list, top_k: int) -> list:
+    def _docs_vers_formations(self, docs, top_k: int) -> list:
         """
-        Convertit une liste de documents ChromaDB en dicts de formation.
+        Convertit des documents ChromaDB (liste ou generateur de candidats) en dicts de formation.
+        Les candidats sont consommes jusqu'a top_k formations distinctes, pas au-dela.
         Inclut une description courte issue du contenu indexe (debouches, competences...).
         """
         formations = []
         seen = set()
-        for doc in docs[:top_k * 5]:          # sur-fetcher pour avoir assez apres dedup
-            if len(formations) >= top_k:
-                break
+        if top_k <= 0:
+            return formations
+        for doc in docs:
             meta = doc.metadata
             nom = meta.get("nom", "Formation")
             etab = meta.get("etablissement", "")
@@ -592,6 +791,7 @@ class PipelineRAG:
                 # depuis le page_content (format "Competences acquises : ...\nDebouches : ...")
                 description = _extraire_description_formation(doc.page_content)
                 formations.append({
+                    "formation_id": meta.get("formation_id", ""),
                     "nom": nom,
                     "etablissement": meta.get("etablissement", ""),
                     "ville": meta.get("ville", ""),
@@ -603,51 +803,117 @@ class PipelineRAG:
                     "source": "base",
                     "exigences_notes": {},
                 })
+                if len(formations) >= top_k:
+                    break
         return formations
 
-    def _rechercher_docs_bruts(self, requete: str, profil: dict, over_fetch: int = 50) -> list:
+    def _formations_depuis_ids(self, formation_ids: list, top_k: int) -> list:
+        """Dicts de formation (comme _docs_vers_formations) a partir de formation_id."""
+        docs = [self.docs_par_formation[fid] for fid in formation_ids if fid in self.docs_par_formation]
+        return self._docs_vers_formations(docs, top_k)
+
+    def _grille_active(self, materialise: bool = True) -> GrilleOptions | None:
+        return self.grille if materialise else None
+
+    def _specs_recherche(
+        self, requete: str, profil: dict, voulus: int, types_diplome: set = None, pool: bool = False
+    ) -> list:
+        """
+        Retourne les recherches (requete, k, filtre) principales de _rechercher_docs_bruts :
+        filtre ville exacte (une recherche par ville) + types de diplome.
+        voulus : formations distinctes attendues (ou taille du pool si pool=True),
+        k est estime par filtre (cf. _k_recherche).
+        Sert aussi a pre-remplir le plan de recherche.
         """
-        Recupere un grand lot de documents ChromaDB (sans filtre de type)
-        en respectant STRICTEMENT la contrainte geographique du profil.
+        contrainte_geo = profil.get("contraintes_geographiques", profil.get("contraintes", ""))
+        villes = self._extraire_villes(contrainte_geo)
+        return self._specs_par_ville(requete, villes, voulus, types_diplome, pool)
+
+    def _rechercher_docs_bruts(
+        self, requete: str, profil: dict, voulus: int, types_diplome: set = None,
+        suivi: SuiviRecherche = None, pool: bool = False,
+    ):
+        """
+        Genere les documents ChromaDB classes en respectant STRICTEMENT
+        la contrainte geographique du profil.
+        Les filtres ville_id / type_diplome sont appliques dans l'index :
+        tous les documents generes satisfont les criteres ; l'index est relance
+        avec un k plus grand tant que l'appelant consomme des candidats.
         Si une ville est specifiee, on ne retourne QUE les formations de cette ville
         (ou villes proches). Pas de fallback vers d'autres villes.
         """
+        suivi = suivi if suivi is not None else SuiviRecherche(voulus)
         contrainte_geo = profil.get("contraintes_geographiques", profil.get("contraintes", ""))
         villes = self._extraire_villes(contrainte_geo)
 
-        docs_tous = self.vectorstore.similarity_search(requete, k=over_fetch)
-
+        # Recherche principale : ville(s) exacte(s) (ou sans ville si aucune contrainte).
+        # Une ville sans document du type demande n'est pas recherchee (cardinalite nulle).
+        specs = self._specs_recherche(requete, profil, voulus, types_diplome, pool)
+        docs = self._generer_specs(specs, suivi)
+        premier = next(docs, None)
+        if premier is not None:
+            return chain([premier], docs)
         if not villes:
-            return docs_tous
-
-        # Filtre strict : ville exacte
-        docs_ville = [
-            d for d in docs_tous
-            if any(v in (d.metadata.get("ville", "") or "").lower() for v in villes)
-        ]
-        if docs_ville:
-            return docs_ville
+            return iter(())
 
         # Villes proches si aucun resultat exact
-        villes_proches = []
-        for v in villes:
-            villes_proches.extend(self._trouver_villes_proches(v))
-        villes_proches = list(set(villes_proches))
+        villes_proches = self._trouver_villes_proches(villes)
         if villes_proches:
-            docs_proches = [
-                d for d in docs_tous
-                if any(v in (d.metadata.get("ville", "") or "").lower() for v in villes_proches)
-            ]
-            if docs_proches:
-                return docs_proches
+            filtre = construire_filtre(types_diplome, villes_proches)
+            k = self._k_recherche(voulus, filtre, pool)
+            if k > 0:
+                return self._generer_specs([(requete, k, filtre)], suivi)
+
+        # Aucune formation dans cette ville (le filtre couvre deja tout l'index)
+        return iter(())
+
+    def _retenir_formations(self, docs, top_k: int, suivi: SuiviRecherche, requete: str) -> list:
+        """Consomme les candidats jusqu'a top_k formations distinctes et enregistre les compteurs."""
+        formations = self._docs_vers_formations(docs, top_k)
+        suivi.retenus = len(formations)
+        self.stats_recherche.enregistrer(suivi, requete)
+        return formations
+
+    def rechercher_formations(self, requete: str, top_k: int = 5) -> list:
+        """Recherche libre (/rechercher-formations) : vecteurs + BM25 fusionnes sur tout l'index."""
+        if not self._initialise:
+            raise RuntimeError(
+                "Le pipeline n'est pas initialise. "
+                "Appelez pipeline.initialiser() d'abord."
+            )
+        suivi = SuiviRecherche(top_k)
+        docs = self._generer_specs([(requete, self._k_recherche(top_k), None)], suivi)
+        return self._retenir_formations(docs, top_k, suivi, requete)
+
+    def stats_recherches(self) -> dict:
+        """Statistiques des recherches adaptatives et cardinalites de l'index (/stats/recherche)."""
+        return {
+            "recherches": self.stats_recherche.stats(),
+            "cardinalites": self.selectivite.resume() if self.selectivite is not None else None,
+        }
 
-        # Aucune formation dans cette ville : on elargit la recherche avec plus de docs
-        docs_elargi = self.vectorstore.similarity_search(requete, k=over_fetch * 3)
-        docs_ville_elargi = [
-            d for d in docs_elargi
-            if any(v in (d.metadata.get("ville", "") or "").lower() for v in villes)
+    def resoudre_metier(self, objectif: str) -> list[dict]:
+        """Metiers de la taxonomie correspondant a un objectif libre (meilleurs d'abord)."""
+        if self.metiers is None:
+            return []
+        return [
+            {"id": mid, "nom": self.metiers.metiers[mid]["nom"], "similarite": similarite,
+             "nb_formations": len(self.metiers.formations(mid))}
+            for mid, similarite in self.metiers.resoudre(objectif)
         ]
-        return docs_ville_elargi if docs_ville_elargi else []
+
+    def formations_par_metier(self, metier_id: str, top_k: int = 50) -> dict | None:
+        """Formations menant a un metier (index inverse) ; None si le metier est inconnu."""
+        if self.metiers is None or metier_id not in self.metiers.metiers:
+            return None
+        fids = self.metiers.formations(metier_id)
+        docs = [self.docs_par_formation[fid] for fid in fids if fid in self.docs_par_formation]
+        return {
+            "id": metier_id,
+            "nom": self.metiers.metiers[metier_id]["nom"],
+            "nb_formations": len(fids),
+            "formations": self._docs_vers_formations(docs, top_k),
+        }
 
     def rechercher_formations_pour_etape(
         self,
@@ -662,17 +928,18 @@ class PipelineRAG:
         types_diplome : ensemble de valeurs type_diplome a garder (ex. {'Licence', 'Master'}).
                         Si None, aucun filtre de type.
         """
-        domaine = " ".join(profil.get("domaines_etudes_preferes", []))
-        ville   = profil.get("contraintes_geographiques", "")
-        # Requete enrichie : niveau + objectif + domaine + ville pour maximiser la pertinence
-        requete = f"{titre_etape} {objectif} {domaine} {ville}".strip()
-
-        docs = self._rechercher_docs_bruts(requete, profil, over_fetch=150)
+        requete = self._requete_etape(titre_etape, objectif, profil)
 
-        if types_diplome:
-            docs = self._filtrer_par_type(docs, types_diplome)
+        # Filtres pousses dans l'index ; k estime par filtre, augmente tant qu'il manque des formations
+        suivi = SuiviRecherche(top_k)
+        docs = self._rechercher_docs_bruts(requete, profil, top_k, types_diplome, suivi)
+        return self._retenir_formations(docs, top_k, suivi, requete)
 
-        return self._docs_vers_formations(docs, top_k)
+    def _requete_etape(self, titre_etape: str, objectif: str, profil: dict) -> str:
+        """Requete enrichie : niveau + objectif + domaine + ville pour maximiser la pertinence."""
+        domaine = " ".join(profil.get("domaines_etudes_preferes", []))
+        ville   = profil.get("contraintes_geographiques", "")
+        return f"{titre_etape} {objectif} {domaine} {ville}".strip()
 
     def _predire_niveaux_etapes(self, niveau_actuel: str) -> list:
         """
@@ -702,6 +969,70 @@ class PipelineRAG:
                 break
         return hierarchie[idx:]
 
+    def _requetes_niveaux(self, niveaux: list, objectif: str, profil: dict) -> list[str]:
+        """
+        Titre de recherche de chaque niveau predit :
+        - Premiere moitie -> requete avec domaine de l'etudiant
+        - Seconde moitie  -> requete avec objectif seul (passerelle vers objectif)
+        """
+        objectif_clean = objectif.strip()
+        domaine_actuel = " ".join(profil.get("domaines_etudes_preferes", []))
+        requetes = []
+        for i_niv, niveau in enumerate(niveaux):
+            if i_niv < max(1, len(niveaux) // 2) and domaine_actuel:
+                requetes.append(f"{niveau} {domaine_actuel}")
+            else:
+                requetes.append(f"{niveau} {objectif_clean}")
+        return requetes
+
+    def _planifier_recherches(
+        self,
+        plan: PlanRecherche,
+        niveaux: list,
+        objectif: str,
+        profil: dict,
+        profil_options: dict,
+        cycle: str,
+        top_k_contexte: int = TOP_K_CONTEXTE,
+        top_k_options: int = TOP_K_OPTIONS,
+        materialise: bool = True,
+    ):
+        """
+        Pre-remplit le plan avec toutes les recherches d'une generation de parcours :
+        contexte par niveau (T1) puis Licence / Licence sans geo / Master / BUT (T2).
+        Les memes requetes que celles executees ensuite, pour qu'elles soient
+        toutes servies par un seul embedding batch et une seule recherche multi-requetes.
+        Les cellules presentes dans la table materialisee ne sont pas recherchees.
+        """
+        grille = self._grille_active(materialise)
+        objectif_clean = objectif.strip()
+        if grille is None or top_k_contexte != TOP_K_CONTEXTE or \
+                grille.chercher_contexte(niveaux, objectif_clean, profil) is None:
+            for requete_niv in self._requetes_niveaux(niveaux, objectif, profil):
+                requete = self._requete_etape(requete_niv, objectif_clean, profil)
+                for spec in self._specs_recherche(requete, profil, top_k_contexte, self.TYPES_CYCLE_UNIV):
+                    plan.ajouter(*spec)
+
+        objectif_options = profil_options.get("objectif_professionnel", profil_options.get("objectif", ""))
+        domaine = " ".join(profil_options.get("domaines_etudes_preferes", []))
+        profil_sans_geo = {**profil_options, "contraintes_geographiques": ""}
+        if grille is None or top_k_options != TOP_K_OPTIONS or grille.chercher_options(profil_options) is None:
+            titres = [(f"Licence {domaine}", profil_options, {"Licence"}),
+                      (f"Licence {domaine}", profil_sans_geo, {"Licence"})]
+            if cycle == "but":
+                titres.append((f"BUT {domaine}", profil_options, {"BUT"}))
+            for titre, p, types in titres:
+                requete = self._requete_etape(titre, objectif_options, p)
+                for spec in self._specs_recherche(requete, p, top_k_options, types):
+                    plan.ajouter(*spec)
+        if grille is None or grille.chercher_masters(objectif_options, profil_options) is None:
+            for spec in self._specs_recherche(
+                f"Master {objectif_options} {domaine}", profil_sans_geo, self.POOL_MASTERS, {"Master"}, pool=True
+            ):
+                plan.ajouter(*spec)
+
+        plan.executer()
+
     def _construire_context_formations_par_niveau(self, niveaux: list, objectif: str, profil: dict, top_k: int = 5) -> str:
         """
         Pour chaque niveau predit, interroge ChromaDB et injecte les formations reelles.
@@ -713,23 +1044,8 @@ class PipelineRAG:
           (ex: M1/M2 Data Science)
         Cette progression naturelle cree automatiquement une passerelle dans le parcours.
         """
-        objectif_clean = objectif.strip()
-        domaine_actuel = " ".join(profil.get("domaines_etudes_preferes", []))
         lignes = []
-        nb_niveaux = len(niveaux)
-
-        for i_niv, niveau in enumerate(niveaux):
-            # Premiere moitie -> requete avec domaine de l'etudiant
-            # Seconde moitie  -> requete avec objectif seul (passerelle vers objectif)
-            if i_niv < max(1, nb_niveaux // 2) and domaine_actuel:
-                requete_niv = f"{niveau} {domaine_actuel}"
-            else:
-                requete_niv = f"{niveau} {objectif_clean}"
-
-            fU = self.rechercher_formations_pour_etape(
-                requete_niv, objectif_clean, profil, top_k,
-                types_diplome=self.TYPES_CYCLE_UNIV
-            )
+        for niveau, fU in self._formations_par_niveau(niveaux, objectif, profil, top_k):
             if fU:
                 lignes.append(f"\n[{niveau}]")
                 for f in fU:
@@ -737,40 +1053,66 @@ class PipelineRAG:
 
         return "\n".join(lignes) if lignes else "(Aucune formation trouvee dans la base pour ces niveaux)"
 
-    def enrichir_options_etapes(
-        self,
-        parcours: dict,
-        profil: dict,
-        cycle: str = "universitaire",
-        top_k: int = 10,
-    ) -> dict:
+    def _formations_par_niveau(
+        self, niveaux: list, objectif: str, profil: dict, top_k: int = 5, materialise: bool = True
+    ) -> list:
+        """[(niveau, formations)] du contexte T1 : table materialisee, sinon recherche en direct."""
+        objectif_clean = objectif.strip()
+        grille = self._grille_active(materialise)
+        if grille is not None and top_k == TOP_K_CONTEXTE:
+            cellule = grille.chercher_contexte(niveaux, objectif_clean, profil)
+            if cellule is not None:
+                return [(niveau, self._formations_depuis_ids(ids, top_k)) for niveau, ids in cellule]
+
+        return [
+            (niveau, self.rechercher_formations_pour_etape(
+                requete_niv, objectif_clean, profil, top_k,
+                types_diplome=self.TYPES_CYCLE_UNIV
+            ))
+            for niveau, requete_niv in zip(niveaux, self._requetes_niveaux(niveaux, objectif, profil))
+        ]
+
+    def _rechercher_options_cycle(self, profil: dict, cycle: str = "universitaire", top_k: int = 10) -> dict:
         """
-        Apres generation du LLM, remplace les options de chaque etape
-        par des formations REELLES issues de ChromaDB.
+        Recherche les formations reelles proposees aux etapes (T2).
+        Ne depend que du profil, de la ville et du cycle — pas de la reponse du LLM —
+        et peut donc tourner pendant l'appel au LLM.
+
+        Logique : 1 recherche par PHASE, pas par etape.
+        Une Licence = 1 programme de 3 ans (L1/L2/L3 = meme formation, meme universite)
+        Un Master = 1 programme de 2 ans (M1/M2 = meme formation, meme universite)
+        On cherche UNE fois la meilleure Licence et UNE fois le meilleur Master,
+        puis on assigne la meme formation a toutes les etapes de chaque phase.
+        """
+        objectif = profil.get("objectif_professionnel", profil.get("objectif", ""))
+        ville_pref = self._extraire_ville_etape({}, profil)
+
+        # 1. et 3. Licence / BUT : cellule de la table materialisee, sinon recherche en direct
+        options = None
+        if self.grille is not None and top_k == TOP_K_OPTIONS:
+            cellule = self.grille.chercher_options(profil)
+            if cellule is not None:
+                options = {
+                    "licence": self._formations_depuis_ids(cellule["licence"], top_k),
+                    "but": self._formations_depuis_ids(cellule["but"], top_k) if cycle == "but" else [],
+                }
+        if options is None:
+            options = self._rechercher_options_licence_but(profil, cycle, top_k)
 
-        Pour chaque etape :
-          - On extrait la ville depuis les suggestions du LLM pour chercher
-            des formations dans la meme zone geographique
-          - On retourne uniquement les formations du cycle principal
-            (Licence/Master pour cycle universitaire, BUT pour cycle BUT)
-          - Pas d'alternatives : on se concentre sur le parcours de l'etudiant
+        # 2. Chercher le meilleur MASTER pour l'objectif (national, par debouches)
+        options_master = self._rechercher_master_par_objectif(objectif, profil, top_k)
 
-        Chaque etape recoit :
-          etape["options"]         : formations reelles du cycle principal
-          etape["options_ia"]      : suggestions originales du LLM (archivees)
-          etape["ville_recherche"] : ville utilisee pour la recherche
-        """
-        if not parcours.get("etapes"):
-            return parcours
+        return {
+            "licence": options["licence"],
+            "master": options_master,
+            "but": options["but"],
+            "ville_pref": ville_pref,
+        }
 
+    def _rechercher_options_licence_but(self, profil: dict, cycle: str, top_k: int) -> dict:
+        """Recherche en direct de la meilleure Licence (ville preferee, sinon France) et du BUT."""
         objectif = profil.get("objectif_professionnel", profil.get("objectif", ""))
-        ville_pref = self._extraire_ville_etape(parcours["etapes"][0], profil) if parcours["etapes"] else ""
-
-        # --- Logique : 1 recherche par PHASE, pas par etape ---
-        # Une Licence = 1 programme de 3 ans (L1/L2/L3 = meme formation, meme universite)
-        # Un Master = 1 programme de 2 ans (M1/M2 = meme formation, meme universite)
-        # On cherche UNE fois la meilleure Licence et UNE fois le meilleur Master,
-        # puis on assigne la meme formation a toutes les etapes de chaque phase.
+        ville_pref = self._extraire_ville_etape({}, profil)
 
         # 1. Chercher la meilleure LICENCE dans la ville preferee
         domaine = " ".join(profil.get("domaines_etudes_preferes", []))
@@ -787,9 +1129,6 @@ class PipelineRAG:
                 types_diplome={"Licence"},
             )
 
-        # 2. Chercher le meilleur MASTER pour l'objectif (national, par debouches)
-        options_master = self._rechercher_master_par_objectif(objectif, profil, top_k)
-
         # 3. Chercher le meilleur BUT si cycle BUT
         options_but = []
         if cycle == "but":
@@ -798,27 +1137,92 @@ class PipelineRAG:
                 types_diplome={"BUT"},
             )
 
-        # 4. Assigner les formations aux etapes
-        for etape in parcours["etapes"]:
-            titre = etape.get("titre", "")
-            etape["options_ia"] = etape.get("options", [])
-            types_etape = self._types_diplome_pour_etape(titre, cycle)
-
-            if types_etape == {"Master"}:
-                etape["options"] = options_master
-                etape["ville_recherche"] = "France (mobilité Master)"
-            elif types_etape == {"BUT"}:
-                etape["options"] = options_but
-                etape["ville_recherche"] = ville_pref
-            else:
-                # Licence (L1/L2/L3) = meme formation
-                etape["options"] = options_licence
-                etape["ville_recherche"] = ville_pref
+        return {"licence": options_licence, "but": options_but}
+
+    def _get_executeur(self) -> ThreadPoolExecutor:
+        """Pool de threads partage pour les recherches lancees pendant l'appel LLM."""
+        if self._executeur is None:
+            self._executeur = ThreadPoolExecutor(
+                max_workers=int(os.getenv("RAG_THREADS", "4")),
+                thread_name_prefix="rag-options",
+            )
+        return self._executeur
+
+    def _lancer_options_cycle(self, plan: PlanRecherche, profil: dict, cycle: str) -> Future:
+        """
+        Lance les recherches T2 en arriere-plan, avec le plan de la requete
+        (les resultats deja batches sont reutilises depuis le thread du pool).
+        """
+        def tache():
+            with self._plan_requete(plan):
+                return self._rechercher_options_cycle(profil, cycle)
+        return self._get_executeur().submit(tache)
+
+    def enrichir_options_etapes(
+        self,
+        parcours: dict,
+        profil: dict,
+        cycle: str = "universitaire",
+        top_k: int = 10,
+        options: dict = None,
+    ) -> dict:
+        """
+        Apres generation du LLM, ajoute a chaque etape les formations REELLES
+        issues de ChromaDB (le LLM ne produit plus d'options : schema compact).
+
+        Pour chaque etape :
+          - On cherche dans la ville du profil (Licence / BUT), au niveau national (Master)
+          - On retourne uniquement les formations du cycle principal
+            (Licence/Master pour cycle universitaire, BUT pour cycle BUT)
+          - Pas d'alternatives : on se concentre sur le parcours de l'etudiant
+
+        options : resultat de _rechercher_options_cycle deja calcule (recherches
+                  lancees pendant l'appel LLM). Si None, les recherches sont faites ici.
+
+        Chaque etape recoit :
+          etape["options"]         : formations reelles du cycle principal
+          etape["ville_recherche"] : ville utilisee pour la recherche
+          numero / duree / periode : deduits du rang de l'etape (cf. _completer_etapes)
+        """
+        if not parcours.get("etapes"):
+            return parcours
+        self._completer_etapes(parcours["etapes"])
+
+        if options is None:
+            options = self._rechercher_options_cycle(profil, cycle, top_k)
 
+        # Assigner les formations aux etapes
+        for etape in parcours["etapes"]:
+            etape["options"], etape["ville_recherche"] = self._options_etape(etape.get("titre", ""), options, cycle)
             etape["options_alternatives"] = []
 
         return parcours
 
+    def _options_etape(self, titre: str, options: dict, cycle: str) -> tuple[list, str]:
+        """(formations reelles, ville de recherche) d'une etape d'apres son titre."""
+        types_etape = self._types_diplome_pour_etape(titre, cycle)
+        if types_etape == {"Master"}:
+            return options["master"], "France (mobilité Master)"
+        if types_etape == {"BUT"}:
+            return options["but"], options["ville_pref"]
+        # Licence (L1/L2/L3) = meme formation
+        return options["licence"], options["ville_pref"]
+
+    @staticmethod
+    def _completer_etapes(etapes: list, aujourd_hui: date = None, premier: int = 0):
+        """
+        Champs des etapes deduits cote serveur (absents du schema demande au LLM) :
+        numero (rang), duree (une etape = une annee) et periode, a partir de la
+        prochaine rentree de septembre. premier : rang de la premiere etape de la
+        liste (etapes recues une a une en flux).
+        """
+        aujourd_hui = aujourd_hui or date.today()
+        rentree = aujourd_hui.year if aujourd_hui.month < 9 else aujourd_hui.year + 1
+        for i, etape in enumerate(etapes, start=premier):
+            etape.setdefault("numero", i + 1)
+            etape.setdefault("duree", "1 an")
+            etape.setdefault("periode", f"Septembre {rentree + i} - Juin {rentree + i + 1}")
+
     def _moyenne_notes(self, profil: dict) -> float:
         """Calcule la moyenne des notes de l'etudiant (exclut les 0)."""
         notes = profil.get("notes_par_matiere", {})
@@ -839,94 +1243,261 @@ class PipelineRAG:
 
         SANS contrainte geographique (l'etudiant bouge apres la Licence).
         """
-        domaine = " ".join(profil.get("domaines_etudes_preferes", []))
-        requete = f"Master {objectif} {domaine}"
-
-        profil_national = {**profil, "contraintes_geographiques": ""}
-        docs = self._rechercher_docs_bruts(requete, profil_national, over_fetch=200)
-        docs = self._filtrer_par_type(docs, {"Master"})
-
-        # Variables du profil pour le scoring
-        objectif_lower = objectif.lower().strip()
-        objectif_mots = set(objectif_lower.split())
-        moyenne = self._moyenne_notes(profil)
-        budget = profil.get("budget", "").lower()
-        competences = [c.lower() for c in profil.get("competences_techniques", [])]
+        docs = self._candidats_masters(objectif, profil)
+        formations_objectif = self.metiers.formations_objectif(objectif) if self.metiers else set()
+
+        # Scoring multi-criteres vectorise (regles dans src/scoring.py)
+        scores = scores_masters(
+            self._index_scoring(), docs, objectif,
+            moyenne=self._moyenne_notes(profil),
+            budget=profil.get("budget", ""),
+            competences=profil.get("competences_techniques", []),
+            formations_objectif=formations_objectif,
+        )
+        docs, scores = classer_par_score(docs, scores)
+        print(f"  Masters trouves : {len(docs)} | Top-3 scores : "
+              f"{scores[:3].tolist() if docs else 'aucun'}")
+        return self._docs_vers_formations(docs, top_k)
 
-        def score_master(doc):
-            meta = doc.metadata
-            debouches_raw = meta.get("debouches_metiers", "")
-            if isinstance(debouches_raw, str):
-                debouches = debouches_raw.lower()
-            else:
-                debouches = " ".join(debouches_raw).lower() if debouches_raw else ""
-            nom = meta.get("nom", "").lower()
-            ville = (meta.get("ville", "") or "").lower()
-            contenu = doc.page_content.lower()
-
-            # --- 1. Score pertinence debouches (0-30) ---
-            if objectif_lower in debouches:
-                score_pert = 0              # Match exact du metier dans les debouches
-            elif sum(1 for m in objectif_mots if m in debouches) >= 2:
-                score_pert = 5              # Plusieurs mots matchent
-            elif any(m in debouches for m in objectif_mots):
-                score_pert = 10             # Au moins un mot
-            elif any(m in nom for m in objectif_mots):
-                score_pert = 15             # Match dans le nom du Master
-            elif any(m in contenu for m in objectif_mots):
-                score_pert = 20             # Match dans le contenu complet
-            else:
-                score_pert = 30             # Aucun match
-
-            # --- 2. Bonus Paris (-3) ---
-            # Masters parisiens = meilleur reseau, plus de debouches, reputation
-            villes_paris = ["paris", "saclay", "nanterre", "creteil", "sceaux",
-                            "orsay", "guyancourt", "villetaneuse", "saint-denis"]
-            bonus_paris = -3 if any(v in ville for v in villes_paris) else 0
-
-            # --- 3. Ajustement notes ---
-            # Bonne moyenne : acces aux Masters selectifs sans penalite
-            # Moyenne faible : on penalise pour proposer des Masters plus accessibles
-            if moyenne >= 14:
-                ajust_notes = 0
-            elif moyenne >= 12:
-                ajust_notes = 2
-            else:
-                ajust_notes = 5
+    # Masters candidats au re-classement par scores_masters
+    POOL_MASTERS = 60
 
-            # --- 4. Budget : penaliser prive si "Public uniquement" ---
-            budget_pen = 0
-            if "public uniquement" in budget:
-                modalite = (meta.get("modalite", "") or "").lower()
-                if "priv" in modalite:
-                    budget_pen = 50
+    def _candidats_masters(self, objectif: str, profil: dict, materialise: bool = True) -> list:
+        """
+        Masters candidats au re-classement (independants des notes, du budget et des
+        competences) : table materialisee pour (domaine, objectif), sinon recherche en direct.
+        """
+        grille = self._grille_active(materialise)
+        if grille is not None:
+            ids = grille.chercher_masters(objectif, profil)
+            if ids is not None:
+                return [self.docs_par_formation[fid] for fid in ids if fid in self.docs_par_formation]
 
-            # --- 5. Bonus competences techniques (-1 par match, max -5) ---
-            bonus_comp = 0
-            for comp in competences:
-                if comp in contenu or comp in nom:
-                    bonus_comp -= 1
-            bonus_comp = max(bonus_comp, -5)
+        domaine = " ".join(profil.get("domaines_etudes_preferes", []))
+        requete = f"Master {objectif} {domaine}"
 
-            return score_pert + bonus_paris + ajust_notes + budget_pen + bonus_comp
+        # Pool de Masters a re-classer (auparavant ~20-40 Masters parmi 200 docs tous types)
+        profil_national = {**profil, "contraintes_geographiques": ""}
+        suivi = SuiviRecherche(self.POOL_MASTERS)
+        docs = list(islice(self._rechercher_docs_bruts(
+            requete, profil_national, self.POOL_MASTERS, {"Master"}, suivi, pool=True
+        ), self.POOL_MASTERS))
+        suivi.retenus = len(docs)
+        self.stats_recherche.enregistrer(suivi, requete)
+
+        # Objectif -> metiers de la taxonomie -> formations (index inverse) : les Masters
+        # qui menent au metier entrent dans le pool meme si la recherche les a manques
+        formations_objectif = self.metiers.formations_objectif(objectif) if self.metiers else set()
+        if formations_objectif:
+            presents = {d.metadata.get("formation_id") for d in docs}
+            manquants = [self.docs_par_formation.get(fid) for fid in sorted(formations_objectif - presents)]
+            docs = docs + [d for d in manquants if d is not None and d.metadata.get("type_diplome") == "Master"]
+        return docs
+
+    def _generer_json(
+        self, prompt: str, modele, nature: str, partition: str = None, profil_texte: str = None,
+        llm=None, en_cache: bool = True, sur_morceau=None,
+    ) -> tuple[dict | None, str, bool]:
+        """
+        Appel au LLM derriere le cache de reponses (prompt identique, sinon si partition
+        reponse d'un profil proche pour la meme partition), puis validation par le schema
+        Pydantic modele (cf. _valider_reponse). Seules les reponses conformes, apres
+        reparation eventuelle, sont gardees en cache.
+        Retourne (donnees, contenu brut, conforme) ; donnees None si la reponse est illisible.
+        llm : modele a utiliser (defaut self.llm) ; en_cache=False : pas de cache_llm.
+        sur_morceau : si fourni, le LLM est appele en flux et chaque morceau de texte lui
+                      est passe des sa reception (reponse en cache : passee en une fois).
+        """
+        cache = self.cache_llm if en_cache else None
+        embedding = None
+        if cache is not None and partition is not None and profil_texte:
+            embedding = lambda: self.vectorstore.embeddings.embed_query(profil_texte)
+        if cache is not None:
+            trouve = cache.chercher(prompt, partition, embedding)
+            if trouve is not None:
+                print(f"Reponse du LLM servie par le cache ({trouve[1]})")
+                if sur_morceau is not None:
+                    sur_morceau(trouve[0])
+                return json.loads(trouve[0]), trouve[0], True
+
+        if sur_morceau is None:
+            reponse = (llm or self.llm).invoke(prompt)
+            contenu = reponse.content if hasattr(reponse, 'content') else str(reponse)
+        else:
+            morceaux = []
+            for morceau in (llm or self.llm).stream(prompt):
+                texte = morceau.content if hasattr(morceau, 'content') else str(morceau)
+                morceaux.append(texte)
+                sur_morceau(texte)
+            contenu = "".join(morceaux)
+        donnees, conforme = self._valider_reponse(contenu, modele, nature)
+        if cache is not None and conforme:
+            cache.enregistrer(prompt, json.dumps(donnees, ensure_ascii=False), partition,
+                              embedding() if embedding else None)
+        return donnees, contenu, conforme
+
+    def _valider_reponse(self, contenu: str, modele, nature: str) -> tuple[dict | None, bool]:
+        """
+        Lecture de la reponse et validation par le schema :
+        1. JSON lu directement, ou repare localement (texte autour, virgules, guillemets, troncature)
+        2. schema respecte : donnees normalisees (chaines isolees -> listes...)
+        3. sinon, si au plus REPARATION_MAX_CHAMPS champs sont invalides, un petit appel
+           par champ ne regenere que ce champ (le reste de la reponse est conserve)
+        Retourne (donnees, conforme). Une reponse restee non conforme est rendue telle
+        quelle (comme avant la validation) mais n'est pas mise en cache ; None si illisible.
+        """
+        noter = lambda **compteurs: self.metriques_generation.noter(nature, **compteurs)
+        noter(reponses=1)
+        donnees, lecture = extraire_json(contenu)
+        if not isinstance(donnees, dict):
+            noter(illisibles=1)
+            print(f"Reponse du LLM illisible ({nature})")
+            return None, False
+        noter(**{lecture: 1})
+
+        normalisees, erreurs = valider(donnees, modele)
+        if normalisees is not None:
+            return normalisees, True
+        noter(schema_invalide=1)
+        champs = champs_invalides(erreurs)
+        if not champs or len(champs) > REPARATION_MAX_CHAMPS or ("etapes",) in [c for c, _ in champs]:
+            noter(invalides=1)
+            print(f"Reponse non conforme au schema ({nature}, {len(erreurs)} erreurs) : conservee sans reparation")
+            return donnees, False
+
+        print(f"Reparation ciblee ({nature}) : {', '.join('.'.join(map(str, c)) for c, _ in champs)}")
+        for chemin, message in champs:
+            noter(champs_repares=1)
+            valeur = self._reparer_champ(donnees, chemin, message)
+            if valeur is not None:
+                ecrire_champ(donnees, chemin, valeur)
+        normalisees, erreurs = valider(donnees, modele)
+        if normalisees is not None:
+            noter(reparations_reussies=1)
+            return normalisees, True
+        noter(invalides=1)
+        return donnees, False
+
+    def _reparer_champ(self, donnees: dict, chemin: tuple, message: str):
+        """Regenere un seul champ (PROMPT_REPARATION_CHAMP, sortie courte) ; None si l'appel echoue."""
+        champ = str(chemin[-1])
+        if chemin[0] == "etapes" and len(chemin) > 1:
+            etape = lire_champ(donnees, chemin[:2]) or {}
+            contexte = f"etape {chemin[1] + 1} : {etape.get('titre', '') if isinstance(etape, dict) else ''}"
+        else:
+            contexte = str(donnees.get("resume", ""))[:300]
+        prompt = PROMPT_REPARATION_CHAMP.format(
+            champ=".".join(map(str, chemin)),
+            erreur=message,
+            valeur=json.dumps(lire_champ(donnees, chemin), ensure_ascii=False)[:500],
+            format=FORMATS_CHAMPS.get(champ, FORMATS_CHAMPS.get(str(chemin[0]), "valeur JSON")),
+            contexte=contexte,
+        )
+        try:
+            reponse = (self.llm_court or self.llm).invoke(prompt)
+        except Exception as e:
+            print(f"  Reparation de {champ} impossible : {e}")
+            return None
+        contenu = reponse.content if hasattr(reponse, 'content') else str(reponse)
+        reparation, _ = extraire_json(contenu)
+        return reparation.get("valeur") if isinstance(reparation, dict) else None
 
-        docs = sorted(docs, key=score_master)
-        print(f"  Masters trouves : {len(docs)} | Top-3 scores : "
-              f"{[score_master(d) for d in docs[:3]] if docs else 'aucun'}")
-        return self._docs_vers_formations(docs, top_k)
+    @staticmethod
+    def _profil_squelette(formation_choisie: dict, objectif: str) -> dict:
+        """
+        Profil des recherches du squelette : objectif et domaine de la formation choisie,
+        sans contrainte geographique. Rien ne vient de l'etudiant : le contexte du prompt
+        ne depend que de la cle du squelette (formation, objectif, niveaux).
+        """
+        domaine = formation_choisie.get("domaine", "")
+        return {
+            "objectif_professionnel": objectif,
+            "domaines_etudes_preferes": [domaine] if domaine else [],
+            "contraintes_geographiques": "",
+        }
 
-    def _nettoyer_json(self, contenu: str) -> str:
-        """Retire les balises markdown autour du JSON si presentes."""
-        c = contenu.strip()
-        if c.startswith("```json"):
-            c = c[7:]
-        if c.startswith("```"):
-            c = c[3:]
-        if c.endswith("```"):
-            c = c[:-3]
-        return c.strip()
+    def _squelette_parcours(
+        self, formation_choisie: dict, objectif: str, cycle: str, niveaux: list,
+        niveau_actuel: str, cycle_label: str, sur_morceau=None,
+    ) -> tuple[dict | None, str]:
+        """
+        Squelette du parcours pour (formation, objectif, cycle, niveau actuel, niveaux) :
+        titres, descriptions, competences et prerequis, generes une fois par
+        PROMPT_PARCOURS sans profil individuel puis servis depuis le cache.
+        Les formations reelles du prompt sont recherchees avec _profil_squelette
+        (pas la ville ni les domaines de l'etudiant, absents de la cle).
+        Retourne (squelette, contenu brut) ; squelette None si la reponse est illisible.
+        sur_morceau : cf. _generer_json (generation en flux).
+        """
+        cle = empreinte(
+            PROMPT_PARCOURS.template,
+            formation_choisie.get("formation_id") or cle_formation(formation_choisie),
+            " ".join(normaliser_texte(objectif).split()), cycle, ",".join(niveaux),
+            " ".join(normaliser_texte(niveau_actuel).split()),
+        )
+        trouve = self.cache_squelettes.chercher(cle)
+        if trouve is not None:
+            print("Squelette du parcours servi par le cache")
+            if sur_morceau is not None:
+                sur_morceau(trouve[0])
+            return json.loads(trouve[0]), trouve[0]
+
+        print("Generation du squelette du parcours (formation + objectif + cycle)...")
+        formations_context = self._construire_context_formations_par_niveau(
+            niveaux, objectif, self._profil_squelette(formation_choisie, objectif), top_k=5
+        )
+        prompt = PROMPT_PARCOURS.format(
+            profil_etudiant=PROFIL_SQUELETTE,
+            formation_cible=formation_choisie.get("nom", "Formation"),
+            context=formation_choisie.get("contenu_complet", ""),
+            formations_disponibles=formations_context,
+            cycle=cycle_label,
+            niveau_actuel=niveau_actuel,
+            domaine_actuel=formation_choisie.get("domaine") or "Non specifie",
+        )
+        squelette, contenu, conforme = self._generer_json(
+            prompt, Parcours, "squelette", en_cache=False, sur_morceau=sur_morceau
+        )
+        if conforme:
+            self.cache_squelettes.enregistrer(cle, json.dumps(squelette, ensure_ascii=False))
+        return squelette, contenu
 
-    def generer_parcours(self, profil: dict, formation_choisie: dict) -> dict:
+    def _personnaliser_squelette(
+        self, squelette: dict, profil_texte: str, formation_choisie: dict, objectif: str, partition: str
+    ) -> dict:
+        """
+        Passe courte (self.llm_court, PERSONNALISATION_MAX_TOKENS) : reecrit seulement
+        adequation_profil, conseils_personnalises, defis et les conseils de chaque etape.
+        Si la reponse est invalide, le squelette est retourne tel quel.
+        """
+        etapes = "\n".join(
+            f"{i}. {e.get('titre', '')} : {str(e.get('description', ''))[:160]}"
+            for i, e in enumerate(squelette.get("etapes", []), start=1)
+        )
+        prompt = PROMPT_PERSONNALISATION.format(
+            profil_etudiant=profil_texte,
+            formation_cible=formation_choisie.get("nom", "Formation"),
+            objectif=objectif,
+            etapes=etapes,
+        )
+        personnalisation, _, conforme = self._generer_json(
+            prompt, Personnalisation, "personnalisation", partition, profil_texte, llm=self.llm_court
+        )
+        # Reponse non conforme (meme apres reparation) : rien n'est copie dans le squelette valide
+        if personnalisation is None or not conforme:
+            print("Personnalisation invalide : squelette generique conserve\n")
+            return squelette
+        for champ in ("adequation_profil", "conseils_personnalises", "defis"):
+            if personnalisation.get(champ):
+                squelette[champ] = personnalisation[champ]
+        for etape, conseils in zip(squelette.get("etapes", []), personnalisation.get("conseils_etapes") or []):
+            if conseils:
+                etape["conseils_etape"] = conseils
+        return squelette
+
+    def generer_parcours(
+        self, profil: dict, formation_choisie: dict, sur_evenement=None, arret: threading.Event = None
+    ) -> dict:
         """
         Genere un parcours COMPLET adapte au profil de l'etudiant.
 
@@ -937,6 +1508,12 @@ class PipelineRAG:
         T2 (apres LLM): on re-interroge ChromaDB etape par etape en utilisant la
                         VILLE de chaque etape comme centre de recherche, afin de
                         proposer des formations similaires dans la meme zone.
+
+        sur_evenement(evenement, donnees) : si fourni, le LLM est appele en flux et
+        chaque etape est signalee des qu'elle est complete ("etape"), suivie de ses
+        formations reelles T2 ("options") ; cf. generer_parcours_flux.
+        arret : si l'evenement est leve, la generation s'arrete (GenerationInterrompue)
+        au prochain morceau de la reponse ou avant la personnalisation.
         """
         if not self._initialise:
             raise RuntimeError(
@@ -944,59 +1521,113 @@ class PipelineRAG:
                 "Appelez pipeline.initialiser() d'abord."
             )
 
-        profil_texte = formater_profil(profil)
-        contexte = formation_choisie.get("contenu_complet", "")
-        objectif = profil.get("objectif_professionnel", profil.get("objectif", ""))
-        niveau_actuel = profil.get("niveau_actuel", "Terminale")
-
-        # --- Detecter le cycle choisi ---
-        cycle = self._detecter_cycle(formation_choisie)
-        print(f"Cycle detecte : {cycle}")
-
-        # --- T1 : RAG pre-prompt : formations reelles par niveau ---
-        niveaux = self._predire_niveaux_etapes(niveau_actuel)
-        print(f"Niveaux predits : {niveaux}")
-        formations_context = self._construire_context_formations_par_niveau(
-            niveaux, objectif, profil, top_k=5
-        )
-
-        # --- Construire le prompt avec cycle + niveau + formations reelles ---
-        cycle_label = (
-            "Cycle universitaire (Licence → L2 → L3 → Master)"
-            if cycle == "universitaire"
-            else "Cycle technologique (BUT 3 ans → Licence Pro ou insertion)"
-        )
-        domaine_actuel = ", ".join(profil.get("domaines_etudes_preferes", [])) or "Non specifie"
-        prompt_final = PROMPT_PARCOURS.format(
-            profil_etudiant=profil_texte,
-            formation_cible=formation_choisie.get("nom", "Formation"),
-            context=contexte,
-            formations_disponibles=formations_context,
-            cycle=cycle_label,
-            niveau_actuel=niveau_actuel,
-            domaine_actuel=domaine_actuel,
-        )
+        # Plan de recherche de la requete : toutes les recherches T1/T2
+        # sont vectorisees en un lot et executees en une passe
+        plan = PlanRecherche(self.vectorstore, self.bm25)
+        with self._plan_requete(plan):
+            profil_texte = formater_profil(profil)
+            contexte = formation_choisie.get("contenu_complet", "")
+            objectif = profil.get("objectif_professionnel", profil.get("objectif", ""))
+            niveau_actuel = profil.get("niveau_actuel", "Terminale")
 
-        print("Generation du parcours (RAG + cycle + niveau)...\n")
-        reponse = self.llm.invoke(prompt_final)
-        contenu = reponse.content if hasattr(reponse, 'content') else str(reponse)
+            # --- Detecter le cycle choisi ---
+            cycle = self._detecter_cycle(formation_choisie)
+            print(f"Cycle detecte : {cycle}")
 
-        try:
-            parcours = json.loads(self._nettoyer_json(contenu))
-            print("Parcours genere avec succes\n")
-            # T2 : re-interroger la base — utiliser la ville de la formation choisie
+            # Profil des recherches T2 : ville de la formation choisie
             ville_formation = formation_choisie.get("ville", "").strip()
             if ville_formation:
                 profil_enrichi = {**profil, "contraintes_geographiques": ville_formation}
             else:
                 profil_enrichi = profil
-            print(f"Enrichissement des alternatives (ville={ville_formation or profil.get('contraintes_geographiques','')}, cycle={cycle})...")
-            parcours = self.enrichir_options_etapes(parcours, profil_enrichi, cycle=cycle)
-            # Stocker le cycle dans le parcours pour l'interface
-            parcours["_cycle"] = cycle
-            print("Enrichissement termine\n")
-            return parcours
-        except json.JSONDecodeError:
+
+            # --- T1 : RAG pre-prompt : formations reelles par niveau ---
+            niveaux = self._predire_niveaux_etapes(niveau_actuel)
+            print(f"Niveaux predits : {niveaux}")
+            # Squelettes : contexte T1 sans le profil (cf. _profil_squelette), construit
+            # seulement si le squelette n'est pas deja en cache
+            squelettes = self.cache_squelettes is not None
+            profil_contexte = self._profil_squelette(formation_choisie, objectif) if squelettes else profil
+            self._planifier_recherches(plan, niveaux, objectif, profil_contexte, profil_enrichi, cycle)
+
+            # --- Construire le prompt avec cycle + niveau + formations reelles ---
+            cycle_label = (
+                "Cycle universitaire (Licence → L2 → L3 → Master)"
+                if cycle == "universitaire"
+                else "Cycle technologique (BUT 3 ans → Licence Pro ou insertion)"
+            )
+            domaine_actuel = ", ".join(profil.get("domaines_etudes_preferes", [])) or "Non specifie"
+
+            # T2 : les recherches d'options ne dependent pas de la reponse du LLM,
+            # elles tournent pendant la generation et sont jointes ensuite
+            print(f"Recherche des options en parallele (ville={ville_formation or profil.get('contraintes_geographiques','')}, cycle={cycle})...")
+            futur_options = self._lancer_options_cycle(plan, profil_enrichi, cycle)
+
+            # Cache semantique : meme formation, cycle, niveaux et objectif, profil proche
+            partition = empreinte(
+                (PROMPT_PERSONNALISATION if squelettes else PROMPT_PARCOURS).template,
+                formation_choisie.get("formation_id") or cle_formation(formation_choisie),
+                cycle, ",".join(niveaux), " ".join(normaliser_texte(objectif).split()),
+            )
+
+            sur_morceau = None
+            if sur_evenement is not None:
+                sur_morceau = self._suivre_etapes(sur_evenement, futur_options, cycle, arret)
+
+            print("Generation du parcours (RAG + cycle + niveau)...\n")
+            try:
+                if squelettes:
+                    # Squelette commun (formation, objectif, cycle, niveaux) + personnalisation courte
+                    parcours, contenu = self._squelette_parcours(
+                        formation_choisie, objectif, cycle, niveaux, niveau_actuel, cycle_label,
+                        sur_morceau=sur_morceau,
+                    )
+                    if parcours is not None:
+                        if arret is not None and arret.is_set():
+                            raise GenerationInterrompue()
+                        parcours = self._personnaliser_squelette(
+                            parcours, profil_texte, formation_choisie, objectif, partition
+                        )
+                        if sur_evenement is not None:
+                            # Les etapes emises en flux sont celles du squelette generique :
+                            # leurs conseils personnalises suivent une fois la passe terminee
+                            for numero, etape in enumerate(parcours.get("etapes", []), start=1):
+                                sur_evenement("etape_personnalisee", {
+                                    "numero": numero, "conseils_etape": etape.get("conseils_etape", []),
+                                })
+                else:
+                    formations_context = self._construire_context_formations_par_niveau(
+                        niveaux, objectif, profil, top_k=5
+                    )
+                    prompt_final = PROMPT_PARCOURS.format(
+                        profil_etudiant=profil_texte,
+                        formation_cible=formation_choisie.get("nom", "Formation"),
+                        context=contexte,
+                        formations_disponibles=formations_context,
+                        cycle=cycle_label,
+                        niveau_actuel=niveau_actuel,
+                        domaine_actuel=domaine_actuel,
+                    )
+                    parcours, contenu, _ = self._generer_json(
+                        prompt_final, Parcours, "parcours", partition, profil_texte, sur_morceau=sur_morceau
+                    )
+            except Exception:
+                futur_options.cancel()
+                raise
+
+            if parcours is not None:
+                print("Parcours genere avec succes\n")
+                parcours = self.enrichir_options_etapes(
+                    parcours, profil_enrichi, cycle=cycle, options=futur_options.result()
+                )
+                if sur_morceau is not None:
+                    # Recherches T2 terminees : "options" encore en attente emises avant le parcours
+                    sur_morceau("")
+                # Stocker le cycle dans le parcours pour l'interface
+                parcours["_cycle"] = cycle
+                print("Enrichissement termine\n")
+                return parcours
+            futur_options.cancel()
             print("Le LLM n'a pas retourne du JSON valide\n")
             return {
                 "resume": contenu,
@@ -1009,6 +1640,93 @@ class PipelineRAG:
                 "_cycle": cycle,
             }
 
+    def _suivre_etapes(self, sur_evenement, futur_options: Future, cycle: str, arret: threading.Event = None):
+        """
+        Fonction a passer en sur_morceau : lit la reponse au fil de l'eau et, pour chaque
+        etape complete, emet "etape" puis "options" (recherches T2 lancees avant l'appel).
+        La lecture du flux n'attend jamais les recherches T2 : tant qu'elles tournent, les
+        etapes recues attendent et leurs "options" partent a la fin des recherches
+        (callback du futur), dans l'ordre des etapes.
+        """
+        analyseur = EtapesIncrementales()
+        verrou = threading.Lock()
+        en_attente = []
+
+        def emettre_options(_futur=None):
+            if not futur_options.done() or futur_options.cancelled() or futur_options.exception() is not None:
+                return
+            options_cycle = futur_options.result()
+            with verrou:
+                for etape in en_attente:
+                    options, ville = self._options_etape(etape.get("titre", ""), options_cycle, cycle)
+                    sur_evenement("options", {"numero": etape["numero"], "options": options, "ville_recherche": ville})
+                en_attente.clear()
+
+        futur_options.add_done_callback(emettre_options)
+
+        def sur_morceau(morceau: str):
+            if arret is not None and arret.is_set():
+                raise GenerationInterrompue()
+            for rang, etape in analyseur.ajouter(morceau):
+                etape = valider(etape, Etape)[0] or etape
+                self._completer_etapes([etape], premier=rang)
+                with verrou:
+                    sur_evenement("etape", etape)
+                    en_attente.append(etape)
+                emettre_options()
+
+        return sur_morceau
+
+    def generer_parcours_flux(
+        self, profil: dict, formation_choisie: dict, attente: float = None, arret: threading.Event = None
+    ):
+        """
+        Variante en flux de generer_parcours : genere des couples (evenement, donnees)
+          "etape"              : une etape des qu'elle est complete dans la reponse du LLM
+          "options"            : formations reelles (T2) de cette etape
+          "etape_personnalisee": conseils personnalises d'une etape (mode squelettes : les
+                                 etapes emises sont celles du squelette generique, leurs
+                                 conseils sont remplaces apres la passe de personnalisation)
+          "parcours"           : parcours final, valide, personnalise et enrichi (dernier evenement)
+          "erreur"             : la generation a echoue (dernier evenement)
+          "attente"            : rien depuis attente secondes (si attente est fourni), pour
+                                 que le consommateur verifie que le client est toujours la
+        La generation tourne dans un thread dedie (le plan de recherche est propre a
+        un thread, et le consommateur peut lire le flux depuis un autre thread).
+        Fermer le generateur ou lever arret (client deconnecte, depuis n'importe quel
+        thread) interrompt la generation : le flux du LLM est abandonne au morceau suivant.
+        """
+        file = queue.Queue()
+        arret = arret or threading.Event()
+
+        def tache():
+            try:
+                parcours = self.generer_parcours(
+                    profil, formation_choisie, arret=arret,
+                    sur_evenement=lambda evenement, donnees: file.put((evenement, donnees)),
+                )
+                file.put(("parcours", parcours))
+            except GenerationInterrompue:
+                print("Generation en flux interrompue (client deconnecte)")
+            except Exception as e:
+                file.put(("erreur", {"detail": str(e)}))
+
+        threading.Thread(target=tache, daemon=True).start()
+        try:
+            while True:
+                try:
+                    evenement, donnees = file.get(timeout=attente)
+                except queue.Empty:
+                    if arret.is_set():
+                        return
+                    yield "attente", {}
+                    continue
+                yield evenement, donnees
+                if evenement in ("parcours", "erreur"):
+                    return
+        finally:
+            arret.set()
+
     def generer_suite_parcours(
         self,
         profil: dict,
@@ -1026,63 +1744,73 @@ class PipelineRAG:
         if not self._initialise:
             raise RuntimeError("Le pipeline n'est pas initialise.")
 
-        profil_texte = formater_profil(profil)
-        choix_texte = json.dumps(choix_precedents, ensure_ascii=False, indent=2)
-        objectif = profil.get("objectif_professionnel", profil.get("objectif", ""))
-
-        # Detecter le cycle depuis les choix precedents
-        dernier_choix = choix_precedents[-1] if choix_precedents else {}
-        cycle = self._detecter_cycle({}, choix_precedents)
-        print(f"Cycle detecte depuis les choix : {cycle}")
-
-        # Niveau atteint = dernier choix fait
-        niveau_atteint = dernier_choix.get("choix", "")
-        ville_actuelle = dernier_choix.get("ville", "")
+        plan = PlanRecherche(self.vectorstore, self.bm25)
+        with self._plan_requete(plan):
+            profil_texte = formater_profil(profil)
+            choix_texte = json.dumps(choix_precedents, ensure_ascii=False, indent=2)
+            objectif = profil.get("objectif_professionnel", profil.get("objectif", ""))
+
+            # Detecter le cycle depuis les choix precedents
+            dernier_choix = choix_precedents[-1] if choix_precedents else {}
+            cycle = self._detecter_cycle({}, choix_precedents)
+            print(f"Cycle detecte depuis les choix : {cycle}")
+
+            # Niveau atteint = dernier choix fait
+            niveau_atteint = dernier_choix.get("choix", "")
+            ville_actuelle = dernier_choix.get("ville", "")
+
+            # Construire un profil mis a jour avec la ville du dernier choix
+            profil_mis_a_jour = {
+                **profil,
+                "contraintes_geographiques": ville_actuelle or profil.get("contraintes_geographiques", ""),
+            }
 
-        # Construire un profil mis a jour avec la ville du dernier choix
-        profil_mis_a_jour = {
-            **profil,
-            "contraintes_geographiques": ville_actuelle or profil.get("contraintes_geographiques", ""),
-        }
+            # Niveaux restants a partir du dernier choix
+            niveaux_restants = self._predire_niveaux_etapes(niveau_atteint)
+            self._planifier_recherches(
+                plan, niveaux_restants, objectif, profil_mis_a_jour, profil_mis_a_jour, cycle
+            )
+            formations_context = self._construire_context_formations_par_niveau(
+                niveaux_restants, objectif, profil_mis_a_jour, top_k=5
+            )
 
-        # Niveaux restants a partir du dernier choix
-        niveaux_restants = self._predire_niveaux_etapes(niveau_atteint)
-        formations_context = self._construire_context_formations_par_niveau(
-            niveaux_restants, objectif, profil_mis_a_jour, top_k=5
-        )
+            cycle_label = (
+                "Cycle universitaire (Licence → Master)"
+                if cycle == "universitaire"
+                else "Cycle technologique (BUT → Licence Pro ou insertion)"
+            )
 
-        cycle_label = (
-            "Cycle universitaire (Licence → Master)"
-            if cycle == "universitaire"
-            else "Cycle technologique (BUT → Licence Pro ou insertion)"
-        )
+            domaine_actuel = ", ".join(profil.get("domaines_etudes_preferes", [])) or "Non specifie"
+            prompt_final = PROMPT_SUITE_PARCOURS.format(
+                profil_etudiant=profil_texte,
+                choix_precedents=choix_texte,
+                formation_cible=formation_cible,
+                formations_disponibles=formations_context,
+                cycle=cycle_label,
+                niveau_atteint=niveau_atteint,
+                domaine_actuel=domaine_actuel,
+            )
 
-        domaine_actuel = ", ".join(profil.get("domaines_etudes_preferes", [])) or "Non specifie"
-        prompt_final = PROMPT_SUITE_PARCOURS.format(
-            profil_etudiant=profil_texte,
-            choix_precedents=choix_texte,
-            formation_cible=formation_cible,
-            formations_disponibles=formations_context,
-            cycle=cycle_label,
-            niveau_atteint=niveau_atteint,
-            domaine_actuel=domaine_actuel,
-        )
+            # Recherches T2 pendant l'appel au LLM
+            futur_options = self._lancer_options_cycle(plan, profil_mis_a_jour, cycle)
 
-        print(f"Re-personnalisation depuis : {niveau_atteint} | cycle={cycle}")
-        reponse = self.llm.invoke(prompt_final)
-        contenu = reponse.content if hasattr(reponse, 'content') else str(reponse)
+            print(f"Re-personnalisation depuis : {niveau_atteint} | cycle={cycle}")
+            try:
+                result, _, _ = self._generer_json(prompt_final, SuiteParcours, "suite")
+            except Exception:
+                futur_options.cancel()
+                raise
 
-        try:
-            result = json.loads(self._nettoyer_json(contenu))
+            if result is None:
+                futur_options.cancel()
+                print("Erreur JSON dans la re-personnalisation\n")
+                return {"etapes": [], "_cycle": cycle}
             print("Parcours re-personnalise genere\n")
             result = self.enrichir_options_etapes(
-                result, profil_mis_a_jour, cycle=cycle
+                result, profil_mis_a_jour, cycle=cycle, options=futur_options.result()
             )
             result["_cycle"] = cycle
             return result
-        except json.JSONDecodeError:
-            print("Erreur JSON dans la re-personnalisation\n")
-            return {"etapes": [], "_cycle": cycle}
 
 
 # Test rapide
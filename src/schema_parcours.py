@@ -0,0 +1,329 @@
+# schema_parcours.py
+# Schemas Pydantic des reponses du LLM (parcours, suite, personnalisation),
+# lecture tolerante du JSON (balises, virgules en trop, guillemets non echappes,
+# reponse tronquee) et reperage des champs invalides pour une reparation ciblee :
+# le pipeline ne redemande au LLM que le champ casse, pas tout le parcours.
+# Lecture incrementale des etapes d'une reponse en flux (cf. EtapesIncrementales).
+
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Annotated
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError, model_validator
+
+load_dotenv()
+
+# Mode JSON du fournisseur (response_format / format=json) pour les generations
+GENERATION_JSON = os.getenv("GENERATION_JSON", "1") == "1"
+# Au-dela de ce nombre de champs invalides, pas de reparation ciblee
+REPARATION_MAX_CHAMPS = int(os.getenv("REPARATION_MAX_CHAMPS", "3"))
+
+
+def _liste(valeur):
+    """Une chaine seule ou null la ou une liste est attendue : coercition sans appel au LLM."""
+    if valeur is None:
+        return []
+    if isinstance(valeur, str):
+        return [valeur] if valeur.strip() else []
+    return valeur
+
+
+ListeTextes = Annotated[list[str], BeforeValidator(_liste)]
+
+
+class Defi(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    defi: str
+    solution: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _depuis_texte(cls, valeur):
+        return {"defi": valeur} if isinstance(valeur, str) else valeur
+
+
+ListeDefis = Annotated[list[Defi], BeforeValidator(_liste)]
+
+
+class Etape(BaseModel):
+    # numero / duree / periode / options sont ajoutes cote serveur (extra)
+    model_config = ConfigDict(extra="allow")
+
+    titre: str = Field(min_length=1)
+    description: str
+    competences_visees: ListeTextes = []
+    objectifs: ListeTextes = []
+    conseils_etape: ListeTextes = []
+    defis_etape: ListeDefis = []
+
+
+class Prerequis(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    academiques: ListeTextes = []
+    administratifs: ListeTextes = []
+    calendrier: ListeTextes = []
+
+
+class Parcours(BaseModel):
+    """Reponse de PROMPT_PARCOURS (parcours complet ou squelette)."""
+    model_config = ConfigDict(extra="allow")
+
+    resume: str
+    adequation_profil: str = ""
+    etapes: list[Etape] = Field(min_length=1)
+    prerequis: Prerequis = Prerequis()
+    defis: ListeDefis = []
+    conseils_personnalises: ListeTextes = []
+    debouches_vises: ListeTextes = []
+
+
+class SuiteParcours(BaseModel):
+    """Reponse de PROMPT_SUITE_PARCOURS."""
+    model_config = ConfigDict(extra="allow")
+
+    etapes: list[Etape] = Field(min_length=1)
+
+
+class Personnalisation(BaseModel):
+    """Reponse de PROMPT_PERSONNALISATION."""
+    model_config = ConfigDict(extra="allow")
+
+    adequation_profil: str = ""
+    conseils_personnalises: ListeTextes = []
+    defis: ListeDefis = []
+    conseils_etapes: list[ListeTextes] = []
+
+
+# Format attendu de chaque champ, rappele au LLM dans la reparation ciblee
+FORMATS_CHAMPS = {
+    "resume": '"Vue d\'ensemble du parcours"',
+    "adequation_profil": '"Analyse du profil"',
+    "titre": '"M1 Data Science"',
+    "description": '"Pourquoi cette etape"',
+    "competences_visees": '["Competence"]',
+    "objectifs": '["Objectif"]',
+    "conseils_etape": '["Conseil 1", "Conseil 2"]',
+    "defis_etape": '[{"defi": "Difficulte", "solution": "Solution"}]',
+    "defis": '[{"defi": "Difficulte", "solution": "Solution"}]',
+    "prerequis": '{"academiques": ["..."], "administratifs": ["..."], "calendrier": ["..."]}',
+    "conseils_personnalises": '["Conseil 1", "Conseil 2"]',
+    "debouches_vises": '["Metier"]',
+    "conseils_etapes": '[["Conseil de l\'etape 1"], ["Conseil de l\'etape 2"]]',
+}
+
+
+def _sans_balises(contenu: str) -> str:
+    """Retire les balises markdown autour du JSON si presentes."""
+    c = contenu.strip()
+    if c.startswith("```json"):
+        c = c[7:]
+    if c.startswith("```"):
+        c = c[3:]
+    if c.endswith("```"):
+        c = c[:-3]
+    return c.strip()
+
+
+def _fermer(texte: str) -> str:
+    """Ferme une reponse tronquee : chaine ouverte, puis accolades / crochets ouverts."""
+    pile = []
+    dans_chaine = echappe = False
+    for c in texte:
+        if dans_chaine:
+            if echappe:
+                echappe = False
+            elif c == "\\":
+                echappe = True
+            elif c == '"':
+                dans_chaine = False
+        elif c == '"':
+            dans_chaine = True
+        elif c in "{[":
+            pile.append("}" if c == "{" else "]")
+        elif c in "}]" and pile:
+            pile.pop()
+    if dans_chaine:
+        texte += '"'
+    texte = texte.rstrip().rstrip(",:")
+    return texte + "".join(reversed(pile))
+
+
+def _echapper_guillemets(texte: str, essais: int = 20) -> str | None:
+    """
+    Guillemets non echappes dans une valeur ("le "Master" de ...") : a chaque erreur
+    de delimiteur, le dernier guillemet avant la position fautive est echappe.
+    """
+    for _ in range(essais):
+        try:
+            json.loads(texte)
+            return texte
+        except json.JSONDecodeError as e:
+            if not e.msg.startswith("Expecting ',' delimiter") and not e.msg.startswith("Expecting ':' delimiter"):
+                return None
+            position = texte.rfind('"', 0, e.pos)
+            if position <= 0:
+                return None
+            texte = texte[:position] + '\\"' + texte[position + 1:]
+    return None
+
+
+def extraire_json(contenu: str) -> tuple[object, str]:
+    """
+    (donnees, lecture) : lecture "directe" si le JSON est valide, "locale" s'il a fallu
+    le reparer sans LLM (texte autour, virgules en trop, guillemets, troncature),
+    (None, "") si la reponse reste illisible.
+    """
+    texte = _sans_balises(contenu)
+    try:
+        return json.loads(texte), "directe"
+    except json.JSONDecodeError:
+        pass
+
+    debut, fin = texte.find("{"), texte.rfind("}")
+    bloc = texte[debut:fin + 1] if 0 <= debut < fin else texte[debut:] if debut >= 0 else texte
+    candidats = [bloc, re.sub(r",\s*([}\]])", r"\1", bloc), _fermer(texte[max(debut, 0):])]
+    for candidat in candidats:
+        try:
+            return json.loads(candidat), "locale"
+        except json.JSONDecodeError:
+            continue
+    repare = _echapper_guillemets(re.sub(r",\s*([}\]])", r"\1", bloc))
+    if repare is not None:
+        return json.loads(repare), "locale"
+    return None, ""
+
+
+def valider(donnees: dict, modele: type[BaseModel]) -> tuple[dict | None, list[dict]]:
+    """(donnees normalisees, []) si le schema est respecte, sinon (None, erreurs Pydantic)."""
+    try:
+        return modele.model_validate(donnees).model_dump(), []
+    except ValidationError as e:
+        return None, e.errors()
+
+
+def champs_invalides(erreurs: list[dict]) -> list[tuple[tuple, str]]:
+    """
+    Champs a reparer, sans doublon : (chemin, message). Un champ d'etape est repare
+    seul (("etapes", 2, "description")) ; la liste des etapes entiere ne l'est pas.
+    """
+    champs = {}
+    for erreur in erreurs:
+        loc = tuple(erreur["loc"])
+        if not loc:
+            continue
+        if loc[0] in ("etapes", "conseils_etapes") and len(loc) >= 3 and isinstance(loc[1], int):
+            chemin = loc[:3]
+        else:
+            chemin = loc[:1]
+        champs.setdefault(chemin, erreur["msg"])
+    return list(champs.items())
+
+
+def lire_champ(donnees: dict, chemin: tuple):
+    valeur = donnees
+    for cle in chemin:
+        try:
+            valeur = valeur[cle]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return valeur
+
+
+def ecrire_champ(donnees: dict, chemin: tuple, valeur) -> bool:
+    parent = lire_champ(donnees, chemin[:-1])
+    if isinstance(parent, dict) or (isinstance(parent, list) and isinstance(chemin[-1], int)
+                                    and chemin[-1] < len(parent)):
+        parent[chemin[-1]] = valeur
+        return True
+    return False
+
+
+class EtapesIncrementales:
+    """
+    Lecture incrementale d'une reponse en cours de generation (LLM en flux) :
+    chaque objet du tableau "etapes" de la racine est rendu des que son accolade
+    fermante arrive, sans attendre la fin du JSON. Les morceaux sont ajoutes dans
+    l'ordre ; le texte n'est parcouru qu'une fois.
+    """
+
+    def __init__(self):
+        self.texte = ""
+        self.vues = 0
+        self._pile = []
+        self._dans_chaine = self._echappe = False
+        self._debut_chaine = 0
+        self._cle = None
+        self._dans_etapes = False
+        self._etapes_lues = False
+        self._debut_etape = None
+
+    def ajouter(self, morceau: str) -> list[tuple[int, dict]]:
+        """(rang, etape) des etapes completees par ce morceau (etape illisible : rang saute)."""
+        debut = len(self.texte)
+        self.texte += morceau
+        etapes = []
+        for i in range(debut, len(self.texte)):
+            c = self.texte[i]
+            if self._dans_chaine:
+                if self._echappe:
+                    self._echappe = False
+                elif c == "\\":
+                    self._echappe = True
+                elif c == '"':
+                    self._dans_chaine = False
+                    if len(self._pile) == 1:
+                        self._cle = self.texte[self._debut_chaine:i]
+            elif c == '"':
+                self._dans_chaine = True
+                self._debut_chaine = i + 1
+            elif c in "{[":
+                if c == "[" and self._pile == ["{"] and self._cle == "etapes" and not self._etapes_lues:
+                    self._dans_etapes = True
+                self._pile.append(c)
+                if c == "{" and self._dans_etapes and len(self._pile) == 3:
+                    self._debut_etape = i
+            elif c in "}]" and self._pile:
+                self._pile.pop()
+                if not self._dans_etapes:
+                    continue
+                if c == "}" and len(self._pile) == 2 and self._debut_etape is not None:
+                    etape, _ = extraire_json(self.texte[self._debut_etape:i + 1])
+                    if isinstance(etape, dict):
+                        etapes.append((self.vues, etape))
+                    self.vues += 1
+                    self._debut_etape = None
+                elif c == "]" and len(self._pile) == 1:
+                    self._dans_etapes = False
+                    self._etapes_lues = True
+        return etapes
+
+
+class MetriquesGeneration:
+    """
+    Compteurs par nature de generation (parcours, squelette, personnalisation, suite) :
+    reponses, lectures directes / reparees localement, schemas invalides, champs
+    repares par le LLM, reparations reussies, reponses illisibles ou restees invalides.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._compteurs = {}
+
+    def noter(self, nature: str, **increments):
+        with self._verrou:
+            compteur = self._compteurs.setdefault(nature, Counter())
+            compteur.update(increments)
+
+    def stats(self) -> dict:
+        with self._verrou:
+            compteurs = {nature: dict(c) for nature, c in self._compteurs.items()}
+        for c in compteurs.values():
+            reponses = c.get("reponses", 0)
+            c["taux_echec"] = round((c.get("illisibles", 0) + c.get("invalides", 0)) / reponses, 3) if reponses else 0.0
+        return compteurs
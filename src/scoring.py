@@ -0,0 +1,259 @@
+# scoring.py
+# Moteur de re-classement des candidats (recommandations et Masters)
+# Les documents sont encodes une fois (tokens normalises + colonnes numeriques) ;
+# re-classer quelques centaines de candidats se resume a quelques operations NumPy.
+
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# Villes au meilleur reseau Master (bonus du classement des Masters)
+VILLES_PARIS = ["paris", "saclay", "nanterre", "creteil", "sceaux",
+                "orsay", "guyancourt", "villetaneuse", "saint-denis"]
+
+_TOKEN = re.compile(r"[a-z0-9]+[+#]*")
+
+
+def normaliser_texte(texte: str) -> str:
+    """Minuscules sans accents : 'Ingénieur Données' -> 'ingenieur donnees'."""
+    if not texte:
+        return ""
+    return unicodedata.normalize("NFKD", texte).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def tokeniser(texte: str) -> list[str]:
+    """Decoupe un texte normalise en tokens (garde 'c++' et 'c#')."""
+    return _TOKEN.findall(normaliser_texte(texte))
+
+
+def _debouches(meta: dict) -> str:
+    # Metadonnees de l'index : "debouches" (chaine) ; "debouches_metiers" : formation brute
+    brut = meta.get("debouches") or meta.get("debouches_metiers", "")
+    return brut if isinstance(brut, str) else " ".join(brut or [])
+
+
+class IndexScoring:
+    """
+    Caracteristiques pre-calculees de chaque document de l'index :
+    - listes de postings token -> lignes pour les champs nom / debouches / contenu
+    - colonnes : type de diplome, domaine (codes), ville_id, Master parisien, prive
+    Un document inconnu (index reconstruit entre-temps) est encode a la volee.
+    """
+
+    CHAMPS = ("nom", "debouches", "contenu")
+
+    def __init__(self):
+        self._lignes = {}                                  # page_content -> ligne
+        self._postings = {c: {} for c in self.CHAMPS}      # champ -> token -> [lignes]
+        self._codes = {"type_diplome": {}, "domaine": {}}  # valeur -> code
+        self._brut = {"type_diplome": [], "domaine": [], "ville_id": [], "paris": [], "prive": []}
+        self._colonnes = None
+        self._masques = {}
+        self._verrou = threading.Lock()
+
+    @classmethod
+    def depuis_documents(cls, documents: list[Document]) -> "IndexScoring":
+        index = cls()
+        with index._verrou:
+            for doc in documents:
+                index._encoder(doc)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._lignes)
+
+    def _code(self, colonne: str, valeur: str) -> int:
+        codes = self._codes[colonne]
+        return codes.setdefault(valeur or "", len(codes))
+
+    def _encoder(self, doc: Document) -> int:
+        ligne = self._lignes.get(doc.page_content)
+        if ligne is not None:
+            return ligne
+        ligne = len(self._lignes)
+        self._lignes[doc.page_content] = ligne
+
+        meta = doc.metadata
+        textes = {
+            "nom": meta.get("nom", ""),
+            "debouches": _debouches(meta),
+            "contenu": doc.page_content,
+        }
+        for champ, texte in textes.items():
+            postings = self._postings[champ]
+            for token in set(tokeniser(texte)):
+                postings.setdefault(token, []).append(ligne)
+
+        ville = (meta.get("ville", "") or "").lower()
+        self._brut["type_diplome"].append(self._code("type_diplome", meta.get("type_diplome", "")))
+        self._brut["domaine"].append(self._code("domaine", meta.get("domaine", "")))
+        self._brut["ville_id"].append(int(meta.get("ville_id") or 0))
+        self._brut["paris"].append(any(v in ville for v in VILLES_PARIS))
+        self._brut["prive"].append("priv" in (meta.get("modalite", "") or "").lower())
+        self._colonnes = None
+        self._masques = {}
+        return ligne
+
+    def lignes(self, docs: list[Document]) -> np.ndarray:
+        """Lignes des documents (encodes a la volee si besoin)."""
+        with self._verrou:
+            lignes = [self._lignes.get(d.page_content) for d in docs]
+            if None in lignes:
+                lignes = [self._encoder(d) for d in docs]
+        return np.asarray(lignes, dtype=np.int64)
+
+    def colonne(self, nom: str) -> np.ndarray:
+        with self._verrou:
+            if self._colonnes is None:
+                self._colonnes = {
+                    "type_diplome": np.asarray(self._brut["type_diplome"], dtype=np.int32),
+                    "domaine": np.asarray(self._brut["domaine"], dtype=np.int32),
+                    "ville_id": np.asarray(self._brut["ville_id"], dtype=np.int64),
+                    "paris": np.asarray(self._brut["paris"], dtype=bool),
+                    "prive": np.asarray(self._brut["prive"], dtype=bool),
+                }
+            return self._colonnes[nom]
+
+    def codes(self, colonne: str, valeurs) -> np.ndarray:
+        """Codes des valeurs connues d'une colonne categorielle."""
+        connus = self._codes[colonne]
+        return np.asarray([connus[v] for v in valeurs if v in connus], dtype=np.int32)
+
+    def rang(self, colonne: str, valeurs_ordonnees: list, lignes: np.ndarray, defaut: int) -> np.ndarray:
+        """Position de la valeur de chaque ligne dans valeurs_ordonnees (defaut si absente)."""
+        connus = self._codes[colonne]
+        table = np.full(len(connus) + 1, defaut, dtype=np.int32)
+        for position, valeur in reversed(list(enumerate(valeurs_ordonnees))):
+            if valeur in connus:
+                table[connus[valeur]] = position
+        return table[self.colonne(colonne)[lignes]]
+
+    def _masque_token(self, champ: str, token: str) -> np.ndarray:
+        cle = (champ, token)
+        masque = self._masques.get(cle)
+        if masque is None:
+            masque = np.zeros(len(self._lignes), dtype=bool)
+            masque[self._postings[champ].get(token, [])] = True
+            self._masques[cle] = masque
+        return masque
+
+    def contient(self, champ: str, terme: str, lignes: np.ndarray) -> np.ndarray:
+        """Pour chaque ligne : le champ contient-il tous les tokens du terme ?"""
+        tokens = tokeniser(terme)
+        resultat = np.ones(len(lignes), dtype=bool) if tokens else np.zeros(len(lignes), dtype=bool)
+        with self._verrou:
+            for token in tokens:
+                resultat &= self._masque_token(champ, token)[lignes]
+        return resultat
+
+
+def classer_recommandations(
+    index: IndexScoring,
+    docs: list[Document],
+    types_preferes: list[str],
+    domaines_bd: set,
+    score_ville=None,
+) -> list[Document]:
+    """
+    Re-classement de recommander_formations (tri stable, cles par priorite) :
+    1. rang du type de diplome dans types_preferes (absent = en dernier)
+    2. domaine de l'etudiant avant les autres
+    3. score_ville(ville_id) decroissant, s'il est fourni (calcule une fois par ville)
+    A egalite, l'ordre de similarite de l'index est conserve.
+    """
+    if not docs:
+        return []
+    lignes = index.lignes(docs)
+
+    type_score = index.rang("type_diplome", types_preferes, lignes, len(types_preferes) + 10)
+    domaines = index.codes("domaine", domaines_bd or ())
+    domain_score = (~np.isin(index.colonne("domaine")[lignes], domaines)).astype(np.int32)
+
+    # np.lexsort : la derniere cle est la cle principale
+    cles = [domain_score, type_score]
+    if score_ville is not None:
+        villes, inverse = np.unique(index.colonne("ville_id")[lignes], return_inverse=True)
+        scores = np.asarray([score_ville(int(v)) for v in villes], dtype=np.float64)
+        cles.insert(0, -scores[inverse])
+    ordre = np.lexsort(cles)
+    return [docs[i] for i in ordre]
+
+
+def scores_masters(
+    index: IndexScoring,
+    docs: list[Document],
+    objectif: str,
+    moyenne: float,
+    budget: str,
+    competences: list[str],
+    formations_objectif: set = None,
+) -> np.ndarray:
+    """
+    Score multi-criteres des Masters (plus bas = meilleur) :
+    1. Pertinence (0-30) : objectif dans les debouches (0), >= 2 mots (5), 1 mot (10),
+       dans le nom (15), dans le contenu (20), aucun (30).
+       formations_objectif (formation_id menant au metier vise, cf. TaxonomieMetiers)
+       compte comme "objectif dans les debouches".
+    2. Bonus Paris (-3) : meilleur reseau, plus de debouches, reputation
+    3. Notes : moyenne >= 14 -> 0, >= 12 -> 2, sinon 5 (Masters plus accessibles)
+    4. Budget : "Public uniquement" -> +50 pour les formations privees
+    5. Competences techniques : -1 par competence presente (nom ou contenu), max -5
+    Les correspondances se font sur les tokens normalises (casse et accents ignores).
+    """
+    lignes = index.lignes(docs)
+    n = len(lignes)
+    mots = list(dict.fromkeys(tokeniser(objectif)))
+
+    def nb_mots(champ):
+        compte = np.zeros(n, dtype=np.int32)
+        for m in mots:
+            compte += index.contient(champ, m, lignes)
+        return compte
+
+    nb_debouches = nb_mots("debouches")
+    dans_debouches = index.contient("debouches", objectif, lignes)
+    if formations_objectif:
+        dans_debouches |= np.fromiter(
+            (d.metadata.get("formation_id") in formations_objectif for d in docs), dtype=bool, count=n
+        )
+    score_pert = np.select(
+        [
+            dans_debouches,
+            nb_debouches >= 2,
+            nb_debouches >= 1,
+            nb_mots("nom") >= 1,
+            nb_mots("contenu") >= 1,
+        ],
+        [0, 5, 10, 15, 20],
+        default=30,
+    )
+
+    bonus_paris = np.where(index.colonne("paris")[lignes], -3, 0)
+
+    if moyenne >= 14:
+        ajust_notes = 0
+    elif moyenne >= 12:
+        ajust_notes = 2
+    else:
+        ajust_notes = 5
+
+    budget_pen = np.zeros(n, dtype=np.int32)
+    if "public uniquement" in (budget or "").lower():
+        budget_pen = np.where(index.colonne("prive")[lignes], 50, 0)
+
+    nb_comp = np.zeros(n, dtype=np.int32)
+    for comp in competences:
+        nb_comp += (index.contient("contenu", comp, lignes) | index.contient("nom", comp, lignes))
+    bonus_comp = -np.minimum(nb_comp, 5)
+
+    return score_pert + bonus_paris + ajust_notes + budget_pen + bonus_comp
+
+
+def classer_par_score(docs: list[Document], scores: np.ndarray) -> tuple[list[Document], np.ndarray]:
+    """Tri stable par score croissant : retourne (docs tries, scores tries)."""
+    ordre = np.argsort(scores, kind="stable")
+    return [docs[i] for i in ordre], scores[ordre]
@@ -0,0 +1,226 @@
+# selectivite.py
+# Statistiques de cardinalite des metadonnees indexees et recherche a k adaptatif.
+# Au lieu de sur-fetcher un k fixe (50, 60, top_k * 5...), le nombre de candidats
+# demande a l'index est estime a partir du filtre (documents qui le satisfont,
+# documents par formation), puis augmente a la demande tant qu'il manque des
+# formations retenues, dans la limite de RECHERCHE_K_MAX.
+
+import math
+import os
+import threading
+from collections import Counter, deque
+from itertools import combinations
+
+from dotenv import load_dotenv
+
+from src.vectorstore import _valeurs_autorisees
+
+load_dotenv()
+
+# Plafond de cout : k maximal demande a l'index pour une recherche
+RECHERCHE_K_MAX = int(os.getenv("RECHERCHE_K_MAX", "200"))
+# Marge appliquee au k estime (doublons et documents ecartes apres la recherche)
+RECHERCHE_MARGE = float(os.getenv("RECHERCHE_MARGE", "1.5"))
+
+# Champs des filtres construits par le pipeline (construire_filtre, partitions)
+CHAMPS_STATISTIQUES = ("type_diplome", "ville_id", "academie_id", "domaine")
+
+
+def cle_formation(meta: dict) -> str:
+    """Cle de deduplication des formations : nom + etablissement + ville."""
+    return "|".join(
+        str(meta.get(champ, "")).lower().strip() for champ in ("nom", "etablissement", "ville")
+    )
+
+
+class StatistiquesMetadonnees:
+    """
+    Cardinalites des metadonnees des documents indexes :
+    - comptes : champ -> Counter(valeur)
+    - joints  : (champ_a, champ_b) -> Counter((valeur_a, valeur_b)), pour les
+                filtres a deux champs (type_diplome + ville_id) : estimation exacte
+    - doublons : documents par formation distincte (>= 1)
+    Au-dela de deux champs, les selectivites sont supposees independantes.
+    Une estimation nulle est toujours exacte (une des valeurs n'a aucun document).
+    """
+
+    def __init__(self, total: int, comptes: dict, joints: dict, doublons: float = 1.0):
+        self.total = total
+        self.comptes = comptes
+        self.joints = joints
+        self.doublons = doublons
+
+    @classmethod
+    def depuis_documents(cls, documents: list, champs: tuple = CHAMPS_STATISTIQUES) -> "StatistiquesMetadonnees":
+        comptes = {champ: Counter() for champ in champs}
+        joints = {paire: Counter() for paire in combinations(champs, 2)}
+        formations = set()
+        for doc in documents:
+            meta = doc.metadata
+            valeurs = {champ: meta.get(champ) for champ in champs}
+            for champ, valeur in valeurs.items():
+                comptes[champ][valeur] += 1
+            for a, b in joints:
+                joints[(a, b)][(valeurs[a], valeurs[b])] += 1
+            formations.add(cle_formation(meta))
+        doublons = len(documents) / len(formations) if formations else 1.0
+        return cls(len(documents), comptes, joints, doublons)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def estimer(self, filtre: dict = None) -> tuple[int, bool]:
+        """
+        (documents satisfaisant le filtre, estimation exacte ?).
+        Seules les egalites / $in sur les champs suivis restreignent l'estimation :
+        les autres clauses ($ne, $or...) la laissent par exces.
+        """
+        permis = {c: v for c, v in _valeurs_autorisees(filtre).items() if c in self.comptes}
+        exacte = len(permis) == len(_valeurs_autorisees(filtre)) and not _autres_clauses(filtre)
+        if not permis or not self.total:
+            return self.total, exacte
+        champs = sorted(permis, key=CHAMPS_STATISTIQUES.index)
+        if len(champs) == 1:
+            champ = champs[0]
+            return sum(self.comptes[champ][v] for v in permis[champ]), exacte
+        if len(champs) == 2:
+            a, b = champs
+            joint = self.joints[(a, b)]
+            return sum(joint[(va, vb)] for va in permis[a] for vb in permis[b]), exacte
+
+        n = float(self.total)
+        for champ in champs:
+            n *= sum(self.comptes[champ][v] for v in permis[champ]) / self.total
+        return math.ceil(n), False
+
+    def k_formations(self, voulues: int, filtre: dict = None) -> int:
+        """k initial pour obtenir voulues formations distinctes (doublons + marge), borne par le filtre."""
+        cardinalite, _ = self.estimer(filtre)
+        k = max(voulues, math.ceil(voulues * self.doublons * RECHERCHE_MARGE))
+        return min(k, cardinalite, RECHERCHE_K_MAX)
+
+    def k_candidats(self, pool: int, filtre: dict = None) -> int:
+        """k d'un pool de candidats a re-classer : inutile de demander plus que le filtre n'en contient."""
+        cardinalite, _ = self.estimer(filtre)
+        return min(pool, cardinalite, RECHERCHE_K_MAX)
+
+    def resume(self) -> dict:
+        """Cardinalites par champ (pour /stats)."""
+        return {
+            "documents": self.total,
+            "documents_par_formation": round(self.doublons, 3),
+            "valeurs_distinctes": {champ: len(c) for champ, c in self.comptes.items()},
+        }
+
+
+def _autres_clauses(filtre: dict) -> bool:
+    """Le filtre contient-il des clauses que l'estimation ignore ($or, $ne, $nin) ?"""
+    for cle, valeur in (filtre or {}).items():
+        if cle == "$and":
+            if any(_autres_clauses(sous) for sous in valeur):
+                return True
+        elif cle.startswith("$") or (isinstance(valeur, dict) and set(valeur) - {"$eq", "$in"}):
+            return True
+    return False
+
+
+class SuiviRecherche:
+    """Compteurs d'une recherche adaptative (une ou plusieurs recherches par ville)."""
+
+    def __init__(self, voulus: int, estimation: int = 0):
+        self.voulus = voulus
+        self.estimation = estimation
+        self.appels = 0
+        self.relances = 0
+        self.k_demandes = 0
+        self.recus = 0
+        self.lus = 0
+        self.retenus = 0
+
+    def resume(self) -> dict:
+        return {
+            "voulus": self.voulus,
+            "estimation": self.estimation,
+            "appels": self.appels,
+            "relances": self.relances,
+            "k_demandes": self.k_demandes,
+            "recus": self.recus,
+            "lus": self.lus,
+            "retenus": self.retenus,
+            "gaspilles": self.recus - self.retenus,
+        }
+
+
+def candidats_progressifs(rechercher, k: int, suivi: SuiviRecherche, borne: int = None,
+                          k_max: int = RECHERCHE_K_MAX):
+    """
+    Genere les documents d'une recherche par rang, sans fixer k a l'avance.
+    rechercher(k) est relance avec k double quand les documents deja recus sont
+    epuises ; arret quand l'index n'en a plus (moins de k resultats), quand k
+    atteint borne (nombre exact de documents du filtre) ou k_max.
+    Les documents deja generes ne le sont pas une seconde fois (cle page_content,
+    comme la fusion RRF), meme si la relance change leur ordre.
+    """
+    k = max(1, min(k, k_max))
+    vus = set()
+    while True:
+        docs = rechercher(k)
+        suivi.appels += 1
+        suivi.k_demandes += k
+        suivi.recus += len(docs)
+        for doc in docs:
+            if doc.page_content in vus:
+                continue
+            vus.add(doc.page_content)
+            suivi.lus += 1
+            yield doc
+        if len(docs) < k or k >= k_max or (borne is not None and k >= borne):
+            return
+        k = min(2 * k, k_max)
+        suivi.relances += 1
+
+
+def tour_par_tour(generateurs: list):
+    """Fusionne des generateurs de documents classes : rang 1 de chacun, puis rang 2..."""
+    actifs = list(generateurs)
+    while actifs:
+        suivants = []
+        for gen in actifs:
+            doc = next(gen, None)
+            if doc is not None:
+                suivants.append(gen)
+                yield doc
+        actifs = suivants
+
+
+class StatsRecherche:
+    """
+    Statistiques agregees des recherches adaptatives (thread-safe) :
+    candidats recus de l'index, retenus, gaspilles (doublons, relus apres relance,
+    non consommes), relances et recherches sous-remplies ; dernieres requetes detaillees.
+    """
+
+    def __init__(self, historique: int = 50):
+        self._verrou = threading.Lock()
+        self._dernieres = deque(maxlen=historique)
+        self._totaux = Counter()
+
+    def enregistrer(self, suivi: SuiviRecherche, requete: str = ""):
+        resume = suivi.resume()
+        with self._verrou:
+            self._totaux["recherches"] += 1
+            self._totaux["sous_remplies"] += int(suivi.retenus < suivi.voulus)
+            for cle in ("appels", "relances", "k_demandes", "recus", "retenus", "gaspilles"):
+                self._totaux[cle] += resume[cle]
+            self._dernieres.append({"requete": requete[:80], **resume})
+
+    def stats(self) -> dict:
+        with self._verrou:
+            totaux = dict(self._totaux)
+            dernieres = list(self._dernieres)
+        recus = totaux.get("recus", 0)
+        return {
+            **totaux,
+            "taux_gaspillage": round(totaux.get("gaspilles", 0) / recus, 3) if recus else 0.0,
+            "dernieres": dernieres,
+        }
@@ -1,45 +1,250 @@
 # vectorstore.py
-# Gestion de la base vectorielle ChromaDB
+# Gestion de la base vectorielle (ChromaDB, index NumPy ou FAISS en memoire)
 # Permet de creer, charger et interroger l'index des formations
 
 import os
+import abc
+import json
+import uuid
+import hashlib
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
 from pathlib import Path
 
+import numpy as np
+try:
+    import faiss
+except ImportError:  # moteur "faiss" optionnel (pip install faiss-cpu)
+    faiss = None
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 
 from dotenv import load_dotenv
 
+from src.cache_embeddings import EMBEDDING_DISK_CACHE_DIR, CacheEmbeddingsDisque
+from src.embeddings_onnx import FICHIERS_ONNX, OnnxEmbeddings
+from src.encodage import encoder_documents
+
 load_dotenv()
 
 # Chemins et parametres par defaut
 _PROJECT_DIR = Path(__file__).parent.parent
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", str(_PROJECT_DIR / "data" / "chroma_db"))
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+# Moteur d'inference du modele d'embedding : "torch", "onnx" ou "onnx-int8"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
 
+# Moteur de recherche : "chroma" (defaut), "numpy" (recherche exacte en memoire)
+# ou "faiss" (Flat / HNSW / IVF-PQ, pour des catalogues 10 a 100x plus grands)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+BACKENDS_DISPONIBLES = ("chroma", "numpy", "faiss")
+NUMPY_SUBDIR = "numpy_index"
+COLLECTION = "orientation_formations"
+
+# Parametres FAISS
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "hnsw").lower()     # flat | hnsw | ivfpq
+FAISS_TYPES = ("flat", "hnsw", "ivfpq")
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))                     # 0 = 4 * sqrt(N)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))
+FAISS_PQ_BITS = int(os.getenv("FAISS_PQ_BITS", "8"))
+# En dessous de ce nombre de candidats, un filtre est resolu par recherche exacte
+FAISS_FILTRE_EXACT = int(os.getenv("FAISS_FILTRE_EXACT", "2048"))
+
+# Stockage compresse de l'index NumPy : pre-classement sur vecteurs compresses,
+# puis re-classement exact float32 (matrice complete lue en memmap) sur une liste courte
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()   # none | float16 | int8
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "0"))                            # 0 = toutes les dimensions
+VECTOR_REDUCTION = os.getenv("VECTOR_REDUCTION", "pca").lower()           # pca | troncature
+RERANK_FACTEUR = int(os.getenv("RERANK_FACTEUR", "4"))
+RERANK_MIN = int(os.getenv("RERANK_MIN", "64"))
+# Lignes compressees converties en float32 a la fois pour le pre-classement
+SCORES_BLOC = 8192
+
+# Partitionnement des index en memoire par metadonnees ("" = un seul index)
+# ex : "type_diplome" ou "type_diplome,academie_id"
+VECTOR_PARTITIONS = [c.strip() for c in os.getenv("VECTOR_PARTITIONS", "type_diplome").split(",") if c.strip()]
+
+# Nombre max de requetes gardees dans le cache d'embeddings (LRU)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+
+
+class CacheRequetes:
+    """
+    Cache LRU borne et thread-safe : (modele, requete) -> vecteur.
+    Les objectifs et domaines de l'interface viennent de listes fixes :
+    les memes requetes reviennent d'un utilisateur a l'autre et evitent
+    ainsi une passe complete du transformer.
+    """
+
+    def __init__(self, taille_max: int = EMBEDDING_CACHE_SIZE):
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._encodages = {}  # moteur -> [nb requetes encodees, secondes]
+
+    def get(self, cle: tuple):
+        with self._verrou:
+            vecteur = self._entrees.get(cle)
+            if vecteur is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return vecteur
+
+    def put(self, cle: tuple, vecteur):
+        with self._verrou:
+            self._entrees[cle] = tuple(vecteur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self.hits = 0
+            self.misses = 0
+            self._encodages.clear()
+
+    def noter_encodage(self, backend: str, nb: int, secondes: float):
+        """Temps passe dans le modele pour les requetes absentes du cache."""
+        with self._verrou:
+            compteur = self._encodages.setdefault(backend, [0, 0.0])
+            compteur[0] += nb
+            compteur[1] += secondes
+
+    def stats(self) -> dict:
+        with self._verrou:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taux_hit": round(self.hits / total, 3) if total else 0.0,
+                "taille": len(self._entrees),
+                "taille_max": self.taille_max,
+                "encodage_ms_par_requete": {
+                    backend: round(1000 * secondes / nb, 2)
+                    for backend, (nb, secondes) in self._encodages.items() if nb
+                },
+            }
 
-def get_embeddings(model_name: str = None) -> HuggingFaceEmbeddings:
+
+# Cache partage par tous les pipelines et tous les chemins de recherche
+CACHE_REQUETES = CacheRequetes()
+
+
+class EmbeddingsEnCache(Embeddings):
+    """
+    Enveloppe un modele d'embedding et met en cache les vecteurs des requetes.
+    La cle inclut le nom du modele et le moteur d'inference : changer de modele
+    (ou passer de PyTorch a ONNX int8) n'expose jamais des vecteurs calcules par un autre.
+    Les documents passent par le cache disque (sha256 du texte) : une reconstruction
+    ne vectorise que les textes nouveaux ou modifies, par lots de longueur homogene
+    repartis sur plusieurs processus (src/encodage.py).
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, cache: CacheRequetes = None, backend: str = "torch"):
+        self.base = base
+        self.model_name = model_name
+        self.backend = backend
+        self.cache = cache or CACHE_REQUETES
+        self._disque = None
+
+    def embed_query(self, text: str) -> list[float]:
+        cle = (self.model_name, self.backend, text)
+        vecteur = self.cache.get(cle)
+        if vecteur is None:
+            debut = time.perf_counter()
+            vecteur = self.base.embed_query(text)
+            self.cache.noter_encodage(self.backend, 1, time.perf_counter() - debut)
+            self.cache.put(cle, vecteur)
+        return list(vecteur)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Vectorise plusieurs requetes : celles absentes du cache sont
+        calculees en UN SEUL appel embed_documents (batch), puis mises en cache.
+        """
+        vecteurs = {}
+        manquantes = []
+        for t in dict.fromkeys(texts):
+            v = self.cache.get((self.model_name, self.backend, t))
+            if v is None:
+                manquantes.append(t)
+            else:
+                vecteurs[t] = v
+        if manquantes:
+            debut = time.perf_counter()
+            calcules = self.base.embed_documents(manquantes)
+            self.cache.noter_encodage(self.backend, len(manquantes), time.perf_counter() - debut)
+            for t, v in zip(manquantes, calcules):
+                self.cache.put((self.model_name, self.backend, t), v)
+                vecteurs[t] = v
+        return [list(vecteurs[t]) for t in texts]
+
+    def _calculer(self, texts: list[str]) -> np.ndarray:
+        return encoder_documents(self.base, texts, self.model_name, self.backend)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not EMBEDDING_DISK_CACHE_DIR:
+            return self._calculer(texts).tolist()
+        if self._disque is None:
+            self._disque = CacheEmbeddingsDisque(self.model_name, self.backend)
+        return self._disque.embed_documents(self._calculer, texts)
+
+
+def get_embeddings(model_name: str = None, backend: str = None) -> Embeddings:
     """
     Charge le modele d'embedding multilingue.
     Le modele tourne en local, pas besoin d'API externe.
+    backend : "torch" (sentence-transformers), "onnx" ou "onnx-int8" (ONNX Runtime,
+    modele exporte par data/scripts/export_onnx.py) ; par defaut EMBEDDING_BACKEND.
+    Les vecteurs des requetes passent par le cache LRU partage (CACHE_REQUETES).
     """
     model_name = model_name or EMBEDDING_MODEL
-    return HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": True}
-    )
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend in FICHIERS_ONNX:
+        base = OnnxEmbeddings(model_name, variante=backend)
+    elif backend == "torch":
+        base = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"normalize_embeddings": True}
+        )
+    else:
+        raise ValueError(
+            f"Moteur d'embedding inconnu : '{backend}'. "
+            f"Utilisez torch, {', '.join(FICHIERS_ONNX)} dans EMBEDDING_BACKEND."
+        )
+    return EmbeddingsEnCache(base, model_name, backend=backend)
+
+
+def stats_cache_embeddings() -> dict:
+    """Compteurs du cache des embeddings de requetes (hits, misses, taille)."""
+    return CACHE_REQUETES.stats()
 
 
 def decouper_documents(documents: list[Document]) -> list[Document]:
     """
     Decoupe les documents longs en morceaux (chunks) plus petits
     pour ameliorer la recherche vectorielle.
-    Les documents courts sont gardes tels quels.
+    Les documents courts sont gardes tels quels, de meme que ceux qui ont un
+    texte vectorise dedie (metadata "texte_embedding") : un seul vecteur par formation.
     """
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
@@ -50,7 +255,7 @@ def decouper_documents(documents: list[Document]) -> list[Document]:
 
     chunks = []
     for doc in documents:
-        if len(doc.page_content) <= CHUNK_SIZE:
+        if len(doc.page_content) <= CHUNK_SIZE or doc.metadata.get("texte_embedding"):
             chunks.append(doc)
         else:
             sous_docs = splitter.split_documents([doc])
@@ -62,28 +267,1053 @@ def decouper_documents(documents: list[Document]) -> list[Document]:
     return chunks
 
 
+def construire_filtre(
+    types_diplome=None,
+    ville_ids=None,
+    domaines=None,
+    academie_ids=None,
+) -> dict | None:
+    """
+    Construit une clause de filtrage (syntaxe "where" de ChromaDB) sur les
+    metadonnees type_diplome, ville_id, domaine et academie_id.
+    Le filtre est applique DANS l'index : une recherche Master a Lyon
+    retourne directement k Masters lyonnais.
+    Retourne None si aucun critere n'est fourni.
+    """
+    clauses = []
+    criteres = (
+        ("type_diplome", types_diplome),
+        ("ville_id", ville_ids),
+        ("domaine", domaines),
+        ("academie_id", academie_ids),
+    )
+    for champ, valeurs in criteres:
+        if not valeurs:
+            continue
+        valeurs = sorted(set(valeurs))
+        if len(valeurs) == 1:
+            clauses.append({champ: valeurs[0]})
+        else:
+            clauses.append({champ: {"$in": valeurs}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class CompressionVecteurs:
+    """
+    Representation compressee des embeddings pour le pre-classement :
+    - reduction de dimension optionnelle : PCA (ajustee sur l'index) ou troncature
+      des premieres dimensions (modeles entraines facon Matryoshka)
+    - quantification : float16, ou int8 symetrique avec une echelle par dimension
+    Les scores approches servent uniquement a choisir la liste courte
+    re-classee ensuite en float32 exact.
+    """
+
+    QUANTIFICATIONS = ("none", "float16", "int8")
+    REDUCTIONS = ("pca", "troncature")
+
+    def __init__(self, quantification: str = None, dimension: int = None, reduction: str = None):
+        self.quantification = (quantification or VECTOR_QUANTIZATION).lower()
+        self.dimension = VECTOR_DIM if dimension is None else dimension
+        self.reduction = (reduction or VECTOR_REDUCTION).lower()
+        if self.quantification not in self.QUANTIFICATIONS:
+            raise ValueError(
+                f"Quantification inconnue : '{self.quantification}'. "
+                f"Utilisez {', '.join(self.QUANTIFICATIONS)} dans VECTOR_QUANTIZATION."
+            )
+        if self.reduction not in self.REDUCTIONS:
+            raise ValueError(
+                f"Reduction inconnue : '{self.reduction}'. "
+                f"Utilisez {', '.join(self.REDUCTIONS)} dans VECTOR_REDUCTION."
+            )
+        self.projection = None   # d x D (PCA)
+        self.echelle = None      # D (int8)
+
+    @property
+    def active(self) -> bool:
+        return self.quantification != "none" or self.dimension > 0
+
+    @property
+    def ajustee(self) -> bool:
+        """Parametres deja ajustes (ou rien a ajuster) : encoder() est utilisable."""
+        if self.dimension and self.reduction == "pca" and self.projection is None:
+            return False
+        return self.quantification != "int8" or self.echelle is not None
+
+    def signature(self) -> str:
+        return f"{self.quantification}-{self.dimension}-{self.reduction if self.dimension else 'aucune'}"
+
+    def _reduire(self, matrice: np.ndarray) -> np.ndarray:
+        if not self.dimension:
+            return matrice
+        if self.reduction == "troncature":
+            return matrice[:, :self.dimension]
+        return matrice @ self.projection
+
+    def ajuster(self, matrice: np.ndarray) -> np.ndarray:
+        """Ajuste la PCA / les echelles sur la matrice et retourne sa version compressee."""
+        matrice = np.asarray(matrice, dtype=np.float32)
+        if self.dimension and self.reduction == "pca":
+            # Echantillon suffisant pour la covariance, meme sur un tres gros catalogue
+            pas = max(1, matrice.shape[0] // 20000)
+            echantillon = matrice[::pas]
+            centre = echantillon - echantillon.mean(axis=0)
+            _, _, vt = np.linalg.svd(centre, full_matrices=False)
+            self.projection = np.ascontiguousarray(vt[:self.dimension].T, dtype=np.float32)
+        reduite = self._reduire(matrice)
+        if self.quantification == "int8":
+            self.echelle = (np.abs(reduite).max(axis=0) / 127.0).astype(np.float32)
+            self.echelle[self.echelle == 0] = 1.0
+        return self.encoder(matrice)
+
+    def encoder(self, matrice: np.ndarray) -> np.ndarray:
+        """Compresse des vecteurs avec les parametres deja ajustes."""
+        reduite = self._reduire(np.asarray(matrice, dtype=np.float32))
+        if self.quantification == "int8":
+            return np.clip(np.rint(reduite / self.echelle), -127, 127).astype(np.int8)
+        if self.quantification == "float16":
+            return reduite.astype(np.float16)
+        return np.ascontiguousarray(reduite, dtype=np.float32)
+
+    def scores(self, compacte: np.ndarray, requetes: np.ndarray, lignes: np.ndarray = None) -> np.ndarray:
+        """
+        Scores approches (N x m) des requetes normalisees (m x d), ou seulement
+        des lignes donnees (len(lignes) x m).
+        """
+        q = np.ascontiguousarray(self._reduire(requetes).T, dtype=np.float32)
+        if self.quantification == "int8":
+            q = q * self.echelle[:, None]
+        n = compacte.shape[0] if lignes is None else len(lignes)
+        resultat = np.empty((n, q.shape[1]), dtype=np.float32)
+        # Produit en float32 (BLAS) : NumPy n'accelere pas les produits int8 / float16.
+        # Conversion par blocs de SCORES_BLOC lignes : jamais de copie float32 de tout l'index
+        for debut in range(0, n, SCORES_BLOC):
+            fin = min(debut + SCORES_BLOC, n)
+            bloc = compacte[debut:fin] if lignes is None else compacte[lignes[debut:fin]]
+            np.matmul(bloc.astype(np.float32, copy=False), q, out=resultat[debut:fin])
+        return resultat
+
+    def sauvegarder(self, dossier: Path, compacte: np.ndarray):
+        np.save(dossier / "compacte.npy", compacte)
+        np.savez(
+            dossier / "compression.npz",
+            signature=np.array(self.signature()),
+            projection=self.projection if self.projection is not None else np.zeros(0, np.float32),
+            echelle=self.echelle if self.echelle is not None else np.zeros(0, np.float32),
+        )
+
+    def charger(self, dossier: Path) -> np.ndarray | None:
+        """Recharge la version compressee si elle a ete faite avec les memes parametres."""
+        if not (dossier / "compression.npz").exists() or not (dossier / "compacte.npy").exists():
+            return None
+        params = np.load(dossier / "compression.npz")
+        if str(params["signature"]) != self.signature():
+            return None
+        self.projection = params["projection"] if params["projection"].size else None
+        self.echelle = params["echelle"] if params["echelle"].size else None
+        return np.load(dossier / "compacte.npy")
+
+
+class FiltresMetadonnees:
+    """
+    Evaluation des clauses "where" de ChromaDB ($eq, $ne, $in, $nin, $and, $or)
+    en masques booleens sur self._documents, a partir de bitmaps par (champ, valeur)
+    construits a la demande (self._bitmaps, a vider quand les documents changent).
+    Partage par les index en memoire et l'index lexical BM25.
+    """
+
+    def _bitmap(self, champ: str) -> dict:
+        """Retourne {valeur: masque booleen} pour un champ de metadonnees."""
+        if champ not in self._bitmaps:
+            par_valeur = {}
+            for i, doc in enumerate(self._documents):
+                par_valeur.setdefault(doc.metadata.get(champ), []).append(i)
+            bitmaps = {}
+            for valeur, indices in par_valeur.items():
+                masque = np.zeros(len(self._documents), dtype=bool)
+                masque[indices] = True
+                bitmaps[valeur] = masque
+            self._bitmaps[champ] = bitmaps
+        return self._bitmaps[champ]
+
+    def _masque_valeurs(self, champ: str, valeurs) -> np.ndarray:
+        bitmaps = self._bitmap(champ)
+        masque = np.zeros(len(self._documents), dtype=bool)
+        for v in valeurs:
+            if v in bitmaps:
+                masque |= bitmaps[v]
+        return masque
+
+    def _masque(self, filtre: dict) -> np.ndarray:
+        """Evalue une clause where ChromaDB en masque booleen sur les documents."""
+        masque = np.ones(len(self._documents), dtype=bool)
+        for cle, valeur in filtre.items():
+            if cle == "$and":
+                for sous in valeur:
+                    masque &= self._masque(sous)
+            elif cle == "$or":
+                union = np.zeros(len(self._documents), dtype=bool)
+                for sous in valeur:
+                    union |= self._masque(sous)
+                masque &= union
+            elif isinstance(valeur, dict):
+                for op, operande in valeur.items():
+                    if op == "$eq":
+                        masque &= self._masque_valeurs(cle, [operande])
+                    elif op == "$ne":
+                        masque &= ~self._masque_valeurs(cle, [operande])
+                    elif op == "$in":
+                        masque &= self._masque_valeurs(cle, operande)
+                    elif op == "$nin":
+                        masque &= ~self._masque_valeurs(cle, operande)
+                    else:
+                        raise ValueError(f"Operateur de filtre non supporte : {op}")
+            else:
+                masque &= self._masque_valeurs(cle, [valeur])
+        return masque
+
+
+class IndexMemoire(FiltresMetadonnees, VectorStore):
+    """
+    Base commune des index en memoire (NumPy, FAISS) : documents, identifiants,
+    filtres de metadonnees et persistance des documents.
+    Le parametre filter accepte la syntaxe "where" de ChromaDB ($eq, $ne, $in,
+    $nin, $and, $or) et s'appuie sur des bitmaps de metadonnees.
+    Les scores retournes sont des distances L2 au carre (plus petit = plus proche),
+    comme pour ChromaDB, afin que les moteurs restent interchangeables.
+    """
+
+    def __init__(self, embedding, documents: list[Document] = None, ids: list[str] = None):
+        self._embedding = embedding
+        self._documents = list(documents or [])
+        self._ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in self._documents]
+        # Bitmaps par (champ, valeur), construits a la demande
+        self._bitmaps = {}
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @staticmethod
+    def _normaliser(matrice: np.ndarray) -> np.ndarray:
+        """Normalise chaque ligne (produit scalaire = similarite cosinus)."""
+        normes = np.linalg.norm(matrice, axis=1, keepdims=True)
+        normes[normes == 0] = 1.0
+        return matrice / normes
+
+    def _ajouter_documents(self, texts: list[str], metadatas: list[dict], ids: list[str]):
+        self._documents.extend(
+            Document(page_content=t, metadata=dict(m or {})) for t, m in zip(texts, metadatas)
+        )
+        self._ids.extend(ids)
+        self._bitmaps = {}
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices des k meilleurs scores, tries par score decroissant."""
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(scores.shape[0])
+        return idx[np.argsort(-scores[idx], kind="stable")]
+
+    def _resultats(self, scores: np.ndarray, k: int, candidats: np.ndarray = None) -> list[tuple]:
+        """Top-k (document, distance L2 au carre) a partir des scores cosinus."""
+        idx = self._top_k(scores, k)
+        lignes = candidats[idx] if candidats is not None else idx
+        return [
+            (self._documents[ligne], max(0.0, float(2.0 - 2.0 * scores[i])))
+            for i, ligne in zip(idx, lignes)
+        ]
+
+    @abc.abstractmethod
+    def similarity_search_with_score_by_vectors(
+        self, vecteurs, k: int = 4, filtres: list = None
+    ) -> list[list[tuple]]:
+        """
+        Recherche groupee : pour chaque vecteur de requete (et son filtre, meme
+        syntaxe que filter, None = aucun), les k plus proches documents sous forme
+        de (document, distance L2 au carre), du plus proche au plus lointain.
+        filtres vaut None ou a la meme longueur que vecteurs ; une liste de
+        resultats par requete, dans l'ordre. Les recherches unitaires passent par ici.
+        """
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k: int = 4, filter: dict = None, **kwargs
+    ) -> list[tuple]:
+        return self.similarity_search_with_score_by_vectors([embedding], k, [filter])[0]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> list[tuple]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Meme convention que Chroma (distance L2 sur vecteurs normalises)
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas: list[dict] = None, ids: list[str] = None, **kwargs):
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_documents(cls, documents: list[Document], embedding, **kwargs):
+        return cls.from_texts(
+            [d.page_content for d in documents],
+            embedding,
+            metadatas=[d.metadata for d in documents],
+            **kwargs,
+        )
+
+    def _ecrire_documents(self, dossier: Path):
+        with open(dossier / "documents.json", "w", encoding="utf-8") as f:
+            json.dump(
+                [
+                    {"id": i, "page_content": d.page_content, "metadata": d.metadata}
+                    for i, d in zip(self._ids, self._documents)
+                ],
+                f,
+                ensure_ascii=False,
+            )
+
+    @staticmethod
+    def _lire_documents(dossier: Path) -> tuple[list[Document], list[str]]:
+        with open(dossier / "documents.json", "r", encoding="utf-8") as f:
+            entrees = json.load(f)
+        documents = [Document(page_content=e["page_content"], metadata=e["metadata"]) for e in entrees]
+        return documents, [e["id"] for e in entrees]
+
+    @staticmethod
+    def _donnees_chroma(chroma: Chroma) -> tuple[list[Document], np.ndarray, list[str]]:
+        """Documents, embeddings deja calcules et ids d'une collection ChromaDB."""
+        data = chroma.get(include=["embeddings", "documents", "metadatas"])
+        documents = [
+            Document(page_content=t or "", metadata=m or {})
+            for t, m in zip(data["documents"], data["metadatas"])
+        ]
+        return documents, np.asarray(data["embeddings"], dtype=np.float32), data["ids"]
+
+
+class NumpyVectorStore(IndexMemoire):
+    """
+    Index vectoriel exact, entierement en memoire.
+    Garde la matrice des embeddings normalises (N x d, float32) et calcule
+    le top-k avec un seul produit matriciel + argpartition.
+    Pour ~3.4k formations en 384 dimensions, la matrice fait ~5 Mo :
+    une recherche exacte coute bien moins d'une milliseconde.
+    Expose la meme interface que Chroma (similarity_search, as_retriever...).
+    Avec VECTOR_QUANTIZATION / VECTOR_DIM, seule la version compressee est
+    parcourue ; la matrice float32 (memmap apres chargement) ne sert qu'a
+    re-classer exactement une liste courte de candidats.
+    """
+
+    def __init__(
+        self,
+        embedding,
+        documents: list[Document] = None,
+        vecteurs=None,
+        ids: list[str] = None,
+        compression: CompressionVecteurs = None,
+    ):
+        super().__init__(embedding, documents, ids)
+        if vecteurs is None or len(self._documents) == 0:
+            self._matrice = np.zeros((0, 0), dtype=np.float32)
+        else:
+            self._matrice = self._normaliser(np.asarray(vecteurs, dtype=np.float32))
+        self._compression = compression if compression is not None else CompressionVecteurs()
+        self._compacte = None
+        # Sous-index (partition) d'un index compresse : lignes de la matrice partagee
+        self._lignes = None
+        if self._compression.active and self._matrice.size:
+            self._compacte = self._compression.ajuster(self._matrice)
+
+    def sous_index(self, lignes) -> "NumpyVectorStore":
+        """
+        Sous-index des lignes donnees (partition), sans re-vectoriser ni re-ajuster :
+        avec compression, la compression deja ajustee (chargee du disque) et les lignes
+        compressees sont reprises, et la matrice float32 (memmap) est partagee, pas copiee.
+        """
+        lignes = np.asarray(lignes, dtype=np.int64)
+        store = type(self)(
+            self._embedding, [self._documents[i] for i in lignes],
+            ids=[self._ids[i] for i in lignes], compression=self._compression,
+        )
+        if self._compacte is None:
+            store._matrice = np.asarray(self._matrice[lignes], dtype=np.float32)
+        else:
+            store._matrice = self._matrice
+            store._lignes = lignes if self._lignes is None else self._lignes[lignes]
+            store._compacte = self._compacte[lignes]
+        return store
+
+    def _matrice_propre(self) -> np.ndarray:
+        """Lignes float32 de cet index seul (copie si la matrice est partagee)."""
+        if self._lignes is None:
+            return self._matrice
+        return np.asarray(self._matrice[self._lignes], dtype=np.float32)
+
+    def add_texts(self, texts, metadatas: list[dict] = None, ids: list[str] = None, **kwargs) -> list[str]:
+        """Vectorise et ajoute des textes a l'index en memoire."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+
+        a_vectoriser = [m.get("texte_embedding") or t for t, m in zip(texts, metadatas)]
+        vecteurs = self._normaliser(np.asarray(self._embedding.embed_documents(a_vectoriser), dtype=np.float32))
+        self._matrice, self._lignes = self._matrice_propre(), None
+        if self._matrice.size == 0:
+            self._matrice = vecteurs
+        else:
+            self._matrice = np.vstack([self._matrice, vecteurs])
+        if self._compression.active:
+            if self._compacte is None and self._compression.ajustee:
+                # Nouvelle partition : compression partagee, deja ajustee sur tout l'index
+                self._compacte = self._compression.encoder(self._matrice)
+            elif self._compacte is None:
+                self._compacte = self._compression.ajuster(self._matrice)
+            else:
+                self._compacte = np.concatenate([self._compacte, self._compression.encoder(vecteurs)])
+        self._ajouter_documents(texts, metadatas, ids)
+        return ids
+
+    def _rechercher_compacte(self, q: np.ndarray, k: int, filtres: list) -> list[list[tuple]]:
+        """
+        Pre-classement sur les vecteurs compresses, puis re-classement exact
+        float32 des max(k * RERANK_FACTEUR, RERANK_MIN) meilleurs candidats.
+        Les requetes sont groupees par filtre : un groupe filtre ne score que
+        les lignes retenues par son bitmap.
+        """
+        taille_liste = max(k * RERANK_FACTEUR, RERANK_MIN)
+        groupes = {}
+        for j, filtre in enumerate(filtres):
+            cle = json.dumps(filtre, sort_keys=True) if filtre else None
+            groupes.setdefault(cle, (filtre, []))[1].append(j)
+
+        resultats = [None] * len(filtres)
+        for cle, (filtre, requetes) in groupes.items():
+            candidats = np.flatnonzero(self._masque(filtre)) if cle is not None else None
+            if candidats is not None and len(candidats) == 0:
+                for j in requetes:
+                    resultats[j] = []
+                continue
+            scores = self._compression.scores(self._compacte, q[requetes], candidats)
+            for colonne, j in enumerate(requetes):
+                idx = self._top_k(scores[:, colonne], taille_liste)
+                liste = np.sort(idx if candidats is None else candidats[idx])
+                rangs = liste if self._lignes is None else self._lignes[liste]
+                exacts = np.asarray(self._matrice[rangs], dtype=np.float32) @ q[j]
+                resultats[j] = self._resultats(exacts, k, liste)
+        return resultats
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k: int = 4, filter: dict = None, **kwargs
+    ) -> list[tuple]:
+        """
+        Recherche exacte a partir d'un vecteur requete.
+        Avec un filtre, seules les lignes retenues par le bitmap sont scorees.
+        """
+        if self._matrice.size == 0:
+            return []
+        if self._compacte is not None:
+            return self.similarity_search_with_score_by_vectors([embedding], k, [filter])[0]
+        q = np.asarray(embedding, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        if filter:
+            candidats = np.flatnonzero(self._masque(filter))
+            return self._resultats(self._matrice[candidats] @ q, k, candidats)
+        return self._resultats(self._matrice @ q, k)
+
+    def similarity_search_with_score_by_vectors(
+        self, vecteurs, k: int = 4, filtres: list = None
+    ) -> list[list[tuple]]:
+        """
+        Recherche multi-requetes : un seul produit matriciel (N x m) pour les
+        m requetes, puis un top-k par colonne avec le filtre propre a chaque requete.
+        """
+        if self._matrice.size == 0 or len(vecteurs) == 0:
+            return [[] for _ in vecteurs]
+        q = self._normaliser(np.asarray(vecteurs, dtype=np.float32))
+        filtres = filtres or [None] * q.shape[0]
+        if self._compacte is not None:
+            return self._rechercher_compacte(q, k, filtres)
+        scores = self._matrice @ q.T
+        masques = {}
+        resultats = []
+        for j, filtre in enumerate(filtres):
+            if not filtre:
+                resultats.append(self._resultats(scores[:, j], k))
+                continue
+            cle = json.dumps(filtre, sort_keys=True)
+            if cle not in masques:
+                masques[cle] = np.flatnonzero(self._masque(filtre))
+            candidats = masques[cle]
+            resultats.append(self._resultats(scores[candidats, j], k, candidats))
+        return resultats
+
+    def sauvegarder(self, persist_dir: str):
+        """Ecrit la matrice (.npy), sa version compressee et les documents (.json) sur disque."""
+        dossier = Path(persist_dir) / NUMPY_SUBDIR
+        dossier.mkdir(parents=True, exist_ok=True)
+        # Fichier remplace (et non reecrit) : un memmap ouvert sur l'ancien reste valide
+        with open(dossier / "vecteurs.npy.tmp", "wb") as f:
+            np.save(f, np.asarray(self._matrice_propre()))
+        os.replace(dossier / "vecteurs.npy.tmp", dossier / "vecteurs.npy")
+        if self._compacte is not None:
+            self._compression.sauvegarder(dossier, self._compacte)
+        self._ecrire_documents(dossier)
+
+    @classmethod
+    def existe(cls, persist_dir: str) -> bool:
+        dossier = Path(persist_dir) / NUMPY_SUBDIR
+        return (dossier / "vecteurs.npy").exists() and (dossier / "documents.json").exists()
+
+    @classmethod
+    def charger(cls, persist_dir: str, embedding):
+        """
+        Recharge un index NumPy sauvegarde avec sauvegarder().
+        Avec compression, la matrice float32 reste sur disque (memmap, partagee
+        entre processus par le cache du systeme) : seule la version compressee
+        est chargee en memoire.
+        """
+        dossier = Path(persist_dir) / NUMPY_SUBDIR
+        documents, ids = cls._lire_documents(dossier)
+        compression = CompressionVecteurs()
+        if not compression.active:
+            return cls(embedding, documents, np.load(dossier / "vecteurs.npy"), ids=ids)
+
+        store = cls(embedding, documents, ids=ids, compression=compression)
+        store._matrice = np.load(dossier / "vecteurs.npy", mmap_mode="r")
+        store._compacte = compression.charger(dossier)
+        if store._compacte is None:
+            # Parametres de compression modifies : recalcul a partir des vecteurs complets
+            store._compacte = compression.ajuster(store._matrice)
+            compression.sauvegarder(dossier, store._compacte)
+        return store
+
+    def memoire_mo(self) -> dict:
+        """Taille en Mo des vecteurs complets et de leur version compressee."""
+        float32 = self._matrice.nbytes if self._lignes is None else len(self._lignes) * self._matrice.shape[1] * 4
+        return {
+            "float32": round(float32 / 1e6, 2),
+            "compresse": round(self._compacte.nbytes / 1e6, 2) if self._compacte is not None else None,
+        }
+
+    @classmethod
+    def depuis_chroma(cls, chroma: Chroma, embedding):
+        """
+        Construit l'index NumPy a partir d'une collection ChromaDB existante,
+        en reprenant les embeddings deja calcules (pas de re-vectorisation).
+        """
+        documents, vecteurs, ids = cls._donnees_chroma(chroma)
+        return cls(embedding, documents, vecteurs, ids=ids)
+
+
+class FaissVectorStore(IndexMemoire):
+    """
+    Index FAISS pour les gros catalogues (MonMaster, BTS, ecoles, plusieurs annees) :
+    - flat  : recherche exacte (produit scalaire), reference de qualite
+    - hnsw  : graphe HNSW, latence quasi constante quand le catalogue grossit
+              (FAISS_HNSW_M, FAISS_EF_CONSTRUCTION, FAISS_EF_SEARCH)
+    - ivfpq : partitions IVF + quantification produit, memoire reduite
+              (FAISS_NLIST, FAISS_NPROBE, FAISS_PQ_M, FAISS_PQ_BITS)
+    Les filtres where sont traduits en selecteur d'IDs (bitmap) passe a la recherche.
+    Un filtre tres selectif (<= FAISS_FILTRE_EXACT candidats) est resolu par
+    recherche exacte sur les seuls candidats : un graphe HNSW filtre a 1 % perd du rappel.
+    """
+
+    def __init__(
+        self,
+        embedding,
+        documents: list[Document] = None,
+        vecteurs=None,
+        ids: list[str] = None,
+        type_index: str = None,
+        index=None,
+    ):
+        if faiss is None:
+            raise ImportError("Le moteur 'faiss' necessite le paquet faiss-cpu (pip install faiss-cpu).")
+        super().__init__(embedding, documents, ids)
+        # Type demande (dossier de sauvegarde) et type effectif (parametres de recherche)
+        self.type_demande = (type_index or FAISS_INDEX_TYPE).lower()
+        if self.type_demande not in FAISS_TYPES:
+            raise ValueError(
+                f"Type d'index FAISS inconnu : '{self.type_demande}'. "
+                f"Utilisez {', '.join(FAISS_TYPES)} dans FAISS_INDEX_TYPE."
+            )
+        self.type_index = self.type_demande
+        self._index = index
+        if index is not None:
+            if isinstance(index, faiss.IndexHNSW):
+                self.type_index = "hnsw"
+            elif isinstance(index, faiss.IndexIVF):
+                self.type_index = "ivfpq"
+            else:
+                self.type_index = "flat"
+        if self._index is None and vecteurs is not None and len(self._documents):
+            self._index = self._construire_index(self._normaliser(np.asarray(vecteurs, dtype=np.float32)))
+
+    def _construire_index(self, vecteurs: np.ndarray):
+        """Cree et remplit l'index FAISS du type demande."""
+        n, d = vecteurs.shape
+        type_index = self.type_index
+        # L'entrainement IVF-PQ demande assez de vecteurs par centroide
+        if type_index == "ivfpq" and n < 4 * 2 ** FAISS_PQ_BITS:
+            print(f"  Trop peu de vecteurs ({n}) pour IVF-PQ, index exact utilise")
+            type_index = "flat"
+
+        if type_index == "hnsw":
+            index = faiss.IndexHNSWFlat(d, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+        elif type_index == "ivfpq":
+            nlist = FAISS_NLIST or int(4 * np.sqrt(n))
+            nlist = max(1, min(nlist, n // 39))
+            # PQ_M doit diviser la dimension
+            pq_m = max(m for m in range(1, min(FAISS_PQ_M, d) + 1) if d % m == 0)
+            quantizer = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, FAISS_PQ_BITS, faiss.METRIC_INNER_PRODUCT)
+            index.train(vecteurs)
+            # Table id -> liste, pour reconstruire les candidats des filtres selectifs
+            index.make_direct_map()
+        else:
+            index = faiss.IndexFlatIP(d)
+
+        index.add(vecteurs)
+        self.type_index = type_index
+        return index
+
+    def sous_index(self, lignes) -> "FaissVectorStore":
+        """
+        Sous-index des lignes donnees (partition), du meme type demande, a partir des
+        vecteurs stockes. Reserve aux index flat / hnsw, dont les vecteurs sont exacts :
+        ceux d'un IVF-PQ ne sont que des approximations (cf. partitionner_vectorstore).
+        """
+        if self.type_index == "ivfpq":
+            raise ValueError("Un index IVF-PQ ne peut pas etre partitionne (vecteurs approches)")
+        lignes = np.asarray(lignes, dtype=np.int64)
+        return type(self)(
+            self._embedding, [self._documents[i] for i in lignes], self._index.reconstruct_batch(lignes),
+            ids=[self._ids[i] for i in lignes], type_index=self.type_demande,
+        )
+
+    def add_texts(self, texts, metadatas: list[dict] = None, ids: list[str] = None, **kwargs) -> list[str]:
+        """Vectorise et ajoute des textes a l'index (construit au premier ajout)."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+
+        a_vectoriser = [m.get("texte_embedding") or t for t, m in zip(texts, metadatas)]
+        vecteurs = self._normaliser(np.asarray(self._embedding.embed_documents(a_vectoriser), dtype=np.float32))
+        if self._index is None:
+            self._index = self._construire_index(vecteurs)
+        else:
+            self._index.add(vecteurs)
+        self._ajouter_documents(texts, metadatas, ids)
+        return ids
+
+    def _parametres(self, selecteur=None):
+        """Parametres de recherche : efSearch / nprobe (lus a chaque requete) + selecteur d'IDs."""
+        options = {"sel": selecteur} if selecteur is not None else {}
+        if self.type_index == "hnsw":
+            return faiss.SearchParametersHNSW(efSearch=FAISS_EF_SEARCH, **options)
+        if self.type_index == "ivfpq":
+            return faiss.SearchParametersIVF(nprobe=FAISS_NPROBE, **options)
+        return faiss.SearchParameters(**options) if options else None
+
+    def _chercher(self, q: np.ndarray, k: int, filtre: dict = None) -> list[list[tuple]]:
+        """Top-k de plusieurs requetes (m x d, normalisees) partageant le meme filtre."""
+        n = len(self._documents)
+        selecteur = None
+        if filtre:
+            masque = self._masque(filtre)
+            candidats = np.flatnonzero(masque)
+            if len(candidats) == 0:
+                return [[] for _ in range(q.shape[0])]
+            if len(candidats) <= FAISS_FILTRE_EXACT:
+                scores = self._index.reconstruct_batch(candidats) @ q.T
+                return [self._resultats(scores[:, j], k, candidats) for j in range(q.shape[0])]
+            bitmap = np.packbits(masque, bitorder="little")
+            selecteur = faiss.IDSelectorBitmap(bitmap)
+
+        distances, lignes = self._index.search(q, min(k, n), params=self._parametres(selecteur))
+        return [
+            [
+                (self._documents[ligne], max(0.0, float(2.0 - 2.0 * score)))
+                for score, ligne in zip(distances[j], lignes[j])
+                if ligne >= 0
+            ]
+            for j in range(q.shape[0])
+        ]
+
+    def similarity_search_with_score_by_vectors(
+        self, vecteurs, k: int = 4, filtres: list = None
+    ) -> list[list[tuple]]:
+        """
+        Recherche multi-requetes : les requetes sont regroupees par filtre
+        et chaque groupe est envoye a FAISS en un seul appel search().
+        """
+        if self._index is None or len(vecteurs) == 0:
+            return [[] for _ in vecteurs]
+        q = self._normaliser(np.asarray(vecteurs, dtype=np.float32))
+        filtres = filtres or [None] * q.shape[0]
+        groupes = {}
+        for j, filtre in enumerate(filtres):
+            cle = json.dumps(filtre, sort_keys=True) if filtre else ""
+            groupes.setdefault(cle, []).append(j)
+
+        resultats = [None] * q.shape[0]
+        for indices in groupes.values():
+            lots = self._chercher(q[indices], k, filtres[indices[0]])
+            for j, lot in zip(indices, lots):
+                resultats[j] = lot
+        return resultats
+
+    @staticmethod
+    def _dossier(persist_dir: str, type_index: str = None) -> Path:
+        return Path(persist_dir) / f"faiss_{(type_index or FAISS_INDEX_TYPE).lower()}"
+
+    def sauvegarder(self, persist_dir: str):
+        """Ecrit l'index FAISS (.faiss) et les documents (.json) sur disque."""
+        dossier = self._dossier(persist_dir, self.type_demande)
+        dossier.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self._index, str(dossier / "index.faiss"))
+        self._ecrire_documents(dossier)
+
+    @classmethod
+    def existe(cls, persist_dir: str) -> bool:
+        dossier = cls._dossier(persist_dir)
+        return (dossier / "index.faiss").exists() and (dossier / "documents.json").exists()
+
+    @classmethod
+    def charger(cls, persist_dir: str, embedding):
+        """Recharge un index FAISS sauvegarde avec sauvegarder()."""
+        dossier = cls._dossier(persist_dir)
+        index = faiss.read_index(str(dossier / "index.faiss"))
+        documents, ids = cls._lire_documents(dossier)
+        return cls(embedding, documents, ids=ids, type_index=FAISS_INDEX_TYPE, index=index)
+
+    @classmethod
+    def depuis_chroma(cls, chroma: Chroma, embedding):
+        """
+        Construit l'index FAISS a partir d'une collection ChromaDB existante,
+        en reprenant les embeddings deja calcules (pas de re-vectorisation).
+        """
+        documents, vecteurs, ids = cls._donnees_chroma(chroma)
+        return cls(embedding, documents, vecteurs, ids=ids)
+
+
+def evaluer_compression(vectorstore: NumpyVectorStore, k: int = 10, nb_requetes: int = 200) -> dict:
+    """
+    Mesure l'impact de la compression : rappel@k de la recherche compressee
+    (pre-classement + re-classement) par rapport a la recherche exacte float32.
+    Les requetes sont des documents de l'index tires au hasard (graine fixe).
+    """
+    if vectorstore._compacte is None or len(vectorstore) == 0:
+        return {}
+    rng = np.random.default_rng(0)
+    lignes = rng.choice(len(vectorstore), size=min(nb_requetes, len(vectorstore)), replace=False)
+    q = np.asarray(vectorstore._matrice[np.sort(lignes)], dtype=np.float32)
+
+    compresses = vectorstore._rechercher_compacte(q, k, [None] * len(q))
+    exacts = np.asarray(vectorstore._matrice, dtype=np.float32) @ q.T
+    rappels = []
+    for j, lot in enumerate(compresses):
+        reference = set(vectorstore._top_k(exacts[:, j], k).tolist())
+        trouves = {id(doc) for doc, _ in lot}
+        rappels.append(sum(id(vectorstore._documents[i]) in trouves for i in reference) / len(reference))
+
+    # Rappel du pre-classement seul (sans re-classement float32)
+    approx = vectorstore._compression.scores(vectorstore._compacte, q)
+    rappels_bruts = [
+        len(set(vectorstore._top_k(approx[:, j], k).tolist()) & set(vectorstore._top_k(exacts[:, j], k).tolist())) / k
+        for j in range(len(q))
+    ]
+    return {
+        "compression": vectorstore._compression.signature(),
+        f"rappel@{k}": round(float(np.mean(rappels)), 4),
+        f"rappel@{k}_sans_reclassement": round(float(np.mean(rappels_bruts)), 4),
+        "memoire_mo": vectorstore.memoire_mo(),
+    }
+
+
+# Moteurs en memoire : classe a utiliser pour chaque valeur de VECTOR_BACKEND
+INDEX_MEMOIRE = {"numpy": NumpyVectorStore, "faiss": FaissVectorStore}
+
+
+def _valeurs_autorisees(filtre: dict) -> dict:
+    """
+    Valeurs permises par champ ({champ: set}) d'une clause where : egalites et $in
+    au premier niveau ou sous $and. Les autres operateurs ($ne, $nin, $or) ne
+    restreignent rien ici (le filtre complet est de toute facon applique ensuite).
+    """
+    permis = {}
+    clauses = []
+    for cle, valeur in (filtre or {}).items():
+        if cle == "$and":
+            for sous in valeur:
+                for champ, valeurs in _valeurs_autorisees(sous).items():
+                    permis[champ] = permis[champ] & valeurs if champ in permis else valeurs
+        elif not cle.startswith("$"):
+            clauses.append((cle, valeur))
+    for champ, valeur in clauses:
+        if isinstance(valeur, dict):
+            if set(valeur) - {"$eq", "$in"}:
+                continue
+            valeurs = set(valeur.get("$in", [])) | ({valeur["$eq"]} if "$eq" in valeur else set())
+        else:
+            valeurs = {valeur}
+        permis[champ] = permis[champ] & valeurs if champ in permis else valeurs
+    return permis
+
+
+def _retirer_champs(filtre: dict, champs: set) -> dict | None:
+    """
+    Filtre sans les egalites / $in (premier niveau ou $and) portant sur champs :
+    clauses deja garanties par le routage vers la partition.
+    """
+    if not filtre:
+        return None
+    reste = {}
+    for cle, valeur in filtre.items():
+        if cle == "$and":
+            sous = [c for c in (_retirer_champs(x, champs) for x in valeur) if c]
+            if len(sous) == 1:
+                reste.update(sous[0])
+            elif sous:
+                reste["$and"] = sous
+        elif cle not in champs or (isinstance(valeur, dict) and set(valeur) - {"$eq", "$in"}):
+            reste[cle] = valeur
+    return reste or None
+
+
+class IndexPartitionne(IndexMemoire):
+    """
+    Index en memoire decoupe physiquement par valeurs de metadonnees
+    (VECTOR_PARTITIONS, par defaut type_diplome) : une sous-base par partition,
+    du meme moteur (NumPy ou FAISS), et un routeur :
+    1. d'apres le filtre where, seules les partitions pouvant contenir un resultat
+       sont interrogees (valeurs de la cle de partition, mais aussi de tout champ
+       filtre, ex. ville_id pour un decoupage par academie_id)
+    2. la partie du filtre garantie par la partition est retiree (une recherche
+       Master sans autre critere = un produit matriciel sur les seuls Masters)
+    3. les top-k des partitions interrogees sont fusionnes par distance
+    Une nouvelle famille de diplomes (BTS, CPGE, Ecole) devient une nouvelle
+    partition, sans ralentir les recherches sur les autres.
+    """
+
+    def __init__(self, embedding, partitions: dict, champs: list[str], classe=NumpyVectorStore):
+        documents, ids = [], []
+        for sous_index in partitions.values():
+            documents.extend(sous_index._documents)
+            ids.extend(sous_index._ids)
+        super().__init__(embedding, documents, ids)
+        self.partitions = partitions
+        self.champs = list(champs)
+        self._classe = classe
+
+    @staticmethod
+    def cle_partition(metadata: dict, champs: list[str]) -> tuple:
+        return tuple(metadata.get(champ) for champ in champs)
+
+    @classmethod
+    def depuis_index(cls, index: IndexMemoire, champs: list[str] = None) -> "IndexPartitionne":
+        """Decoupe un index NumPy / FAISS avec sous_index (memes vecteurs, meme compression)."""
+        champs = champs or VECTOR_PARTITIONS
+        groupes = {}
+        for i, doc in enumerate(index._documents):
+            groupes.setdefault(cls.cle_partition(doc.metadata, champs), []).append(i)
+        partitions = {cle: index.sous_index(lignes) for cle, lignes in groupes.items()}
+        if isinstance(index, FaissVectorStore):
+            classe = partial(FaissVectorStore, type_index=index.type_demande)
+        else:
+            classe = partial(type(index), compression=index._compression)
+        return cls(index.embeddings, partitions, champs, classe)
+
+    def _partitions_pour(self, filtre: dict) -> list[tuple]:
+        """Partitions dont les metadonnees peuvent satisfaire le filtre."""
+        permis = _valeurs_autorisees(filtre)
+        if not permis:
+            return list(self.partitions)
+        retenues = []
+        for cle, sous_index in self.partitions.items():
+            valeurs_cle = dict(zip(self.champs, cle))
+            if all(
+                (valeurs_cle[champ] in valeurs) if champ in valeurs_cle
+                else not valeurs.isdisjoint(sous_index._bitmap(champ))
+                for champ, valeurs in permis.items()
+            ):
+                retenues.append(cle)
+        return retenues
+
+    def similarity_search_with_score_by_vectors(
+        self, vecteurs, k: int = 4, filtres: list = None
+    ) -> list[list[tuple]]:
+        """
+        Chaque requete est routee vers ses partitions ; chaque partition recoit en un
+        appel toutes les requetes qui la concernent, puis fusion des top-k par distance.
+        """
+        if len(vecteurs) == 0:
+            return []
+        filtres = filtres or [None] * len(vecteurs)
+        # Routage et filtre residuel calcules une fois par filtre distinct
+        champs = set(self.champs)
+        par_filtre = {}
+        routes = []
+        for filtre in filtres:
+            cle = json.dumps(filtre, sort_keys=True) if filtre else ""
+            if cle not in par_filtre:
+                par_filtre[cle] = (self._partitions_pour(filtre), _retirer_champs(filtre, champs))
+            routes.append(par_filtre[cle])
+        par_partition = {}
+        for j, (cles, _) in enumerate(routes):
+            for cle in cles:
+                par_partition.setdefault(cle, []).append(j)
+
+        resultats = [[] for _ in vecteurs]
+        for cle, indices in par_partition.items():
+            lots = self.partitions[cle].similarity_search_with_score_by_vectors(
+                [vecteurs[j] for j in indices], k, [routes[j][1] for j in indices],
+            )
+            for j, lot in zip(indices, lots):
+                resultats[j].extend(lot)
+        return [
+            sorted(lot, key=lambda r: r[1])[:k] if len(cles) > 1 else lot
+            for lot, (cles, _) in zip(resultats, routes)
+        ]
+
+    def add_texts(self, texts, metadatas: list[dict] = None, ids: list[str] = None, **kwargs) -> list[str]:
+        """Ajoute chaque texte a sa partition (creee au besoin)."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        groupes = {}
+        for i, m in enumerate(metadatas):
+            groupes.setdefault(self.cle_partition(m or {}, self.champs), []).append(i)
+        for cle, lignes in groupes.items():
+            if cle not in self.partitions:
+                self.partitions[cle] = self._classe(self._embedding)
+            self.partitions[cle].add_texts(
+                [texts[i] for i in lignes], [metadatas[i] for i in lignes], [ids[i] for i in lignes]
+            )
+        self._ajouter_documents(texts, metadatas, ids)
+        return ids
+
+    def tailles(self) -> dict:
+        """Nombre de vecteurs par partition (cle lisible)."""
+        return {"/".join(str(v) for v in cle): len(p) for cle, p in self.partitions.items()}
+
+
+def partitionner_vectorstore(vectorstore: VectorStore, champs: list[str] = None) -> VectorStore:
+    """
+    Decoupe un index NumPy / FAISS en IndexPartitionne (memes vecteurs, pas de
+    re-vectorisation). ChromaDB garde son index unique : le filtre where y est
+    deja applique dans la collection. Un index NumPy compresse garde sa compression
+    et sa matrice float32 sur disque (cf. NumpyVectorStore.sous_index) ; un index
+    FAISS IVF-PQ n'est pas partitionne : ses vecteurs stockes ne sont qu'approches.
+    """
+    champs = VECTOR_PARTITIONS if champs is None else champs
+    if not champs or isinstance(vectorstore, IndexPartitionne) or not isinstance(vectorstore, IndexMemoire):
+        return vectorstore
+    if not len(vectorstore):
+        return vectorstore
+    if isinstance(vectorstore, FaissVectorStore) and vectorstore.type_index == "ivfpq":
+        print("  Index FAISS IVF-PQ : pas de partitionnement (vecteurs stockes approches)")
+        return vectorstore
+    debut = time.perf_counter()
+    index = IndexPartitionne.depuis_index(vectorstore, champs)
+    print(f"  Index partitionne par {', '.join(champs)} : {len(index.partitions)} partitions "
+          f"({time.perf_counter() - debut:.2f}s)")
+    return index
+
+
+def _choisir_backend(backend: str = None) -> str:
+    """Valide le moteur demande (parametre ou variable VECTOR_BACKEND)."""
+    backend = (backend or VECTOR_BACKEND).lower()
+    if backend not in BACKENDS_DISPONIBLES:
+        raise ValueError(
+            f"Moteur vectoriel inconnu : '{backend}'. "
+            f"Utilisez {', '.join(BACKENDS_DISPONIBLES)} dans VECTOR_BACKEND."
+        )
+    if backend == "faiss" and faiss is None:
+        raise ImportError("VECTOR_BACKEND=faiss necessite le paquet faiss-cpu (pip install faiss-cpu).")
+    return backend
+
+
+def textes_a_vectoriser(chunks: list[Document]) -> list[str]:
+    """Texte vectorise de chaque chunk : texte_embedding s'il existe, sinon le contenu."""
+    return [c.metadata.get("texte_embedding") or c.page_content for c in chunks]
+
+
+def _ecrire_chroma(vectorstore: Chroma, chunks: list[Document], vecteurs, ids: list[str], taille_lot: int = 1000):
+    """Upsert de vecteurs deja calcules (le texte stocke reste le texte complet)."""
+    for i in range(0, len(chunks), taille_lot):
+        vectorstore._collection.upsert(
+            ids=ids[i:i + taille_lot],
+            embeddings=[list(v) for v in vecteurs[i:i + taille_lot]],
+            documents=[c.page_content for c in chunks[i:i + taille_lot]],
+            metadatas=[c.metadata for c in chunks[i:i + taille_lot]],
+        )
+
+
 def creer_vectorstore(
     documents: list[Document],
     persist_dir: str = None,
     embeddings=None,
-) -> Chroma:
+    backend: str = None,
+) -> VectorStore:
     """
-    Cree une nouvelle base vectorielle ChromaDB a partir des documents.
+    Cree une nouvelle base vectorielle a partir des documents.
     Les embeddings sont generes et stockes sur disque.
+    backend : "chroma", "numpy" ou "faiss" (par defaut : variable VECTOR_BACKEND).
     """
     persist_dir = persist_dir or CHROMA_PERSIST_DIR
     embeddings = embeddings or get_embeddings()
+    backend = _choisir_backend(backend)
 
-    # Decouper les documents
+    # Decouper les documents (IDs stables : <formation_id>:<numero du chunk>)
     chunks = decouper_documents(documents)
+    ids = ids_chunks(chunks)
+    vecteurs = embeddings.embed_documents(textes_a_vectoriser(chunks))
+
+    if backend in INDEX_MEMOIRE:
+        vectorstore = INDEX_MEMOIRE[backend](embeddings, chunks, vecteurs, ids=ids)
+        vectorstore.sauvegarder(persist_dir)
+        ecrire_manifeste(persist_dir, backend, documents, len(chunks), embeddings)
+        print(f"  Index {backend} cree avec {len(chunks)} chunks dans {persist_dir}")
+        if backend == "numpy" and vectorstore._compacte is not None:
+            print(f"  Compression : {evaluer_compression(vectorstore)}")
+        return vectorstore
+
+    # Repartir d'une collection vide (sinon les formations supprimees resteraient)
+    if Path(persist_dir).exists():
+        Chroma(persist_directory=persist_dir, collection_name=COLLECTION).delete_collection()
+        _supprimer_index_derives(persist_dir)
 
     # Creer la base vectorielle
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
+    vectorstore = Chroma(
         persist_directory=persist_dir,
-        collection_name="orientation_formations",
+        embedding_function=embeddings,
+        collection_name=COLLECTION,
     )
+    _ecrire_chroma(vectorstore, chunks, vecteurs, ids)
+    ecrire_manifeste(persist_dir, "chroma", documents, len(chunks), embeddings)
 
     print(f"  Base vectorielle creee avec {len(chunks)} chunks dans {persist_dir}")
     return vectorstore
@@ -92,13 +1322,17 @@ def creer_vectorstore(
 def charger_vectorstore(
     persist_dir: str = None,
     embeddings=None,
-) -> Chroma:
+    backend: str = None,
+) -> VectorStore:
     """
     Charge une base vectorielle existante depuis le disque.
     Le modele d'embedding doit etre le meme que lors de la creation.
+    Avec les moteurs "numpy" et "faiss", si seul l'index ChromaDB existe, ses
+    embeddings sont repris tels quels pour construire l'index en memoire.
     """
     persist_dir = persist_dir or CHROMA_PERSIST_DIR
     embeddings = embeddings or get_embeddings()
+    backend = _choisir_backend(backend)
 
     if not Path(persist_dir).exists():
         raise FileNotFoundError(
@@ -106,17 +1340,94 @@ def charger_vectorstore(
             "Executez d'abord la creation avec creer_vectorstore()."
         )
 
+    classe = INDEX_MEMOIRE.get(backend)
+    if classe is not None and classe.existe(persist_dir):
+        vectorstore = classe.charger(persist_dir, embeddings)
+        print(f"  Index {backend} charge depuis {persist_dir} ({len(vectorstore)} vecteurs)")
+        return vectorstore
+
     vectorstore = Chroma(
         persist_directory=persist_dir,
         embedding_function=embeddings,
-        collection_name="orientation_formations",
+        collection_name=COLLECTION,
     )
 
+    if classe is not None:
+        print(f"  Conversion de l'index ChromaDB en index {backend}...")
+        vectorstore = classe.depuis_chroma(vectorstore, embeddings)
+        vectorstore.sauvegarder(persist_dir)
+        # Memes vecteurs que la collection : meme manifeste
+        manifeste = lire_manifeste(persist_dir, "chroma")
+        if manifeste is not None:
+            manifeste["backend"] = backend
+            _ecrire_json(_chemin_manifeste(persist_dir, backend), manifeste)
+        print(f"  Index {backend} charge depuis {persist_dir} ({len(vectorstore)} vecteurs)")
+        return vectorstore
+
     print(f"  Base vectorielle chargee depuis {persist_dir}")
     return vectorstore
 
 
-def get_retriever(vectorstore: Chroma, top_k: int = None):
+def rechercher_par_lot(vectorstore: VectorStore, vecteurs: list, ks: list[int], filtres: list) -> list[list[Document]]:
+    """
+    Execute plusieurs recherches vectorielles en une seule passe :
+    - moteur NumPy : un seul produit matriciel pour toutes les requetes
+    - moteur FAISS : un appel search() par filtre distinct
+    - ChromaDB     : un appel query() (plusieurs embeddings) par filtre distinct
+    Retourne une liste de documents par requete, dans l'ordre des vecteurs.
+    """
+    if not vecteurs:
+        return []
+    k_max = max(ks)
+
+    if hasattr(vectorstore, "similarity_search_with_score_by_vectors"):
+        lots = vectorstore.similarity_search_with_score_by_vectors(vecteurs, k=k_max, filtres=filtres)
+        return [[doc for doc, _ in lot[:k]] for lot, k in zip(lots, ks)]
+
+    if isinstance(vectorstore, Chroma):
+        resultats = [None] * len(vecteurs)
+        groupes = {}
+        for i, filtre in enumerate(filtres):
+            cle = json.dumps(filtre, sort_keys=True) if filtre else ""
+            groupes.setdefault(cle, []).append(i)
+        for indices in groupes.values():
+            filtre = filtres[indices[0]]
+            k_groupe = max(ks[i] for i in indices)
+            res = vectorstore._collection.query(
+                query_embeddings=[vecteurs[i] for i in indices],
+                n_results=k_groupe,
+                where=filtre or None,
+                include=["documents", "metadatas"],
+            )
+            for pos, i in enumerate(indices):
+                docs = [
+                    Document(page_content=t or "", metadata=m or {})
+                    for t, m in zip(res["documents"][pos], res["metadatas"][pos])
+                ]
+                resultats[i] = docs[:ks[i]]
+        return resultats
+
+    # Autre moteur : une recherche par vecteur
+    return [
+        vectorstore.similarity_search_by_vector(v, k=k, filter=f)
+        for v, k, f in zip(vecteurs, ks, filtres)
+    ]
+
+
+def documents_indexes(vectorstore: VectorStore) -> list[Document]:
+    """Tous les documents stockes dans l'index (pour pre-calculer leurs caracteristiques)."""
+    if isinstance(vectorstore, IndexMemoire):
+        return list(vectorstore._documents)
+    if isinstance(vectorstore, Chroma):
+        data = vectorstore.get(include=["documents", "metadatas"])
+        return [
+            Document(page_content=t or "", metadata=m or {})
+            for t, m in zip(data["documents"], data["metadatas"])
+        ]
+    return []
+
+
+def get_retriever(vectorstore: VectorStore, top_k: int = None):
     """
     Cree un retriever LangChain a partir de la base vectorielle.
     Le retriever retourne les top_k documents les plus similaires.
@@ -128,7 +1439,189 @@ def get_retriever(vectorstore: Chroma, top_k: int = None):
     )
 
 
-def initialiser_vectorstore(data_dir: str = None, persist_dir: str = None) -> Chroma:
+# Manifeste de l'index : formation_id -> empreinte du document indexe.
+# Permet d'appliquer un delta (ajouts, modifications, suppressions) au lieu de tout
+# re-vectoriser, et de detecter au demarrage un index en retard sur le JSON.
+
+def ids_chunks(chunks: list[Document]) -> list[str]:
+    """IDs stables des chunks : <formation_id>:<n> (UUID si la formation n'a pas d'ID)."""
+    compteurs = {}
+    ids = []
+    for chunk in chunks:
+        fid = chunk.metadata.get("formation_id")
+        if not fid:
+            ids.append(str(uuid.uuid4()))
+            continue
+        n = compteurs.get(fid, 0)
+        compteurs[fid] = n + 1
+        ids.append(f"{fid}:{n}")
+    return ids
+
+
+def empreinte_document(doc: Document) -> str:
+    """sha256 du texte et des metadonnees : change des que le document indexe change."""
+    contenu = json.dumps({"texte": doc.page_content, "meta": doc.metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+def _chemin_manifeste(persist_dir: str, backend: str) -> Path:
+    return Path(persist_dir) / f"manifeste_{backend}.json"
+
+
+def _ecrire_json(chemin: Path, donnees: dict):
+    temporaire = chemin.with_suffix(".tmp")
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(donnees, f, ensure_ascii=False)
+    os.replace(temporaire, chemin)
+
+
+def _parametres_index(embeddings) -> dict:
+    """Parametres qui, s'ils changent, imposent une reconstruction complete."""
+    return {
+        "modele": getattr(embeddings, "model_name", ""),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def ecrire_manifeste(persist_dir: str, backend: str, documents: list[Document], nb_vecteurs: int, embeddings):
+    Path(persist_dir).mkdir(parents=True, exist_ok=True)
+    _ecrire_json(_chemin_manifeste(persist_dir, backend), {
+        "backend": backend,
+        **_parametres_index(embeddings),
+        "nb_vecteurs": nb_vecteurs,
+        "formations": {
+            d.metadata["formation_id"]: empreinte_document(d)
+            for d in documents if d.metadata.get("formation_id")
+        },
+    })
+
+
+def lire_manifeste(persist_dir: str, backend: str) -> dict | None:
+    chemin = _chemin_manifeste(persist_dir, backend)
+    if not chemin.exists():
+        return None
+    with open(chemin, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def comparer_manifeste(manifeste: dict, documents: list[Document]) -> dict:
+    """formation_id ajoutees, modifiees et supprimees depuis l'ecriture du manifeste."""
+    anciennes = manifeste.get("formations", {})
+    nouvelles = {
+        d.metadata["formation_id"]: empreinte_document(d)
+        for d in documents if d.metadata.get("formation_id")
+    }
+    return {
+        "ajoutees": [fid for fid in nouvelles if fid not in anciennes],
+        "modifiees": [fid for fid, h in nouvelles.items() if fid in anciennes and anciennes[fid] != h],
+        "supprimees": [fid for fid in anciennes if fid not in nouvelles],
+    }
+
+
+def nb_vecteurs(vectorstore: VectorStore) -> int:
+    if isinstance(vectorstore, IndexMemoire):
+        return len(vectorstore)
+    if isinstance(vectorstore, Chroma):
+        return vectorstore._collection.count()
+    return -1
+
+
+def _supprimer_index_derives(persist_dir: str):
+    """Index NumPy / FAISS convertis depuis la collection : a refaire apres une mise a jour."""
+    for backend in INDEX_MEMOIRE:
+        _chemin_manifeste(persist_dir, backend).unlink(missing_ok=True)
+    for dossier in [Path(persist_dir) / NUMPY_SUBDIR, *Path(persist_dir).glob("faiss_*")]:
+        if dossier.is_dir():
+            shutil.rmtree(dossier)
+
+
+def verifier_index(vectorstore: VectorStore, documents: list[Document], persist_dir: str = None, backend: str = None) -> dict:
+    """
+    Compare l'index charge au JSON courant, sans rien vectoriser :
+    manifeste present, memes parametres, meme nombre de vecteurs, aucun delta.
+    """
+    persist_dir = persist_dir or CHROMA_PERSIST_DIR
+    backend = _choisir_backend(backend)
+    manifeste = lire_manifeste(persist_dir, backend)
+    etat = {"manifeste": manifeste is not None, "nb_vecteurs": nb_vecteurs(vectorstore)}
+    if manifeste is None:
+        etat["a_jour"] = False
+        return etat
+    delta = comparer_manifeste(manifeste, documents)
+    etat.update({cle: len(fids) for cle, fids in delta.items()})
+    etat["nb_vecteurs_manifeste"] = manifeste.get("nb_vecteurs")
+    etat["a_jour"] = (
+        not any(delta.values())
+        and etat["nb_vecteurs"] == etat["nb_vecteurs_manifeste"]
+        and all(manifeste.get(cle) == valeur for cle, valeur in _parametres_index(vectorstore.embeddings).items())
+    )
+    return etat
+
+
+def synchroniser_vectorstore(
+    documents: list[Document],
+    persist_dir: str = None,
+    embeddings=None,
+    backend: str = None,
+) -> VectorStore:
+    """
+    Met l'index a jour a partir des documents courants :
+    - ChromaDB : supprime les chunks des formations modifiees ou retirees,
+      ajoute ceux des formations nouvelles ou modifiees (IDs stables) ;
+    - NumPy / FAISS : index reconstruit, seuls les textes nouveaux ou modifies
+      passent par le modele (cache disque des embeddings).
+    Sans manifeste compatible (ancien index, autre modele, autre decoupage),
+    ou si la collection ne correspond plus au manifeste : reconstruction complete.
+    """
+    persist_dir = persist_dir or CHROMA_PERSIST_DIR
+    embeddings = embeddings or get_embeddings()
+    backend = _choisir_backend(backend)
+
+    manifeste = lire_manifeste(persist_dir, backend)
+    compatible = manifeste is not None and all(
+        manifeste.get(cle) == valeur for cle, valeur in _parametres_index(embeddings).items()
+    )
+    if not compatible:
+        print("  Pas de manifeste compatible : reconstruction complete")
+        return creer_vectorstore(documents, persist_dir, embeddings, backend)
+
+    delta = comparer_manifeste(manifeste, documents)
+    print(f"  Mise a jour incrementale : {len(delta['ajoutees'])} ajoutees, "
+          f"{len(delta['modifiees'])} modifiees, {len(delta['supprimees'])} supprimees")
+
+    if backend in INDEX_MEMOIRE:
+        if not any(delta.values()) and INDEX_MEMOIRE[backend].existe(persist_dir):
+            return charger_vectorstore(persist_dir, embeddings, backend)
+        return creer_vectorstore(documents, persist_dir, embeddings, backend)
+
+    vectorstore = Chroma(
+        persist_directory=persist_dir,
+        embedding_function=embeddings,
+        collection_name=COLLECTION,
+    )
+    if vectorstore._collection.count() != manifeste.get("nb_vecteurs"):
+        print("  Collection incoherente avec le manifeste : reconstruction complete")
+        return creer_vectorstore(documents, persist_dir, embeddings, backend)
+    if not any(delta.values()):
+        return vectorstore
+
+    a_retirer = delta["modifiees"] + delta["supprimees"]
+    for i in range(0, len(a_retirer), 500):
+        vectorstore._collection.delete(where={"formation_id": {"$in": a_retirer[i:i + 500]}})
+
+    a_ecrire = set(delta["ajoutees"]) | set(delta["modifiees"])
+    chunks = decouper_documents([d for d in documents if d.metadata.get("formation_id") in a_ecrire])
+    if chunks:
+        vecteurs = embeddings.embed_documents(textes_a_vectoriser(chunks))
+        _ecrire_chroma(vectorstore, chunks, vecteurs, ids_chunks(chunks))
+
+    ecrire_manifeste(persist_dir, "chroma", documents, vectorstore._collection.count(), embeddings)
+    _supprimer_index_derives(persist_dir)
+    return vectorstore
+
+
+def initialiser_vectorstore(data_dir: str = None, persist_dir: str = None) -> VectorStore:
     """
     Charge la base vectorielle si elle existe,
     sinon la cree a partir des donnees.